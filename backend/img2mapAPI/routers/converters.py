@@ -1,65 +1,188 @@
 """ This module contains the API router with endpoints for file conversion. 
 
 The module contains the following endpoints:
-    - Convert a .pdf file to a .png file
+    - Convert a .pdf file, or a region of a page of it, to a .png file
+    - Upload a .pdf file once and get its pages and page thumbnails
+    - Convert a range of pages of a .pdf file to .png files, streamed as a .zip file or as handles
     - Convert an image to a .png file
     - Crop a .png file
 """
 
-from fastapi import APIRouter, BackgroundTasks, File, UploadFile, HTTPException, Query
-from fastapi.responses import FileResponse
+import io
+import os
+import json
+from typing import List, Union
+from fastapi import APIRouter, BackgroundTasks, File, UploadFile, HTTPException, Query, Header, Response
+from fastapi.responses import FileResponse, StreamingResponse
 #internal imports
-from ..utils.core.ImageHelper import pdf2png, isImageSupported
+from ..utils.core.ImageHelper import pdf2png, renderPdfPage, renderPdfPages, isImageSupported, defaultDpi, maxPdfPixels, defaultCompressLevel
 from ..utils.core.ImageHelper import image2png as imageToPng
 from ..utils.core.ImageHelper import cropPng as cropApng
-from ..utils.core.FileHelper import removeFile as delFile
+from ..utils.core.FileHelper import removeFile as delFile, zipStream
+from ..utils.core.taskExecutor import TaskExecutor
+from ..utils.core.pdfCache import PdfCache
+from ..utils.core.httpCache import makeETag, notModified, cacheHeaders
 
 #API router for file conversion
 router = APIRouter()
 
+#the maximum number of pixels of a page rendered from a .pdf file
+_PdfMaxPixels = int(os.environ.get('PDF_MAX_PIXELS', maxPdfPixels))
+
+#the zlib compression level of converted and cropped .png images, 0 to 9
+_PngCompressLevel = int(os.environ.get('PNG_COMPRESS_LEVEL', defaultCompressLevel))
+
+#the uploaded .pdf files, with their pages and page thumbnails, by content hash
+_PdfCache = PdfCache(
+    os.environ.get('PDF_CACHE_DIR', os.path.join('.', 'temp', 'pdfcache')),
+    maxBytes=int(os.environ.get('PDF_CACHE_SIZE_MB', 512)) * 1024 * 1024,
+    thumbnailSize=int(os.environ.get('PDF_THUMBNAIL_SIZE', 256)),
+    threads=int(os.environ.get('PDF_THUMBNAIL_THREADS', 2))
+)
+
+#the number of pages of a batch rendered at a time, defaults to the number of convert workers
+_PdfBatchInFlight = int(os.environ.get('PDF_BATCH_IN_FLIGHT', TaskExecutor.getInstance().config["convert"][1]))
+
 @router.post('/pdf2png')
-async def pdfPage2png(background_tasks: BackgroundTasks, page_number: int = 1, file: UploadFile = File(...)):
-    """**Converts a .pdf file to a .png file of given page _default=1_.**"""
+async def pdfPage2png(
+    background_tasks: BackgroundTasks,
+    page_number: int = 1,
+    file: UploadFile = File(None),
+    dpi: int = Query(defaultDpi, description="Resolution to render the page at in dots per inch"),
+    size: int = Query(None, description="Long edge of the image in pixels, replaces dpi when given"),
+    handle: str = Query(None, description="Handle of a .pdf file uploaded to /pdfInfo, replaces the file"),
+    p1x: float = Query(None, description="Left side of the region to render, in points (1/72 inch) from the left of the page"),
+    p1y: float = Query(None, description="Top side of the region to render, in points from the top of the page"),
+    p2x: float = Query(None, description="Right side of the region to render, in points from the left of the page"),
+    p2y: float = Query(None, description="Bottom side of the region to render, in points from the top of the page")
+):
+    """
+    **Converts a .pdf file to a .png file of given page _default=1_.**
+    Only the given page is rendered, at the given dpi or size. The resolution is lowered when the image would have more pixels than the server allows.
+    A .pdf file uploaded to /pdfInfo is converted by its handle, without uploading it again.
+    With p1x, p1y, p2x and p2y only that region of the page is rendered, in page coordinates as shown, so the size of a page is in the pageSizes of /pdfInfo.
+    The dpi, size and pixel limit then apply to the region, so a small region of a large page is rendered at full resolution.
+    """
     #failsafe checks
-    if file.content_type != 'application/pdf':
+    if handle is None and file is None:
+        raise HTTPException(status_code=400, detail='A .pdf file or the handle of an uploaded .pdf file is required')
+    if handle is None and file.content_type != 'application/pdf':
         raise HTTPException(status_code=415, detail='File must be a .pdf file')
     if page_number < 0:
         raise HTTPException(status_code=411, detail='Body content must be at least 1 page')
     if page_number > 100:
         raise HTTPException(status_code=413, detail='Page number must be less than 100')
+    if dpi < 1 or dpi > 2400:
+        raise HTTPException(status_code=400, detail='DPI must be between 1 and 2400')
+    if size is not None and size < 1:
+        raise HTTPException(status_code=400, detail='Size must be at least 1 pixel')
+    region = (p1x, p1y, p2x, p2y)
+    box = None
+    if any(value is not None for value in region):
+        if any(value is None for value in region):
+            raise HTTPException(status_code=400, detail='A region needs all of p1x, p1y, p2x and p2y')
+        if p2x <= p1x or p2y <= p1y:
+            raise HTTPException(status_code=400, detail='The region must have p2x larger than p1x and p2y larger than p1y')
+        box = region
     
+    if handle is not None:
+        #the pages of an uploaded file were read when it was uploaded
+        inventory = _PdfCache.inventory(handle)
+        if inventory is None:
+            raise HTTPException(status_code=404, detail='The .pdf file was not found, upload it again')
+        if page_number < 1 or page_number > inventory["pages"]:
+            raise HTTPException(status_code=400, detail=f'The .pdf file has no page {page_number}, it has {inventory["pages"]} pages')
+        #the file is kept in the cache while the page is rendered from it
+        pdfPath = _PdfCache.acquire(handle)
+        if pdfPath is None:
+            raise HTTPException(status_code=404, detail='The .pdf file was not found, upload it again')
+
     try:
-        (NewImageFile, image_name) = await pdf2png(file, page_number)
+        if handle is not None:
+            NewImageFile = await renderPdfPage(pdfPath, page_number, dpi, size, _PdfMaxPixels, tuple(inventory["pageSizes"][page_number - 1]), box)
+            image_name = inventory["name"][:-4] + 'p' + str(page_number) + ('cropped' if box is not None else '') + '.png'
+        else:
+            (NewImageFile, image_name) = await pdf2png(file, page_number, dpi, size, _PdfMaxPixels, box)
         background_tasks.add_task(delFile, NewImageFile) #create a background task to remove the temporary file
         return FileResponse(NewImageFile, media_type='image/png', filename=image_name, background=background_tasks)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if handle is not None:
+            _PdfCache.release(handle)
+
+@router.post('/pdfInfo')
+async def pdfInfo(file: UploadFile = File(...)):
+    """
+    **Uploads a .pdf file and returns its handle, the number of pages and the size of each page in points (1/72 inch)**
+    The thumbnail of each page is served by /pdf/{handle}/thumbnail/{page}, and the handle replaces the file in /pdf2png.
+    A file is only read and rendered the first time it is uploaded.
+    """
+    if file.content_type != 'application/pdf':
+        raise HTTPException(status_code=415, detail='File must be a .pdf file')
+    try:
+        return await _PdfCache.add(file)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get('/pdf/{handle}')
+async def getPdfInfo(handle: str):
+    """**Returns the handle, the number of pages and the size of each page of an uploaded .pdf file**"""
+    inventory = _PdfCache.inventory(handle)
+    if inventory is None:
+        raise HTTPException(status_code=404, detail='The .pdf file was not found, upload it again')
+    return inventory
+
+@router.get('/pdf/{handle}/thumbnail/{page}')
+async def getPdfThumbnail(handle: str, page: int, if_none_match: Union[str, None] = Header(default=None)):
+    """
+    **Returns the thumbnail of a page of an uploaded .pdf file**
+    The handle is the content hash of the file, so the thumbnail can be cached for a long time.
+    """
+    path = _PdfCache.thumbnailPath(handle, page)
+    if path is None:
+        raise HTTPException(status_code=404, detail='The thumbnail was not found')
+    headers = cacheHeaders(makeETag(handle, page), immutable=True)
+    if notModified(headers["ETag"], None, if_none_match, None):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type='image/png', headers=headers)
 
     
 @router.post('/image2png')
-async def image2png(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
-    """**Converts an image file to a .png file.**"""
+async def image2png(
+    file: UploadFile = File(...),
+    size: int = Query(None, description="Long edge of the image in pixels, larger images are made smaller"),
+    compress_level: int = Query(None, description="Compression level of the .png file, 0 (fastest) to 9 (smallest), defaults to the server setting")
+):
+    """
+    **Converts an image file to a .png file.**
+    The image is converted in memory. A JPEG image made smaller with size is decoded at a reduced scale.
+    """
     if file.content_type == 'image/png':
         raise HTTPException(status_code=400, detail='File is already a .png file')
     if isImageSupported(file) == False:
         raise HTTPException(status_code=415, detail=f'File is a {file.content_type} file, which is not supported')
+    if size is not None and size < 1:
+        raise HTTPException(status_code=400, detail='Size must be at least 1 pixel')
+    if compress_level is not None and (compress_level < 0 or compress_level > 9):
+        raise HTTPException(status_code=400, detail='Compress level must be between 0 and 9')
     
     try:
-        (NewImageFile, image_name) = await imageToPng(file)
-        background_tasks.add_task(delFile, NewImageFile) #create a background task to remove the temporary file
-        return FileResponse(NewImageFile, media_type='image/png', filename=image_name, background=background_tasks)
+        (pngBytes, image_name) = await imageToPng(file, _PngCompressLevel if compress_level is None else compress_level, size)
+        headers = {"Content-Disposition": f'attachment; filename="{image_name}"'}
+        return StreamingResponse(io.BytesIO(pngBytes), media_type='image/png', headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post('/cropPng')
 async def cropPng(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...), 
     p1x: int = Query(0, description="X coordinate of the first point"), 
     p1y: int = Query(0, description="Y coordinate of the first point"), 
     p2x: int = Query(16, description="X coordinate of the second point"), 
-    p2y: int = Query(16, description="Y coordinate of the second point")
+    p2y: int = Query(16, description="Y coordinate of the second point"),
+    compress_level: int = Query(None, description="Compression level of the .png file, 0 (fastest) to 9 (smallest), defaults to the server setting")
 ):
     """
     **Crops a PNG**
@@ -69,10 +192,148 @@ async def cropPng(
     #failsafe checks
     if file.content_type != 'image/png':
         raise HTTPException(status_code=415, detail='File is not a .png file')
+    if compress_level is not None and (compress_level < 0 or compress_level > 9):
+        raise HTTPException(status_code=400, detail='Compress level must be between 0 and 9')
     
     try:
-        (NewImageFile, image_name) = await cropApng(file, p1x, p1y, p2x, p2y)
-        background_tasks.add_task(delFile, NewImageFile)
-        return FileResponse(NewImageFile, media_type='image/png', filename=image_name, background=background_tasks)
+        (pngBytes, image_name) = await cropApng(file, p1x, p1y, p2x, p2y, _PngCompressLevel if compress_level is None else compress_level)
+        headers = {"Content-Disposition": f'attachment; filename="{image_name}"'}
+        return StreamingResponse(io.BytesIO(pngBytes), media_type='image/png', headers=headers)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post('/pdf2pngBatch')
+async def pdfPages2png(
+    file: UploadFile = File(None),
+    handle: str = Query(None, description="Handle of a .pdf file uploaded to /pdfInfo, replaces the file"),
+    first_page: int = Query(1, description="First page to convert"),
+    last_page: int = Query(None, description="Last page to convert, defaults to the last page of the file"),
+    dpi: int = Query(defaultDpi, description="Resolution to render the pages at in dots per inch"),
+    size: int = Query(None, description="Long edge of each image in pixels, replaces dpi when given"),
+    output: str = Query("zip", description="zip for a .zip file of the images, handles for a line of JSON with the URL of each image")
+):
+    """
+    **Converts a range of pages of a .pdf file to .png files**
+    The file is uploaded once, or given by the handle of /pdfInfo, and the pages are rendered at the same time.
+    The images are streamed as each page is done, so the pages in the response are not in page order:
+    - output=zip: a .zip file with an image per page, named by the page number
+    - output=handles: a line of JSON per page with the page and the URL of the image kept on the server, see /pdf/{handle}/page/{page}
+    """
+    #failsafe checks
+    if handle is None and file is None:
+        raise HTTPException(status_code=400, detail='A .pdf file or the handle of an uploaded .pdf file is required')
+    if handle is None and file.content_type != 'application/pdf':
+        raise HTTPException(status_code=415, detail='File must be a .pdf file')
+    if output not in ("zip", "handles"):
+        raise HTTPException(status_code=400, detail='Output must be zip or handles')
+    if dpi < 1 or dpi > 2400:
+        raise HTTPException(status_code=400, detail='DPI must be between 1 and 2400')
+    if size is not None and size < 1:
+        raise HTTPException(status_code=400, detail='Size must be at least 1 pixel')
+
+    if handle is None:
+        try:
+            inventory = await _PdfCache.add(file)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        handle = inventory["handle"]
+    else:
+        inventory = _PdfCache.inventory(handle)
+    pdfPath = _PdfCache.pdfPath(handle)
+    if inventory is None or pdfPath is None:
+        raise HTTPException(status_code=404, detail='The .pdf file was not found, upload it again')
+    if last_page is None:
+        last_page = inventory["pages"]
+    if first_page < 1 or last_page > inventory["pages"] or first_page > last_page:
+        raise HTTPException(status_code=400, detail=f'The pages must be a range within the {inventory["pages"]} pages of the .pdf file')
+
+    pages = list(range(first_page, last_page + 1))
+    name = inventory["name"][:-4]
+
+    async def renderPages(pages: List[int]):
+        #the file is kept in the cache while the pages are rendered from it
+        pdfPath = _PdfCache.acquire(handle)
+        if pdfPath is None:
+            raise Exception("The .pdf file was removed from the server")
+        try:
+            async for (page, path) in renderPdfPages(pdfPath, pages, dpi, size, _PdfMaxPixels, inventory["pageSizes"], _PdfBatchInFlight):
+                yield (page, path)
+        finally:
+            _PdfCache.release(handle)
+
+    if output == "zip":
+        async def images():
+            async for (page, path) in renderPages(pages):
+                yield (path, name + 'p' + str(page) + '.png')
+        headers = {"Content-Disposition": f'attachment; filename="{name}p{first_page}-{last_page}.zip"'}
+        return StreamingResponse(zipStream(images()), media_type='application/zip', headers=headers)
+
+    options = renderOptions(dpi, size)
+    query = f"size={size}" if size is not None else f"dpi={dpi}"
+    async def handles():
+        #pages kept from an earlier batch with the same options are not rendered again
+        missing = [page for page in pages if _PdfCache.renderPath(handle, page, options) is None]
+        for page in pages:
+            if page not in missing:
+                yield json.dumps({"page": page, "url": f"/converter/pdf/{handle}/page/{page}?{query}"}) + "\n"
+        if missing:
+            async for (page, path) in renderPages(missing):
+                await _PdfCache.storeRender(handle, page, options, path)
+                yield json.dumps({"page": page, "url": f"/converter/pdf/{handle}/page/{page}?{query}"}) + "\n"
+    return StreamingResponse(handles(), media_type='application/x-ndjson')
+
+@router.get('/pdf/{handle}/page/{page}')
+async def getPdfPage(
+    handle: str,
+    page: int,
+    dpi: int = Query(defaultDpi, description="Resolution to render the page at in dots per inch"),
+    size: int = Query(None, description="Long edge of the image in pixels, replaces dpi when given"),
+    if_none_match: Union[str, None] = Header(default=None)
+):
+    """
+    **Returns a page of an uploaded .pdf file as a .png file**
+    The page is kept on the server with the dpi or size it was rendered with, it is rendered when it is not kept yet.
+    """
+    inventory = _PdfCache.inventory(handle)
+    if inventory is None:
+        raise HTTPException(status_code=404, detail='The .pdf file was not found, upload it again')
+    if page < 1 or page > inventory["pages"]:
+        raise HTTPException(status_code=404, detail=f'The .pdf file has no page {page}, it has {inventory["pages"]} pages')
+    if dpi < 1 or dpi > 2400:
+        raise HTTPException(status_code=400, detail='DPI must be between 1 and 2400')
+    if size is not None and size < 1:
+        raise HTTPException(status_code=400, detail='Size must be at least 1 pixel')
+    options = renderOptions(dpi, size)
+    headers = cacheHeaders(makeETag(handle, page, options), immutable=True)
+    if notModified(headers["ETag"], None, if_none_match, None):
+        return Response(status_code=304, headers=headers)
+    try:
+        path = _PdfCache.renderPath(handle, page, options)
+        if path is None:
+            #the file is kept in the cache while the page is rendered from it
+            pdfPath = _PdfCache.acquire(handle)
+            if pdfPath is None:
+                raise Exception("The .pdf file was removed from the server")
+            try:
+                image = await renderPdfPage(pdfPath, page, dpi, size, _PdfMaxPixels, tuple(inventory["pageSizes"][page - 1]))
+            finally:
+                _PdfCache.release(handle)
+            path = await _PdfCache.storeRender(handle, page, options, image)
+        if path is None:
+            raise Exception("The page could not be kept")
+        return FileResponse(path, media_type='image/png', filename=inventory["name"][:-4] + 'p' + str(page) + '.png', headers=headers)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+def renderOptions(dpi: int, size: Union[int, None]) -> str:
+    """Gets the name of the options a page is rendered with, used to keep the rendered page in the .pdf cache
+
+    Args:
+        dpi (int): The resolution in dots per inch
+        size (Union[int, None]): The long edge in pixels, replaces dpi when given
+
+    Returns:
+        str: The options as letters and digits
+    """
+
+    return f"s{size}" if size is not None else f"d{dpi}"
@@ -11,24 +11,34 @@ The module contains the following endpoints:
     - Delete a point from a project
     - Get all points of a project
     - Get a point in a project by id
+    - Fit the transform of a project to its points and get the residuals
     - Upload an image to a project
     - Get the image of a project by id
     - Georeference the image of a project by id
     - Get the georeferenced image of a project by id
+    - Submit a georeferencing job for the image of a project by id
+    - Get the status and the result of a georeferencing job
     - Get the bounding coordinates of the image of a project by id
+    - Preview the placement of the image of a project from its points, with a world file and GeoJSON footprint
 """
 
 import os
 import io
-from typing import List
-from fastapi import APIRouter, File, UploadFile, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse, Response, StreamingResponse
+from typing import List, Union
+from fastapi import APIRouter, File, UploadFile, HTTPException, BackgroundTasks, Header
+from fastapi.responses import FileResponse, Response, StreamingResponse, JSONResponse
 #internal imports:
 from ..utils.models.point import Point
 from ..utils.models.project import Project
 from ..utils.projectHandler import ProjectHandler
-from ..utils.core.georefHelper import generateTile
-from ..utils.core.FileHelper import removeFile
+from ..utils.core.tileCache import TileCache
+from ..utils.core.tilePyramid import TilePyramidBuilder
+from ..utils.core.datasetPool import DatasetPool
+from ..utils.core.taskExecutor import TaskExecutor
+from ..utils.core.georefJobs import GeorefJobQueue
+from ..utils.core.georefCache import GeorefCache
+from ..utils.core.georefHelper import defaultOutputOptions
+from ..utils.core.httpCache import makeETag, notModified, cacheHeaders, toHttpDate
 from ..utils.storage.files.fileStorage import FileStorage
 from ..utils.storage.files.localFileStorage import LocalFileStorage
 from ..utils.storage.files.s3FileStorage import S3FileStorage
@@ -64,7 +74,7 @@ if 'APP_FILE_STORAGE_TYPE' in os.environ:
     # Decide which file storage to use based on environment variable
     APP_FILE_STORAGE_TYPE = os.environ['APP_FILE_STORAGE_TYPE']
     if APP_FILE_STORAGE_TYPE == 'aws':
-        _Filestorage: FileStorage = S3FileStorage(os.environ['AWS_BUCKET_NAME'], os.environ['AWS_REGION_NAME'], os.environ['AWS_ACCESS_KEY_ID'], os.environ['AWS_SECRET_ACCESS_KEY'])
+        _Filestorage: FileStorage = S3FileStorage(os.environ['AWS_BUCKET_NAME'], os.environ['AWS_REGION_NAME'], os.environ['AWS_ACCESS_KEY_ID'], os.environ['AWS_SECRET_ACCESS_KEY'], os.environ.get('AWS_ENDPOINT_URL'))
         print("Using AWS S3 file storage")
     elif APP_FILE_STORAGE_TYPE == 'bucketeer-s3':
         _Filestorage: FileStorage = S3FileStorage(os.environ['BUCKETEER_BUCKET_NAME'],os.environ['BUCKETEER_AWS_REGION'],os.environ['BUCKETEER_AWS_ACCESS_KEY_ID'],os.environ['BUCKETEER_AWS_SECRET_ACCESS_KEY'])
@@ -78,7 +88,53 @@ if 'APP_FILE_STORAGE_TYPE' in os.environ:
 else:
     print("Defaulting to using local file storage")
 
-_projectHandler = ProjectHandler(_Filestorage, _StorageHandler)
+# Size of the cache GDAL keeps of the byte ranges it read of each file opened from file storage, in megabytes
+FileStorage.blockCacheSize = int(os.environ.get('FILE_BLOCK_CACHE_SIZE_MB', 32)) * 1024 * 1024
+
+# In-memory cache for rendered map tiles, size in megabytes
+_TileCache = TileCache(int(os.environ.get('TILE_CACHE_SIZE_MB', 64)) * 1024 * 1024)
+
+# Optional pre-rendering of the tile pyramid after georeferencing
+_TilePyramid = TilePyramidBuilder(
+    enabled=os.environ.get('TILE_PYRAMID_ENABLED', 'false').lower() == 'true',
+    workers=int(os.environ.get('TILE_PYRAMID_WORKERS', 2))
+)
+
+# Open georeferenced datasets kept between tile requests
+_DatasetPool = DatasetPool(
+    maxOpen=int(os.environ.get('DATASET_POOL_MAX_OPEN', 8)),
+    idleTimeout=float(os.environ.get('DATASET_POOL_IDLE_SECONDS', 300)),
+    maxHandles=int(os.environ.get('DATASET_POOL_HANDLES', 4))
+)
+
+# Execution layer for blocking work, configured with EXECUTOR_<CATEGORY>_MODE and EXECUTOR_<CATEGORY>_WORKERS
+_Executor = TaskExecutor.getInstance()
+
+# Options for the georeferenced output file, defaults to a DEFLATE compressed Cloud-Optimized GeoTIFF
+_GeorefOptions = {
+    "format": os.environ.get('GEOREF_OUTPUT_FORMAT', defaultOutputOptions["format"]),
+    "blocksize": int(os.environ.get('GEOREF_BLOCKSIZE', defaultOutputOptions["blocksize"])),
+    "compress": os.environ.get('GEOREF_COMPRESS', defaultOutputOptions["compress"]),
+    "quality": int(os.environ.get('GEOREF_JPEG_QUALITY', defaultOutputOptions["quality"])),
+    "webMercator": os.environ.get('GEOREF_WEB_MERCATOR', 'false').lower() == 'true',
+    "measureMemory": os.environ.get('GEOREF_MEASURE_MEMORY', 'false').lower() == 'true',
+    "memoryLimitMB": int(os.environ.get('GEOREF_MEMORY_LIMIT_MB', defaultOutputOptions["memoryLimitMB"])),
+    "threads": int(os.environ.get('GEOREF_THREADS', defaultOutputOptions["threads"])),
+    "lazy": os.environ.get('GEOREF_LAZY', 'false').lower() == 'true',
+    "proxy": os.environ.get('GEOREF_PROXY', 'false').lower() == 'true',
+    "proxySize": int(os.environ.get('GEOREF_PROXY_SIZE', defaultOutputOptions["proxySize"])),
+}
+
+# Queue for asynchronous georeferencing jobs, with the number of jobs running at once and the number of finished jobs kept
+_GeorefJobs = GeorefJobQueue(
+    workers=int(os.environ.get('GEOREF_JOB_WORKERS', 2)),
+    maxHistory=int(os.environ.get('GEOREF_JOB_HISTORY', 1000))
+)
+
+# Georeferenced files shared by projects georeferenced with the same image, points and crs, with the total size of the unused files kept
+_GeorefCache = GeorefCache(_Filestorage, _StorageHandler, int(os.environ.get('GEOREF_CACHE_SIZE_MB', 1024)) * 1024 * 1024)
+
+_projectHandler = ProjectHandler(_Filestorage, _StorageHandler, _TileCache, _TilePyramid, _DatasetPool, _Executor, _GeorefOptions, _GeorefJobs, _GeorefCache)
 
 #simple exeption logger
 def log_exception(e: Exception, message: str = None, where: str = None):
@@ -198,6 +254,22 @@ async def getPoint(projectId: int, pointId: int):
         log_exception(e, "Point could not be retrieved", "getPoint")
         raise HTTPException(status_code=404, detail=str(e))
 
+@router.post("/{projectId}/point/fit")
+async def fitPoints(projectId: int, order: int = 1, save: bool = True):
+    """ Fit the transform of a project to its points by least squares, without reading the image, returns the transform, the RMSE and the residual of each point
+    - order 1 is an affine transform, 2 and 3 are polynomials needing at least 6 and 10 points
+    - with save, the error of each point is set to its residual in pixels
+    """
+    try:
+        return await _projectHandler.fitPoints(projectId, order, save)
+    except ValueError as e:
+        #the points can not be fitted, like too few points or points on a line
+        log_exception(e, "Points could not be fitted", "fitPoints")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        log_exception(e, "Points could not be fitted", "fitPoints")
+        raise HTTPException(status_code=404, detail=str(e))
+
 @router.post("/{projectId}/image")
 async def uploadImage(projectId: int, file: UploadFile = File(...)):
     """ Upload an image to a project by project id, returns a message if the image was uploaded successfully"""
@@ -214,35 +286,127 @@ async def uploadImage(projectId: int, file: UploadFile = File(...)):
             raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{projectId}/image")
-async def getImage(projectId: int):
-    """Get the image of a project by project id, returns the image file if found"""
+async def getImage(projectId: int, v: str = None, if_none_match: Union[str, None] = Header(default=None), if_modified_since: Union[str, None] = Header(default=None)):
+    """Get the image of a project by project id, returns the image file if found
+    - v is optional, the imageHash of the project, the response for a versioned URL can be cached for a long time
+    - answers 304 Not Modified if the client already has the current image
+    """
     try:
+        versions = await _projectHandler.getFileVersions(projectId)
+        etag = makeETag(versions["imageHash"])
+        lastModified = toHttpDate(versions["lastModified"])
+        headers = cacheHeaders(etag, lastModified, immutable=(v is not None and v == versions["imageHash"]))
+        if notModified(etag, lastModified, if_none_match, if_modified_since):
+            return Response(status_code=304, headers=headers)
         FileBytes = await _projectHandler.getImageFile(projectId)
         mediaType = "image/png"
-        return StreamingResponse(io.BytesIO(FileBytes), media_type=mediaType, headers={"Content-Disposition": "attachment; filename=image.png"})
+        headers["Content-Disposition"] = "attachment; filename=image.png"
+        return StreamingResponse(io.BytesIO(FileBytes), media_type=mediaType, headers=headers)
     except Exception as e:
         log_exception(e, "Image could not be retrieved", "getImage")
         raise HTTPException(status_code=404, detail=str(e))
 
 
 @router.get("/{projectId}/georef")
-async def InitalgeorefImage(projectId: int, crs: str = None):
-    """ Georeference the image of a project by project id, returns the georeferenced image file if found"""
+async def InitalgeorefImage(projectId: int, crs: str = None, if_none_match: Union[str, None] = Header(default=None)):
+    """ Georeference the image of a project by project id, returns the georeferenced image file if found
+    - answers 304 Not Modified if the client already has the resulting georeferenced image
+    - the full resolution georeferenced image is always written, also when lazy or proxy georeferencing is enabled
+    """
     try:
-        await _projectHandler.georefPNGImage(projectId, crs)
+        await _projectHandler.georefPNGImage(projectId, crs, lazy=False, proxy=False)
+        versions = await _projectHandler.getFileVersions(projectId)
+        etag = makeETag(versions["georeferencedHash"])
+        headers = cacheHeaders(etag, toHttpDate(versions["lastModified"]))
+        if notModified(etag, None, if_none_match, None):
+            return Response(status_code=304, headers=headers)
         imageBytes = await _projectHandler.getGeoreferencedFile(projectId)
-        return StreamingResponse(io.BytesIO(imageBytes), media_type="image/tiff", headers={"Content-Disposition": "attachment; filename=georeferenced.tiff"})
+        headers["Content-Disposition"] = "attachment; filename=georeferenced.tiff"
+        return StreamingResponse(io.BytesIO(imageBytes), media_type="image/tiff", headers=headers)
         #return FileResponse(imagepath, media_type="image/tiff", filename="georeferenced.tiff")
     except Exception as e:
         log_exception(e, "Image could not be georeferenced", "InitalgeorefImage")
         raise HTTPException(status_code=404, detail=str(e))
 
+@router.post("/{projectId}/georef/jobs", status_code=202)
+async def submitGeorefJob(projectId: int, crs: str = None, lazy: bool = None, proxy: bool = None):
+    """ Georeference the image of a project by project id in the background, returns the job with its id and status
+    - if a job with the same image, points and crs is queued or running, that job is returned
+    - a queued or running job with other input is cancelled, as are jobs of a project whose points change
+    - lazy is optional, only place the image so tiles are warped from it, the georeferenced image is written when it is downloaded.
+      Defaults to the GEOREF_LAZY setting
+    - proxy is optional, georeference a downsampled copy of the image before answering, tiles are served from it until the job replaces it.
+      The quality in the rasterInfo of the project is proxy until then. Defaults to the GEOREF_PROXY setting
+    """
+    try:
+        job = await _projectHandler.submitGeorefJob(projectId, crs, lazy, proxy)
+        return job.toDict()
+    except Exception as e:
+        log_exception(e, "Georeferencing job could not be submitted", "submitGeorefJob")
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/{projectId}/georef/jobs/{jobId}")
+async def getGeorefJob(projectId: int, jobId: str):
+    """ Get the status of a georeferencing job: queued, running, done, failed or cancelled, with timings"""
+    try:
+        job = await _projectHandler.getGeorefJob(projectId, jobId)
+        return job.toDict()
+    except Exception as e:
+        log_exception(e, "Georeferencing job could not be retrieved", "getGeorefJob")
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/{projectId}/georef/jobs/{jobId}/result")
+async def getGeorefJobResult(projectId: int, jobId: str, if_none_match: Union[str, None] = Header(default=None)):
+    """ Get the georeferenced image produced by a georeferencing job
+    - answers 202 with the job status while the job is queued or running, and 409 if the job failed or was cancelled
+    - answers 410 if the georeferenced image of the project has been replaced since the job finished
+    - the georeferenced image of a lazy job is written on the first request
+    """
+    try:
+        job = await _projectHandler.getGeorefJob(projectId, jobId)
+    except Exception as e:
+        log_exception(e, "Georeferencing job could not be retrieved", "getGeorefJobResult")
+        raise HTTPException(status_code=404, detail=str(e))
+    if job.status in ("queued", "running"):
+        return JSONResponse(status_code=202, content=job.toDict())
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job {job.status}: {job.error}")
+    try:
+        versions = await _projectHandler.getFileVersions(projectId)
+        if job.result not in (versions["georeferencedHash"], versions["lazyHash"]):
+            raise HTTPException(status_code=410, detail="The georeferenced image has been replaced since the job finished")
+        if await _projectHandler.materializeGeoreference(projectId):
+            versions = await _projectHandler.getFileVersions(projectId)
+        etag = makeETag(versions["georeferencedHash"])
+        headers = cacheHeaders(etag, toHttpDate(versions["lastModified"]))
+        if notModified(etag, None, if_none_match, None):
+            return Response(status_code=304, headers=headers)
+        imageBytes = await _projectHandler.getGeoreferencedFile(projectId)
+        headers["Content-Disposition"] = "attachment; filename=georeferenced.tiff"
+        return StreamingResponse(io.BytesIO(imageBytes), media_type="image/tiff", headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_exception(e, "Georeferenced image could not be retrieved", "getGeorefJobResult")
+        raise HTTPException(status_code=404, detail=str(e))
+
 @router.get("/{projectId}/image/geo")
-async def getGeorefImage(projectId: int):
-    """Get the georeferenced image of a project by id, returns the georeferenced image file if found"""
+async def getGeorefImage(projectId: int, v: str = None, if_none_match: Union[str, None] = Header(default=None), if_modified_since: Union[str, None] = Header(default=None)):
+    """Get the georeferenced image of a project by id, returns the georeferenced image file if found
+    - v is optional, the georeferencedHash of the project, the response for a versioned URL can be cached for a long time
+    - answers 304 Not Modified if the client already has the current georeferenced image
+    - the georeferenced image of a lazy georeference is written on the first request
+    """
     try:
+        await _projectHandler.materializeGeoreference(projectId)
+        versions = await _projectHandler.getFileVersions(projectId)
+        etag = makeETag(versions["georeferencedHash"])
+        lastModified = toHttpDate(versions["lastModified"])
+        headers = cacheHeaders(etag, lastModified, immutable=(v is not None and v == versions["georeferencedHash"]))
+        if notModified(etag, lastModified, if_none_match, if_modified_since):
+            return Response(status_code=304, headers=headers)
         imagepath = await _projectHandler.getGeoreferencedFilePath(projectId)
-        return FileResponse(imagepath, media_type="image/tiff", filename="georeferenced.tiff")
+        return FileResponse(imagepath, media_type="image/tiff", filename="georeferenced.tiff", headers=headers)
     except Exception as e:
         log_exception(e, "Georeferenced image could not be retrieved", "getGeorefImage")
         raise HTTPException(status_code=404, detail=str(e))
@@ -258,14 +422,52 @@ async def getImageCoordinates(projectId: int):
         log_exception(e, "Image coordinates could not be retrieved", "getImageCoordinates")
         raise HTTPException(status_code=404, detail=str(e))
 
+@router.get("/{projectId}/georef/preview")
+async def previewGeoreference(projectId: int, crs: str = None):
+    """ Get where the image of a project will be placed by its current points, without georeferencing the image
+    - returns the affine transform, the corner coordinates, the bounds in the format [west, north, east, south], the world file and a GeoJSON footprint
+    """
+    try:
+        return await _projectHandler.previewGeoreference(projectId, crs)
+    except ValueError as e:
+        #the points can not be fitted, like too few points or points on a line
+        log_exception(e, "Georeference preview could not be made", "previewGeoreference")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        log_exception(e, "Georeference preview could not be made", "previewGeoreference")
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/{projectId}/georef/preview.pgw")
+async def getWorldFile(projectId: int, crs: str = None):
+    """ Get the world file (.pgw) placing the image of a project by its current points, without georeferencing the image"""
+    try:
+        preview = await _projectHandler.previewGeoreference(projectId, crs)
+        return Response(content=preview["worldFile"], media_type="text/plain", headers={"Content-Disposition": "attachment; filename=image.pgw"})
+    except ValueError as e:
+        #the points can not be fitted, like too few points or points on a line
+        log_exception(e, "World file could not be made", "getWorldFile")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        log_exception(e, "World file could not be made", "getWorldFile")
+        raise HTTPException(status_code=404, detail=str(e))
+
 @router.get("/{projectId}/tiles/{z}/{x}/{y}.png")
-async def getTile(projectId: int, z: int, x: int, y: int, backgroundTasks: BackgroundTasks):
-    """ Retrieve a tile from the georeferenced image of a project by project id, zoom level, x, and y coordinates, returns the tile if found"""
+async def getTile(projectId: int, z: int, x: int, y: int, v: str = None, if_none_match: Union[str, None] = Header(default=None), if_modified_since: Union[str, None] = Header(default=None)):
+    """ Retrieve a tile from the georeferenced image of a project by project id, zoom level, x, and y coordinates, returns the tile if found
+    - v is optional, the georeferencedHash of the project, tiles of a versioned URL can be cached for a long time
+    - answers 304 Not Modified if the client already has the current tile
+    """
     try:
-        tiff_data = await _projectHandler.getGeoreferencedFile(projectId)
-        (tile_bytes, temp_path) = await generateTile(tiff_data, x, y, z)
-        backgroundTasks.add_task(removeFile, temp_path)
-        return Response(content=tile_bytes, media_type="image/png")
+        #the project is read once for the validators and the tile
+        project = await _projectHandler.getProjectRecord(projectId)
+        versions = await _projectHandler.getFileVersions(projectId, project)
+        etag = makeETag(versions["georeferencedHash"], z, x, y)
+        lastModified = toHttpDate(versions["lastModified"])
+        headers = cacheHeaders(etag, lastModified, immutable=(v is not None and v == versions["georeferencedHash"]))
+        if notModified(etag, lastModified, if_none_match, if_modified_since):
+            return Response(status_code=304, headers=headers)
+        tile_bytes = await _projectHandler.getTile(projectId, z, x, y, project)
+        return Response(content=tile_bytes, media_type="image/png", headers=headers)
     except Exception as e:
         # Handle unexpected errors
         log_exception(e, "Tile could not be retrieved", "getTile")
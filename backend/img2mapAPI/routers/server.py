@@ -2,9 +2,14 @@
 
 The module contains the following endpoints:
     - Get the server status
+    - Get the tile cache, dataset pool, georeference cache and .pdf cache statistics
+    - Get the executor queue metrics
+    - Get the georeferencing job counts
 """
 
 from fastapi import APIRouter
+from .georefProject import _TileCache, _DatasetPool, _Executor, _GeorefJobs, _GeorefCache
+from .converters import _PdfCache
 
 router = APIRouter()
 
@@ -14,4 +19,22 @@ status = "running"
 async def returnStatus():
     """ **Returns server status** 
     """
-    return {"status": status}
\ No newline at end of file
+    return {"status": status}
+
+@router.get('/cache')
+async def returnCacheStats():
+    """ **Returns tile cache, georeference cache and .pdf cache hit, miss and eviction counters, and the open dataset counters**
+    """
+    return {"tiles": _TileCache.stats(), "datasets": _DatasetPool.stats(), "georef": _GeorefCache.stats(), "pdf": _PdfCache.stats()}
+
+@router.get('/executor')
+async def returnExecutorStats():
+    """ **Returns running and queued work, and completed and failed counts, per executor category**
+    """
+    return _Executor.stats()
+
+@router.get('/jobs')
+async def returnJobStats():
+    """ **Returns the number of georeferencing jobs per status**
+    """
+    return _GeorefJobs.stats()
@@ -5,6 +5,15 @@ Modules:
     - FileHelper: Contains helper functions for file operations in the API server for temporary files
     - ImageHelper: Contains functions to convert .pdf and image files to .png files and to crop .png images
     - georefHelper: Contains functions to georeference images
+    - tileCache: Contains the in-memory cache for rendered map tiles
+    - tilePyramid: Contains functions to pre-render map tiles into a tile store
+    - datasetPool: Contains the pool of open georeferenced datasets for rendering tiles
+    - taskExecutor: Contains the execution layer that runs blocking work off the event loop
+    - httpCache: Contains the HTTP caching helpers for file and tile responses
+    - georefJobs: Contains the queue for asynchronous georeferencing jobs
+    - gcpFit: Contains the least squares fit of the transform to the points of a project
+    - georefCache: Contains the cache of georeferenced files shared by projects with the same georeference input
+    - pdfCache: Contains the disk cache of uploaded .pdf files with their pages and page thumbnails
 
 Subpackages:
     - helper: Contains helper functions for the API
@@ -15,9 +24,18 @@ Subpackages:
 from .core import FileHelper
 from .core import ImageHelper
 from .core import georefHelper
+from .core import tileCache
+from .core import tilePyramid
+from .core import datasetPool
+from .core import taskExecutor
+from .core import httpCache
+from .core import georefJobs
+from .core import gcpFit
+from .core import georefCache
+from .core import pdfCache
 from .core import helper
 from . import storage
 from . import models
 from . import projectHandler
 
-__all__ = ["FileHelper", "ImageHelper", "storage", "models", "georefHelper", "helper", "projectHandler"]
+__all__ = ["FileHelper", "ImageHelper", "storage", "models", "georefHelper", "tileCache", "tilePyramid", "datasetPool", "taskExecutor", "httpCache", "georefJobs", "gcpFit", "georefCache", "pdfCache", "helper", "projectHandler"]
@@ -2,6 +2,8 @@
 """
 import os
 import shutil
+import zipfile
+from typing import AsyncIterator, Tuple
 
 #This file contains helper functions for file operations in the API server for temporary files
 
@@ -80,6 +82,18 @@ def removeFile(filePath):
     if os.path.isfile(filePath):
         os.remove(filePath)
 
+def writeFile(filePath: str, data: bytes, append: bool = False) -> None:
+    """Writes bytes to a file, replacing the file if it exists
+
+    Args:
+        filePath (str): The path to the file
+        data (bytes): The bytes to write
+        append (bool, optional): Add the bytes to the end of the file instead of replacing it. Defaults to False.
+    """
+
+    with open(filePath, 'ab' if append else 'wb') as file:
+        file.write(data)
+
 def createEmptyFile(suffix):
     """Creates an empty file in the temp folder
 
@@ -94,3 +108,59 @@ def createEmptyFile(suffix):
     with open(getUniqeFileName(suffix), "w") as file:
         file.write("")
     return file.name
+
+async def zipStream(files: AsyncIterator[Tuple[str, str]], chunkSize: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    """Streams files into a .zip file as they are made, removing each file once it is in the .zip file
+
+    The .zip file is never held in memory, only the chunk of the file being added is. The files are stored without compression,
+    as the files added are already compressed images.
+
+    Args:
+        files (AsyncIterator[Tuple[str, str]]): The path to each file and its name in the .zip file, as they are made
+        chunkSize (int, optional): The number of bytes read from a file at a time. Defaults to 1 MB.
+
+    Returns:
+        AsyncIterator[bytes]: The bytes of the .zip file
+    """
+
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        async for (path, name) in files:
+            try:
+                with open(path, 'rb') as file, archive.open(name, 'w', force_zip64=os.path.getsize(path) >= 0x7fffffff) as entry:
+                    while True:
+                        chunk = file.read(chunkSize)
+                        if not chunk:
+                            break
+                        entry.write(chunk)
+                        if buffer.size() >= chunkSize:
+                            yield buffer.take()
+            finally:
+                removeFile(path)
+            yield buffer.take()
+    yield buffer.take()
+
+class _ZipBuffer:
+    # a write-only stream for zipfile, the written bytes are taken out as they are streamed, so zipfile sees a stream that can not seek
+    def __init__(self):
+        self._data = bytearray()
+        self._position = 0
+
+    def write(self, data: bytes) -> int:
+        self._data += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def size(self) -> int:
+        return len(self._data)
+
+    def take(self) -> bytes:
+        data = bytes(self._data)
+        self._data.clear()
+        return data
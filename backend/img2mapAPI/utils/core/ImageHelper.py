@@ -1,59 +1,382 @@
 """ This module contains functions to convert .pdf and image files to .png files and to crop .png images.  
+
+The conversions are done in the "convert" category of the TaskExecutor, so they do not block the event loop.
+Images are converted and cropped in memory, decoded from the uploaded bytes and encoded once, without temporary files.
+A page of a .pdf file is rasterized on its own by pdftoppm, which writes the .png file itself, so the other pages are never rendered
+and the image is never held in memory. When only a region of the page is wanted, pdftoppm only renders that region.
 """
 
+import asyncio
+import io
+import math
+import os
+import re
+import shutil
+import subprocess
 from fastapi import UploadFile
-from typing import List
-from pdf2image import convert_from_path
+from typing import AsyncIterator, List
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
 from .FileHelper import getUniqeFileName, removeFile
-from typing import Tuple
+from .taskExecutor import TaskExecutor
+from typing import Tuple, Union
+
+defaultDpi = 200 # the resolution pdftoppm renders at when none is given
+maxPdfPixels = 100_000_000 # the default ceiling of the number of pixels of a rendered page
+defaultCompressLevel = 6 # the zlib compression level of converted .png images, the default of PIL
 
-async def pdf2png(file: UploadFile, page_number) -> Tuple[str, str]:
+async def pdf2png(file: UploadFile, page_number, dpi: int = defaultDpi, size: int = None, maxPixels: int = maxPdfPixels,
+                  box: Tuple[float, float, float, float] = None) -> Tuple[str, str]:
     """Converts a .pdf file to a .png file.
 
     Args:
-        file (UploadFile): _description_
-        page_number (_type_): page number to convert
+        file (UploadFile): The .pdf file
+        page_number (int): page number to convert
+        dpi (int, optional): The resolution to render the page at. Defaults to defaultDpi.
+        size (int, optional): The long edge of the .png image in pixels, replaces dpi when given. Defaults to None.
+        maxPixels (int, optional): The maximum number of pixels of the .png image, the resolution is lowered to stay below it. Defaults to maxPdfPixels.
+        box (Tuple[float, float, float, float], optional): The region of the page to render as (left, top, right, bottom) in points, the whole page if None. Defaults to None.
 
     Returns:
         Tuple[str, str]: Tuple of the path to the .png file and the name of the .png file
     """
 
     tempPdf = getUniqeFileName('pdf') 
-    tempImage = getUniqeFileName('png') 
-    image_name = file.filename[:-4] +'p'+ str(page_number) + '.png'
+    image_name = file.filename[:-4] +'p'+ str(page_number) + ('cropped' if box is not None else '') + '.png'
     with open(tempPdf, 'w+b') as pdf:
-        pdf.write(await file.read())
-    img = open(tempImage, 'w+b')
-    images: List[Image.Image] = convert_from_path(tempPdf)
-    images[page_number-1].save(img, 'PNG')
-    images[page_number-1].close()
-    img.close()
-    removeFile(tempPdf)
+        #copy the upload in chunks, the .pdf file is not read into memory
+        await file.seek(0)
+        shutil.copyfileobj(file.file, pdf)
+    try:
+        tempImage = await renderPdfPage(tempPdf, page_number, dpi, size, maxPixels, box=box)
+    finally:
+        removeFile(tempPdf)
     return tempImage, image_name
 
-async def image2png(file: UploadFile) -> Tuple[str, str]:
-    """Converts an image file to a .png file.
+async def renderPdfPage(pdfPath: str, page_number: int, dpi: int = defaultDpi, size: int = None, maxPixels: int = maxPdfPixels,
+                        pageSize: Tuple[float, float] = None, box: Tuple[float, float, float, float] = None) -> str:
+    """Converts a page or a region of a page of a .pdf file on disk to a .png file in the temp folder.
+
+    Args:
+        pdfPath (str): path to the .pdf file
+        page_number (int): page number to convert
+        dpi (int, optional): The resolution to render the page at. Defaults to defaultDpi.
+        size (int, optional): The long edge of the .png image in pixels, replaces dpi when given. Defaults to None.
+        maxPixels (int, optional): The maximum number of pixels of the .png image. Defaults to maxPdfPixels.
+        pageSize (Tuple[float, float], optional): The size of the page when already known, see pdfPageSize. Defaults to None.
+        box (Tuple[float, float, float, float], optional): The region of the page to render as (left, top, right, bottom) in points. Defaults to None.
+
+    Returns:
+        str: The path to the .png file
+    """
+
+    tempImage = getUniqeFileName('png')
+    future = TaskExecutor.getInstance().submit("convert", pdfPageToPngFile, pdfPath, tempImage, page_number, dpi, size, maxPixels, pageSize, box)
+    try:
+        await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        #a running pdftoppm process is not stopped, the .png file is removed when it is done writing it
+        future.cancel()
+        future.add_done_callback(lambda _: removeFile(tempImage))
+        raise
+    except:
+        removeFile(tempImage)
+        raise
+    return tempImage
+
+async def renderPdfPages(pdfPath: str, pages: List[int], dpi: int = defaultDpi, size: int = None, maxPixels: int = maxPdfPixels,
+                         pageSizes: List[Tuple[float, float]] = None, inFlight: int = 2) -> AsyncIterator[Tuple[int, str]]:
+    """Converts several pages of a .pdf file on disk to .png files in the temp folder, rendering pages at the same time.
+
+    The pages are rendered in the "convert" category of the TaskExecutor, each by its own pdftoppm process.
+    At most inFlight pages are rendered or waiting to be taken at a time, so the disk and memory used do not grow with the number of pages.
+    The pages are given as they are done, not in order. The caller removes the .png files, the files of pages not taken are removed.
+
+    Args:
+        pdfPath (str): path to the .pdf file
+        pages (List[int]): The page numbers to convert
+        dpi (int, optional): The resolution to render the pages at. Defaults to defaultDpi.
+        size (int, optional): The long edge of each .png image in pixels, replaces dpi when given. Defaults to None.
+        maxPixels (int, optional): The maximum number of pixels of each .png image. Defaults to maxPdfPixels.
+        pageSizes (List[Tuple[float, float]], optional): The size of every page of the file when already known, by page number - 1. Defaults to None.
+        inFlight (int, optional): The number of pages rendered at a time. Defaults to 2.
+
+    Returns:
+        AsyncIterator[Tuple[int, str]]: The page number and the path to the .png file of each page
+    """
+
+    remaining = iter(pages)
+    running = {}
+
+    def startNext() -> None:
+        page = next(remaining, None)
+        if page is not None:
+            pageSize = tuple(pageSizes[page - 1]) if pageSizes is not None else None
+            running[asyncio.ensure_future(renderPdfPage(pdfPath, page, dpi, size, maxPixels, pageSize))] = page
+
+    try:
+        for _ in range(max(inFlight, 1)):
+            startNext()
+        while running:
+            (done, _) = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                page = running.pop(task)
+                startNext()
+                yield (page, task.result())
+    finally:
+        #the caller stopped early or a page failed, do not leave the other pages behind
+        for task in running:
+            task.cancel()
+        for task in running:
+            try:
+                removeFile(await task)
+            except BaseException:
+                pass
+
+def pdfPageToPngFile(pdfPath: str, imagePath: str, page_number: int, dpi: int = defaultDpi, size: int = None, maxPixels: int = maxPdfPixels,
+                     pageSize: Tuple[float, float] = None, box: Tuple[float, float, float, float] = None) -> None:
+    """Converts a page or a region of a page of a .pdf file to a .png file, blocking.
+
+    Only the page is rendered, pdftoppm writes it to the .png file directly.
+    With a region, pdftoppm only renders the region, so a detailed crop of a large page is made without rendering the whole page.
+
+    Args:
+        pdfPath (str): path to the .pdf file
+        imagePath (str): path to write the .png file to
+        page_number (int): page number to convert
+        dpi (int, optional): The resolution to render the page at. Defaults to defaultDpi.
+        size (int, optional): The long edge of the .png image in pixels, replaces dpi when given. Defaults to None.
+        maxPixels (int, optional): The maximum number of pixels of the .png image. Defaults to maxPdfPixels.
+        pageSize (Tuple[float, float], optional): The size of the page when already known, read with pdfinfo if not. Defaults to None.
+        box (Tuple[float, float, float, float], optional): The region of the page to render as (left, top, right, bottom) in points,
+                                                           from the top left corner of the page as shown. The whole page if None. Defaults to None.
+
+    Raises:
+        Exception: The page is not in the .pdf file
+        Exception: The region is not on the page
+    """
+
+    if pageSize is None:
+        pageSize = pdfPageSize(pdfPath, page_number)
+    if box is not None:
+        pdfRegionToPngFile(pdfPath, imagePath, page_number, pageRegion(box, pageSize), dpi, size, maxPixels)
+        return
+    renderDpi = pageDpi(pageSize, dpi, size, maxPixels)
+    (folder, name) = os.path.split(imagePath)
+    #pdftoppm adds the extension to the output file name
+    paths: List[str] = convert_from_path(pdfPath, dpi=renderDpi, first_page=page_number, last_page=page_number, fmt='png',
+                                         single_file=True, output_folder=folder, output_file=name.rpartition('.')[0], paths_only=True)
+    if not paths:
+        raise Exception("The page could not be converted")
+    if os.path.abspath(paths[0]) != os.path.abspath(imagePath):
+        os.replace(paths[0], imagePath)
+
+def pdfRegionToPngFile(pdfPath: str, imagePath: str, page_number: int, box: Tuple[float, float, float, float], dpi: int = defaultDpi,
+                       size: int = None, maxPixels: int = maxPdfPixels) -> None:
+    """Converts a region of a page of a .pdf file to a .png file with the crop options of pdftoppm, blocking.
+
+    Args:
+        pdfPath (str): path to the .pdf file
+        imagePath (str): path to write the .png file to
+        page_number (int): page number to convert
+        box (Tuple[float, float, float, float]): The region as (left, top, right, bottom) in points, on the page, see pageRegion
+        dpi (int, optional): The resolution to render the region at. Defaults to defaultDpi.
+        size (int, optional): The long edge of the .png image in pixels, replaces dpi when given. Defaults to None.
+        maxPixels (int, optional): The maximum number of pixels of the .png image. Defaults to maxPdfPixels.
+
+    Raises:
+        Exception: The region could not be converted
+    """
+
+    (left, top, right, bottom) = box
+    #the ceiling and size apply to the region, not to the page
+    renderDpi = pageDpi((right - left, bottom - top), dpi, size, maxPixels)
+    scale = renderDpi / 72
+    #the crop area of pdftoppm is given in pixels of the page rendered at the resolution
+    (x, y) = (round(left * scale), round(top * scale))
+    (width, height) = (max(math.ceil((right - left) * scale), 1), max(math.ceil((bottom - top) * scale), 1))
+    output = imagePath.rpartition('.')[0] # pdftoppm adds the extension
+    command = ["pdftoppm", "-r", str(renderDpi), "-f", str(page_number), "-l", str(page_number),
+               "-x", str(x), "-y", str(y), "-W", str(width), "-H", str(height), "-png", "-singlefile", pdfPath, output]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0 or not os.path.isfile(output + '.png'):
+        raise Exception("The region could not be converted: " + result.stderr.decode("utf8", "ignore").strip())
+    if os.path.abspath(output + '.png') != os.path.abspath(imagePath):
+        os.replace(output + '.png', imagePath)
+
+def pageRegion(box: Tuple[float, float, float, float], pageSize: Tuple[float, float]) -> Tuple[float, float, float, float]:
+    """Gets the part of a region that is on a page.
+
+    Args:
+        box (Tuple[float, float, float, float]): The region as (left, top, right, bottom) in points
+        pageSize (Tuple[float, float]): The width and height of the page in points, see pdfPageSize
+
+    Raises:
+        Exception: The region is not on the page
+
+    Returns:
+        Tuple[float, float, float, float]: The region cut to the page
+    """
+
+    (left, top, right, bottom) = box
+    (left, right) = (max(min(left, right), 0), min(max(left, right), pageSize[0]))
+    (top, bottom) = (max(min(top, bottom), 0), min(max(top, bottom), pageSize[1]))
+    if right <= left or bottom <= top:
+        raise Exception(f"The region is not on the page, the page is {pageSize[0]} x {pageSize[1]} points")
+    return (left, top, right, bottom)
+
+def pdfPageSize(pdfPath: str, page_number: int) -> Tuple[float, float]:
+    """Gets the size of a page of a .pdf file as shown, from pdfinfo without rendering the page.
+
+    Args:
+        pdfPath (str): path to the .pdf file
+        page_number (int): page number
+
+    Raises:
+        Exception: The page is not in the .pdf file
+
+    Returns:
+        Tuple[float, float]: The width and height of the page in points (1/72 inch), after the rotation of the page
+    """
+
+    info: dict = pdfinfo_from_path(pdfPath, first_page=page_number, last_page=page_number)
+    if page_number < 1 or page_number > int(info.get("Pages", 0)):
+        raise Exception(f"The .pdf file has no page {page_number}, it has {info.get('Pages', 0)} pages")
+    sizes = readPageSizes(info)
+    if page_number not in sizes:
+        raise Exception("The size of the page could not be read")
+    return sizes[page_number]
+
+def pdfInventory(pdfPath: str) -> dict:
+    """Gets the number of pages of a .pdf file and the size of each page, from pdfinfo without rendering any page, blocking.
+
+    Args:
+        pdfPath (str): path to the .pdf file
+
+    Returns:
+        dict: The number of pages and the width and height of each page in points, after the rotation of the page
+    """
+
+    pages = int(pdfinfo_from_path(pdfPath).get("Pages", 0))
+    if pages < 1:
+        raise Exception("The .pdf file has no pages")
+    sizes = readPageSizes(pdfinfo_from_path(pdfPath, first_page=1, last_page=pages))
+    if len(sizes) < pages:
+        raise Exception("The size of the pages could not be read")
+    return {"pages": pages, "pageSizes": [list(sizes[page]) for page in range(1, pages + 1)]}
+
+def readPageSizes(info: dict) -> dict:
+    """Reads the page sizes from the output of pdfinfo.
+
+    Args:
+        info (dict): The fields printed by pdfinfo, see pdf2image.pdfinfo_from_path
+
+    Returns:
+        dict: The width and height in points of each page by page number, after the rotation of the page
+    """
+
+    #pdfinfo names the fields "Page size" without a page range and "Page    n size" with one
+    fields = {}
+    for (key, value) in info.items():
+        match = re.fullmatch(r"Page\s*(\d*)\s*(size|rot)", key)
+        if match is not None:
+            fields[(int(match.group(1) or 1), match.group(2))] = value
+    sizes = {}
+    for ((page, field), value) in fields.items():
+        match = re.match(r"\s*([\d.]+)\s*x\s*([\d.]+)", str(value)) if field == "size" else None
+        if match is None:
+            continue
+        (width, height) = (float(match.group(1)), float(match.group(2)))
+        if int(float(fields.get((page, "rot")) or 0)) % 180 == 90:
+            (width, height) = (height, width)
+        sizes[page] = (width, height)
+    return sizes
+
+def pdfThumbnailFiles(pdfPath: str, folder: str, size: int, threads: int = 1) -> List[str]:
+    """Renders a small .png image of every page of a .pdf file, blocking.
+
+    The pages are split between several pdftoppm processes, which write the images to the folder.
+
+    Args:
+        pdfPath (str): path to the .pdf file
+        folder (str): The folder to write the images to
+        size (int): The long edge of the images in pixels
+        threads (int, optional): The number of pdftoppm processes rendering pages at once. Defaults to 1.
+
+    Returns:
+        List[str]: The paths to the images, in the order of the pages
+    """
+
+    return convert_from_path(pdfPath, fmt='png', size=size, thread_count=max(threads, 1), output_folder=folder, output_file="page", paths_only=True)
+
+def pageDpi(pageSize: Tuple[float, float], dpi: int = defaultDpi, size: Union[int, None] = None, maxPixels: int = maxPdfPixels) -> float:
+    """Gets the resolution to render a page at.
+
+    Args:
+        pageSize (Tuple[float, float]): The width and height of the page in points, see pdfPageSize
+        dpi (int, optional): The requested resolution. Defaults to defaultDpi.
+        size (Union[int, None], optional): The requested long edge of the image in pixels, replaces dpi when given. Defaults to None.
+        maxPixels (int, optional): The maximum number of pixels of the image. Defaults to maxPdfPixels.
+
+    Returns:
+        float: The resolution in dots per inch, lowered so the image has at most maxPixels pixels
+    """
+
+    (width, height) = (pageSize[0] / 72, pageSize[1] / 72) # in inches
+    if size is not None:
+        dpi = size / max(width, height, 1 / 72)
+    if maxPixels and math.ceil(width * dpi) * math.ceil(height * dpi) > maxPixels:
+        dpi = (maxPixels / (width * height)) ** 0.5
+        #the pixel size is rounded up by pdftoppm
+        while dpi > 1 and math.ceil(width * dpi) * math.ceil(height * dpi) > maxPixels:
+            dpi *= 0.999
+    return max(dpi, 1)
+
+async def image2png(file: UploadFile, compressLevel: int = defaultCompressLevel, size: int = None) -> Tuple[bytes, str]:
+    """Converts an image file to a .png file, in memory without temporary files.
 
     Args:
         file (UploadFile): image file to convert
+        compressLevel (int, optional): The zlib compression level of the .png file, 0 to 9. Defaults to defaultCompressLevel.
+        size (int, optional): The long edge of the .png image in pixels, the image is only made smaller. Defaults to None.
 
     Returns:
-        Tuple[str, str]: Tuple of the path to the .png file and the name of the .png file
+        Tuple[bytes, str]: Tuple of the .png file and the name of the .png file
     """
 
-    inputImage = getUniqeFileName('png')
     image_name = file.filename.rpartition('.')[0] + '.png'
-    with open(inputImage, 'w+b') as img:
-        img.write(await file.read())
-    image = Image.open(inputImage)
-    png_image = image.convert('RGB')
-    image.close()
-    tempImage = getUniqeFileName('png')
-    with open(tempImage, 'w+b') as img:
-        png_image.save(img, 'PNG')
-    removeFile(inputImage)
-    return tempImage, image_name
+    await file.seek(0)
+    pngBytes = await TaskExecutor.getInstance().run("convert", imageToPngBytes, await file.read(), compressLevel, size)
+    return pngBytes, image_name
+
+def imageToPngBytes(imageBytes: bytes, compressLevel: int = defaultCompressLevel, size: int = None) -> bytes:
+    """Converts an image file to a .png file, decoding and encoding the image once, blocking.
+
+    A JPEG image made smaller is decoded at the smallest scale of the JPEG decoder that is still large enough (draft mode),
+    so the full image is never decoded.
+
+    Args:
+        imageBytes (bytes): The image file
+        compressLevel (int, optional): The zlib compression level of the .png file, 0 to 9. Defaults to defaultCompressLevel.
+        size (int, optional): The long edge of the .png image in pixels, the image is only made smaller. Defaults to None.
+
+    Returns:
+        bytes: The .png file
+    """
+
+    with Image.open(io.BytesIO(imageBytes)) as image:
+        if size is not None and max(image.size) > size:
+            scale = size / max(image.size)
+            target = (max(round(image.width * scale), 1), max(round(image.height * scale), 1))
+            if image.format == 'JPEG':
+                image.draft('RGB', target)
+            png_image = image.convert('RGB')
+            png_image.thumbnail(target, Image.Resampling.LANCZOS)
+        else:
+            png_image = image.convert('RGB')
+    output = io.BytesIO()
+    png_image.save(output, 'PNG', compress_level=compressLevel)
+    return output.getvalue()
 
 def isImageSupported(file: UploadFile) -> bool:
     """Checks if a file is an image and is not a file that PIL can't convert to .png.
@@ -73,8 +396,8 @@ def isImageSupported(file: UploadFile) -> bool:
         return False
     return True
 
-async def cropPng(file: UploadFile, p1x: int, p1y: int, p2x: int, p2y: int) -> Tuple[str, str]:
-    """Crops a .png image.
+async def cropPng(file: UploadFile, p1x: int, p1y: int, p2x: int, p2y: int, compressLevel: int = defaultCompressLevel) -> Tuple[bytes, str]:
+    """Crops a .png image, in memory without temporary files.
 
     Args:
         file (UploadFile): .png image to crop
@@ -82,22 +405,31 @@ async def cropPng(file: UploadFile, p1x: int, p1y: int, p2x: int, p2y: int) -> T
         p1y (int): Y coordinate of the first point
         p2x (int): X coordinate of the second point
         p2y (int): Y coordinate of the second point
+        compressLevel (int, optional): The zlib compression level of the cropped .png file, 0 to 9. Defaults to defaultCompressLevel.
 
     Returns:
-        Tuple[str, str]: cropped .png image and the name of the cropped .png image
+        Tuple[bytes, str]: cropped .png image and the name of the cropped .png image
     """
 
-    inputImage = getUniqeFileName('png')
-    with open(inputImage, 'w+b') as img:
-        img.write(await file.read())
-
-    tempImage = getUniqeFileName('png')
-    image = Image.open(inputImage)
-    cropped = image.crop((p1x, p1y, p2x, p2y))
-    with open(tempImage, 'w+b') as img:
-        cropped.save(img, 'PNG')
-        image.close()
+    await file.seek(0)
+    pngBytes = await TaskExecutor.getInstance().run("convert", cropPngBytes, await file.read(), (p1x, p1y, p2x, p2y), compressLevel)
     newfileName = file.filename[:-4] + 'cropped.png'
-    removeFile(inputImage)
-    return tempImage, newfileName
- 
\ No newline at end of file
+    return pngBytes, newfileName
+
+def cropPngBytes(imageBytes: bytes, box: Tuple[int, int, int, int], compressLevel: int = defaultCompressLevel) -> bytes:
+    """Crops a .png image file, decoding and encoding the image once, blocking.
+
+    Args:
+        imageBytes (bytes): The .png image
+        box (Tuple[int, int, int, int]): the crop rectangle as (left, top, right, bottom)
+        compressLevel (int, optional): The zlib compression level of the cropped .png file, 0 to 9. Defaults to defaultCompressLevel.
+
+    Returns:
+        bytes: The cropped .png image
+    """
+
+    with Image.open(io.BytesIO(imageBytes)) as image:
+        cropped = image.crop(box)
+    output = io.BytesIO()
+    cropped.save(output, 'PNG', compress_level=compressLevel)
+    return output.getvalue()
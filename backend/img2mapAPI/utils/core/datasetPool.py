@@ -0,0 +1,315 @@
+""" This module contains a pool of open georeferenced datasets, shared by the tile requests of a project.
+"""
+
+import threading
+import time
+from typing import Callable, Union
+import rasterio as rio
+from rasterio.warp import transform_bounds
+from rio_tiler.io import Reader
+
+class PooledDataset:
+    """An open georeferenced dataset in the pool.
+
+    The dataset is opened from the path GDAL reads the file in storage with, so only the byte ranges needed for a tile are read.
+    A GDAL dataset handle can not be used by two threads at once, so the dataset keeps up to maxHandles handles to the same file,
+    opened as they are needed. All reads go through use(), which borrows a free handle, so tiles of the same dataset render at the same time.
+
+    Attributes:
+        key (tuple): The key of the dataset in the pool, (projectId, version)
+        path (str): The GDAL path to the file, a local path or a GDAL virtual file system path
+        gdalOptions (dict): The GDAL configuration options needed to read the file
+        maxHandles (int): The maximum number of handles open to the file, a read waits for a free handle above it
+        handles (int): The number of handles open to the file
+        refs (int): The number of users currently holding the dataset
+        lastUsed (float): The time the dataset was last released
+        stale (bool): True if the dataset should be closed when it is no longer used
+        mercatorBounds (list): The footprint of the file, [minx, miny, maxx, maxy] in Web Mercator meters, None if the file has no crs
+    """
+
+    def __init__(self, key: tuple, path: str, gdalOptions: dict = None, maxHandles: int = 1):
+        self.key = key
+        self.path = path
+        self.gdalOptions = gdalOptions or {}
+        self.maxHandles = max(maxHandles, 1)
+        self.refs = 0
+        self.lastUsed = time.monotonic()
+        self.stale = False
+        self._condition = threading.Condition()
+        #the first handle is opened right away, so a file that can not be opened fails before the dataset is pooled
+        self._free: list = [self._openHandle()]
+        self.handles = 1
+        dataset = self._free[0][0]
+        self.mercatorBounds = list(transform_bounds(dataset.crs, "EPSG:3857", *dataset.bounds, densify_pts=21)) if dataset.crs is not None else None
+
+    def use(self, function: Callable, *args):
+        """Call a function with a reader of the dataset, borrowing a handle no other thread is using
+
+        Args:
+            function (Callable): The function to call, with the reader as the first argument
+            *args: Additional arguments to the function
+
+        Returns:
+            any: The return value of the function
+        """
+
+        handle = self._borrow()
+        try:
+            with rio.Env(**self.gdalOptions):
+                return function(handle[1], *args)
+        finally:
+            with self._condition:
+                self._free.append(handle)
+                self._condition.notify()
+
+    def close(self):
+        """Close the handles of the dataset, the dataset must not be in use
+        """
+
+        with self._condition:
+            handles = self._free
+            self._free = []
+            self.handles = 0
+        for (dataset, reader) in handles:
+            reader.close()
+            dataset.close()
+
+    def _borrow(self) -> tuple:
+        # take a free handle, open a new one below maxHandles, or wait for one to be returned
+        with self._condition:
+            while not self._free and self.handles >= self.maxHandles:
+                self._condition.wait()
+            if self._free:
+                return self._free.pop()
+            self.handles += 1
+        try:
+            return self._openHandle()
+        except:
+            with self._condition:
+                self.handles -= 1
+                self._condition.notify()
+            raise
+
+    def _openHandle(self) -> tuple:
+        with rio.Env(**self.gdalOptions):
+            dataset = rio.open(self.path)
+        return (dataset, Reader(self.path, dataset=dataset))
+
+class DatasetPool:
+    """This class keeps georeferenced datasets open between tile requests.
+
+    Datasets are keyed by (projectId, version), so a new georeferenced file for a project is opened as a new dataset.
+    Datasets are reference counted, a dataset is only closed when no request is using it. Unused datasets are closed
+    after idleTimeout seconds, or earlier when more than maxOpen datasets are open. The idle datasets are closed by a
+    background thread every sweepInterval seconds, started when the first dataset is opened, and whenever a dataset is opened.
+    acquire, release and invalidate are called from the event loop, so they never close a dataset themselves,
+    the datasets they close are handed to the background thread.
+
+    Attributes:
+        maxOpen (int): The maximum number of open datasets
+        maxHandles (int): The maximum number of handles open to each dataset, the number of tiles of one dataset rendered at a time
+        idleTimeout (float): Seconds an unused dataset is kept open
+        sweepInterval (float): Seconds between the checks for idle datasets, 0 to only check when a dataset is opened
+
+    Functions:
+        acquire(projectId: int, version: str) -> Union[PooledDataset, None]: Get an open dataset from the pool
+        open(projectId: int, version: str, path: str, gdalOptions: dict) -> PooledDataset: Open a dataset and add it to the pool
+        release(handle: PooledDataset) -> None: Release a dataset acquired from the pool
+        invalidate(projectId: int) -> None: Close all datasets of a project
+        stats() -> dict: Get the pool counters
+        shutdown() -> None: Stop the background thread and close the unused datasets
+    """
+
+    def __init__(self, maxOpen: int = 8, idleTimeout: float = 300, maxHandles: int = 4, sweepInterval: float = None):
+        self.maxOpen = maxOpen
+        self.maxHandles = maxHandles
+        self.idleTimeout = idleTimeout
+        self.sweepInterval = sweepInterval if sweepInterval is not None else min(max(idleTimeout / 4, 1), 60)
+        self.opened = 0
+        self.closed = 0
+        self._datasets: dict = {} # (projectId, version) -> PooledDataset
+        self._lock = threading.Lock()
+        self._sweeper: threading.Thread = None
+        self._stopSweep = threading.Event()
+        self._wake = threading.Event()
+        self._stale: list = [] # datasets to close, closed by the background thread
+
+    def acquire(self, projectId: int, version: str) -> Union[PooledDataset, None]:
+        """Get an open dataset from the pool, the dataset must be released after use
+
+        Args:
+            projectId (int): The id of the project
+            version (str): The version of the georeferenced raster
+
+        Returns:
+            Union[PooledDataset, None]: The open dataset, None if the dataset is not open
+        """
+
+        with self._lock:
+            handle = self._datasets.get((projectId, version))
+            if handle is None:
+                return None
+            handle.refs += 1
+            return handle
+
+    def open(self, projectId: int, version: str, path: str, gdalOptions: dict = None) -> PooledDataset:
+        """Open a dataset and add it to the pool, the dataset must be released after use, blocking, run it off the event loop
+
+        If another request opened the same dataset in the meantime, that dataset is returned instead.
+
+        Args:
+            projectId (int): The id of the project
+            version (str): The version of the georeferenced raster
+            path (str): The GDAL path to the georeferenced file, see FileStorage.gdalPath
+            gdalOptions (dict, optional): The GDAL configuration options needed to read the file, see FileStorage.gdalOptions
+
+        Returns:
+            PooledDataset: The open dataset
+        """
+
+        key = (projectId, version)
+        handle = PooledDataset(key, path, gdalOptions, self.maxHandles)
+        with self._lock:
+            existing = self._datasets.get(key)
+            if existing is None:
+                self._datasets[key] = handle
+                self.opened += 1
+            else:
+                (handle, existing) = (existing, handle)
+            handle.refs += 1
+        if existing is not None:
+            existing.close()
+        self._closeIdle()
+        self._startSweeper()
+        return handle
+
+    def release(self, handle: PooledDataset) -> None:
+        """Release a dataset acquired from the pool
+
+        Args:
+            handle (PooledDataset): The dataset to release
+        """
+
+        close = False
+        with self._lock:
+            handle.refs -= 1
+            handle.lastUsed = time.monotonic()
+            if handle.stale and handle.refs == 0:
+                close = True
+        if close:
+            self._closeLater([handle])
+
+    def invalidate(self, projectId: int) -> None:
+        """Close all datasets of a project, datasets in use are closed when they are released
+
+        Args:
+            projectId (int): The id of the project
+        """
+
+        toClose = []
+        with self._lock:
+            for key in [key for key in self._datasets if key[0] == projectId]:
+                handle = self._datasets.pop(key)
+                handle.stale = True
+                if handle.refs == 0:
+                    toClose.append(handle)
+        self._closeLater(toClose)
+
+    def stats(self) -> dict:
+        """Get the pool counters
+
+        Returns:
+            dict: The number of open datasets, datasets in use, handles open to the datasets, and datasets opened and closed since start
+        """
+
+        with self._lock:
+            return {
+                "open": len(self._datasets),
+                "inUse": sum(1 for handle in self._datasets.values() if handle.refs > 0),
+                "handles": sum(handle.handles for handle in self._datasets.values()),
+                "opened": self.opened,
+                "closed": self.closed,
+                "maxOpen": self.maxOpen,
+            }
+
+    def shutdown(self) -> None:
+        """Stop the background thread closing idle datasets and close the unused datasets, datasets in use are closed when they are released
+        """
+
+        with self._lock:
+            self._stopSweep.set()
+        self._wake.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+        self._closeStale()
+        toClose = []
+        with self._lock:
+            for key in list(self._datasets):
+                handle = self._datasets.pop(key)
+                handle.stale = True
+                if handle.refs == 0:
+                    toClose.append(handle)
+        for handle in toClose:
+            handle.close()
+        self._countClosed(len(toClose))
+
+    def _startSweeper(self) -> None:
+        # the thread is a daemon, so it does not keep the server from stopping
+        with self._lock:
+            if self._sweeper is not None or self._stopSweep.is_set():
+                return
+            self._sweeper = threading.Thread(target=self._sweep, name="datasetPoolSweep", daemon=True)
+        self._sweeper.start()
+
+    def _sweep(self) -> None:
+        # closes the datasets handed over by _closeLater as they come, and the idle datasets every sweepInterval seconds
+        while True:
+            self._wake.wait(self.sweepInterval if self.sweepInterval > 0 else None)
+            self._wake.clear()
+            if self._stopSweep.is_set():
+                return
+            self._closeStale()
+            if self.sweepInterval > 0:
+                self._closeIdle()
+
+    def _closeLater(self, handles: list) -> None:
+        # hand datasets to the background thread to close, or close them here once the thread is stopped
+        if not handles:
+            return
+        with self._lock:
+            queued = self._sweeper is not None and not self._stopSweep.is_set()
+            if queued:
+                self._stale.extend(handles)
+        if queued:
+            self._wake.set()
+            return
+        for handle in handles:
+            handle.close()
+        self._countClosed(len(handles))
+
+    def _closeStale(self) -> None:
+        with self._lock:
+            (toClose, self._stale) = (self._stale, [])
+        for handle in toClose:
+            handle.close()
+        self._countClosed(len(toClose))
+
+    def _closeIdle(self) -> None:
+        # close unused datasets that have timed out, and the least recently used ones above maxOpen
+        toClose = []
+        now = time.monotonic()
+        with self._lock:
+            unused = sorted((handle for handle in self._datasets.values() if handle.refs == 0), key=lambda handle: handle.lastUsed)
+            excess = len(self._datasets) - self.maxOpen
+            for handle in unused:
+                if excess > 0 or now - handle.lastUsed > self.idleTimeout:
+                    del self._datasets[handle.key]
+                    toClose.append(handle)
+                    excess -= 1
+        for handle in toClose:
+            handle.close()
+        self._countClosed(len(toClose))
+
+    def _countClosed(self, count: int) -> None:
+        with self._lock:
+            self.closed += count
@@ -0,0 +1,199 @@
+""" This module contains a least squares fit of the transform from pixel to map coordinates from the points of a project.
+
+The fit only uses the coordinates of the points, the raster is never read, so it is cheap enough to run on every change of the points.
+The transform is a polynomial of the pixel coordinates, of order 1 (affine) to 3:
+    order 1: x = a0 + a1*col + a2*row
+    order 2: adds col^2, col*row and row^2
+    order 3: adds col^3, col^2*row, col*row^2 and row^3
+The pixel coordinates are centered and scaled before the fit, so the higher orders stay well conditioned.
+"""
+
+from typing import Tuple, Union
+import numpy as np
+from rasterio.transform import Affine
+
+#internal imports
+from ..models import PointList, PointSet
+
+maxOrder = 3
+
+def minPoints(order: int) -> int:
+    """Get the number of points needed to fit a transform of an order
+
+    Args:
+        order (int): The order of the polynomial
+
+    Returns:
+        int: The number of terms of the polynomial, the minimum number of points
+    """
+
+    return (order + 1) * (order + 2) // 2
+
+def pointArrays(points: Union[PointSet, PointList]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Get the coordinates of a list of points as arrays
+
+    Args:
+        points (Union[PointSet, PointList]): The list of points
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: The Idproj of the points, the pixel coordinates (n, 2) as col, row,
+                                                   and the map coordinates (n, 2) as x (lng), y (lat)
+    """
+
+    points = PointSet.of(points)
+    return (points.Idproj, points.pixels(), points.coords())
+
+def affineTransform(points: Union[PointSet, PointList]) -> Affine:
+    """Fit the affine transform from pixel to map coordinates to the points with least squares, like rasterio.transform.from_gcps
+
+    Args:
+        points (Union[PointSet, PointList]): The list of points
+
+    Raises:
+        Exception: Not enough points to create a transform
+        Exception: The points do not determine a transform, for example when they are on a line
+
+    Returns:
+        Affine: The transform
+    """
+
+    (_, pixels, coords) = pointArrays(points)
+    if len(pixels) < minPoints(1):
+        raise Exception("Not enough points to create a transform")
+    #centered pixel coordinates keep the fit well conditioned for large images
+    center = pixels.mean(axis=0)
+    design = np.column_stack((np.ones(len(pixels)), pixels - center))
+    (coefficients, _, rank, _) = np.linalg.lstsq(design, coords, rcond=None)
+    if rank < 3:
+        raise Exception("The points do not determine a transform, they may be on a line")
+    ((x0, y0), (xc, yc), (xr, yr)) = coefficients.tolist()
+    (cc, cr) = center.tolist()
+    return Affine(xc, xr, x0 - xc * cc - xr * cr, yc, yr, y0 - yc * cc - yr * cr)
+
+def fitTransform(points: Union[PointSet, PointList], order: int = 1) -> dict:
+    """Fit the transform from pixel to map coordinates to the points with least squares, and get the residual of each point
+
+    The residual of a point is the fitted position minus the position of the point. It is given in map units,
+    and in pixels through the inverse of the local derivative of the transform at the point.
+
+    Args:
+        points (Union[PointSet, PointList]): The list of points
+        order (int, optional): The order of the polynomial, 1 for an affine transform. Defaults to 1.
+
+    Raises:
+        ValueError: The order is not supported
+        ValueError: Not enough points to fit a transform of the order
+        ValueError: The points do not determine a transform, for example when they are on a line
+        ValueError: The fitted transform is singular or the residuals are not finite
+
+    Returns:
+        dict: The order, the center and scale of the pixel coordinates and the coefficients of x and y in the order of the terms,
+              the affine transform (a, b, c, d, e, f) for order 1,
+              the root mean square error in map units and pixels, and the residuals as lists in the order of the points:
+              Idproj, the residual x and y and its length errorMap in map units, and the residual col and row and its length errorPixels in pixels
+    """
+
+    if order < 1 or order > maxOrder:
+        raise ValueError(f"Order must be between 1 and {maxOrder}")
+    (ids, pixels, coords) = pointArrays(points)
+    if len(ids) < minPoints(order):
+        raise ValueError(f"Not enough points to fit a transform of order {order}, at least {minPoints(order)} are needed")
+
+    #center and scale the pixel coordinates
+    center = pixels.mean(axis=0)
+    scale = max(float(np.abs(pixels - center).max()), 1.0)
+    normalized = (pixels - center) / scale
+
+    design = polynomialTerms(normalized, order)
+    (coefficients, _, rank, _) = np.linalg.lstsq(design, coords, rcond=None)
+    if rank < design.shape[1]:
+        raise ValueError("The points do not determine a transform, they may be on a line")
+
+    residualMap = design @ coefficients - coords
+    errorMap = np.hypot(residualMap[:, 0], residualMap[:, 1])
+
+    #map the residuals to pixels with the inverse of the 2x2 derivative of the transform at each point
+    (dc, dr) = polynomialDerivatives(normalized, order)
+    (dxdc, dydc) = (dc @ coefficients / scale).T
+    (dxdr, dydr) = (dr @ coefficients / scale).T
+    determinant = dxdc * dydr - dxdr * dydc
+    #a transform that maps the image onto a line or a point can not be inverted at the points,
+    #the determinant is compared to the extent of the map coordinates over the extent of the pixel coordinates, as it is only near zero then
+    extent = float(np.ptp(coords, axis=0).max())
+    if extent == 0 or (np.abs(determinant) * scale ** 2 <= 1e-10 * extent ** 2).any():
+        raise ValueError("The fitted transform is singular, the map coordinates of the points may be on a line or the same")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        residualPixels = np.stack([
+            (dydr * residualMap[:, 0] - dxdr * residualMap[:, 1]) / determinant,
+            (dxdc * residualMap[:, 1] - dydc * residualMap[:, 0]) / determinant,
+        ], axis=1)
+    errorPixels = np.hypot(residualPixels[:, 0], residualPixels[:, 1])
+    if not (np.isfinite(errorMap).all() and np.isfinite(errorPixels).all()):
+        raise ValueError("The residuals of the fit are not finite, check the coordinates of the points")
+
+    result = {
+        "order": order,
+        "center": center.tolist(),
+        "scale": scale,
+        "coefficients": {"x": coefficients[:, 0].tolist(), "y": coefficients[:, 1].tolist()},
+        "affine": None,
+        "rmse": {
+            "map": float(np.sqrt(np.mean(errorMap ** 2))),
+            "pixels": float(np.sqrt(np.mean(errorPixels ** 2))),
+        },
+        #one list per field instead of one object per point, so the result is built without a loop over the points
+        "residuals": {
+            "Idproj": ids.tolist(),
+            "x": residualMap[:, 0].tolist(),
+            "y": residualMap[:, 1].tolist(),
+            "errorMap": errorMap.tolist(),
+            "col": residualPixels[:, 0].tolist(),
+            "row": residualPixels[:, 1].tolist(),
+            "errorPixels": errorPixels.tolist(),
+        },
+    }
+    if order == 1:
+        #undo the normalization, x = a*col + b*row + c and y = d*col + e*row + f
+        (x0, xc, xr) = coefficients[:, 0] / (1, scale, scale)
+        (y0, yc, yr) = coefficients[:, 1] / (1, scale, scale)
+        result["affine"] = [
+            float(xc), float(xr), float(x0 - xc * center[0] - xr * center[1]),
+            float(yc), float(yr), float(y0 - yc * center[0] - yr * center[1]),
+        ]
+    return result
+
+def polynomialTerms(normalized: np.ndarray, order: int) -> np.ndarray:
+    """Get the terms of the polynomial for each point
+
+    Args:
+        normalized (np.ndarray): The normalized pixel coordinates (n, 2)
+        order (int): The order of the polynomial
+
+    Returns:
+        np.ndarray: The design matrix (n, minPoints(order)), with the terms col^i * row^j ordered by degree i + j, then by falling i
+    """
+
+    (col, row) = (normalized[:, 0], normalized[:, 1])
+    return np.stack([col ** (degree - j) * row ** j for degree in range(order + 1) for j in range(degree + 1)], axis=1)
+
+def polynomialDerivatives(normalized: np.ndarray, order: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the derivatives of the terms of the polynomial for each point, by the normalized col and row
+
+    Args:
+        normalized (np.ndarray): The normalized pixel coordinates (n, 2)
+        order (int): The order of the polynomial
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The derivatives (n, minPoints(order)) by col and by row, in the order of polynomialTerms
+    """
+
+    (col, row) = (normalized[:, 0], normalized[:, 1])
+    zero = np.zeros_like(col)
+    byCol = []
+    byRow = []
+    for degree in range(order + 1):
+        for j in range(degree + 1):
+            i = degree - j
+            byCol.append(i * col ** (i - 1) * row ** j if i > 0 else zero)
+            byRow.append(j * col ** i * row ** (j - 1) if j > 0 else zero)
+    return (np.stack(byCol, axis=1), np.stack(byRow, axis=1))
@@ -0,0 +1,171 @@
+""" This module contains the content addressed cache of georeferenced files.
+
+Georeferencing the same image with the same points, crs and output options gives the same georeferenced file,
+so the file is stored once and shared by all projects georeferenced with that input.
+An entry in the georefcache table maps the hash of the input (the cache key) to the georeferenced file in file storage,
+and counts the projects using it. A file is only removed from file storage when no project uses it,
+and the entries no project uses are kept for reuse until they exceed the size limit of the cache.
+"""
+
+import asyncio
+import datetime
+import json
+from typing import Union
+import numpy as np
+from rasterio.crs import CRS
+
+#internal imports
+from ..models import GeorefCacheEntry, PointSet
+from ..storage.files.fileStorage import FileStorage
+from ..storage.data.storageHandler import StorageHandler
+from .httpCache import contentHash
+
+def georefCacheKey(imageHash: str, points: PointSet, crs: str, outputOptions: dict) -> str:
+    """Get the cache key of a georeference, the content hash of its input
+
+    The points are normalized to their coordinates in a fixed order, so the key does not depend on their ids, order, names or errors.
+
+    Args:
+        imageHash (str): The content hash of the image file
+        points (PointSet): The points
+        crs (str): The crs of the image
+        outputOptions (dict): The output options that change the georeferenced files
+
+    Returns:
+        str: The cache key
+    """
+
+    #the pixel coordinates are whole numbers, written as integers like the col and row of a Point
+    order = np.lexsort((points.lat, points.lng, points.row, points.col))
+    gcps = list(zip(points.col[order].astype(np.int64).tolist(), points.row[order].astype(np.int64).tolist(), points.lng[order].tolist(), points.lat[order].tolist()))
+    return contentHash(json.dumps([imageHash, gcps, CRS.from_string(crs).to_string(), outputOptions], sort_keys=True).encode())
+
+class GeorefCache:
+    """This class keeps the georeferenced files shared by projects, with reference counting and a size bounded eviction of unused files.
+
+    All changes to the reference counts are made while holding a lock, so an entry is never evicted between being looked up and being used.
+
+    Attributes:
+        maxBytes (int): The maximum total size of the files no project uses, the least recently used of them are removed above it
+        hits (int): Number of lookups that found a georeferenced file
+        misses (int): Number of lookups that did not find a georeferenced file
+        evictions (int): Number of unused georeferenced files removed to stay within maxBytes
+
+    Functions:
+        acquire(cacheKey: str) -> Union[GeorefCacheEntry, None]: Get the entry of a cache key and count one more project using it
+        store(cacheKey: str, entry: GeorefCacheEntry) -> Union[GeorefCacheEntry, None]: Add the georeferenced file of a project to the cache
+        release(georeferencedFilePath: str) -> bool: Count one project less using a georeferenced file
+        stats() -> dict: Get the cache counters
+    """
+
+    def __init__(self, fileStorage: FileStorage, storageHandler: StorageHandler, maxBytes: int = 1024 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._FileStorage = fileStorage
+        self._StorageHandler = storageHandler
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, cacheKey: str) -> Union[GeorefCacheEntry, None]:
+        """Get the entry of a cache key and count one more project using its georeferenced file
+
+        Args:
+            cacheKey (str): The cache key, see georefCacheKey
+
+        Returns:
+            Union[GeorefCacheEntry, None]: The entry, None if the input has not been georeferenced before
+        """
+
+        async with self._lock:
+            entry = await self._fetch({"cacheKey": cacheKey})
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry.refs += 1
+            entry.lastUsed = _now()
+            await self._StorageHandler.update(entry.id, entry, "georefcache")
+            return entry
+
+    async def store(self, cacheKey: str, entry: GeorefCacheEntry) -> Union[GeorefCacheEntry, None]:
+        """Add the georeferenced file of a project to the cache, counting the project as its first user
+
+        Args:
+            cacheKey (str): The cache key, see georefCacheKey
+            entry (GeorefCacheEntry): The georeferenced file, its id and reference count are set by the cache
+
+        Returns:
+            Union[GeorefCacheEntry, None]: The stored entry, None if the cache key was stored by another project in the meantime,
+                                           then the file stays owned by the project
+        """
+
+        async with self._lock:
+            entry.cacheKey = cacheKey
+            entry.refs = 1
+            entry.lastUsed = _now()
+            if await self._fetch({"cacheKey": cacheKey}) is not None:
+                return None
+            entry.id = await self._StorageHandler.saveInStorage(entry, "georefcache", "id")
+            if entry.id is None:
+                return None
+            return entry
+
+    async def release(self, georeferencedFilePath: str) -> bool:
+        """Count one project less using a georeferenced file, and evict unused files above the size limit
+
+        Args:
+            georeferencedFilePath (str): The path to the georeferenced file
+
+        Returns:
+            bool: True if the file is managed by the cache, False if it is not and the caller should remove it
+        """
+
+        async with self._lock:
+            entry = await self._fetch({"georeferencedFilePath": georeferencedFilePath})
+            if entry is None:
+                return False
+            entry.refs = max(entry.refs - 1, 0)
+            entry.lastUsed = _now()
+            await self._StorageHandler.update(entry.id, entry, "georefcache")
+            if entry.refs == 0:
+                await self._evict()
+            return True
+
+    def stats(self) -> dict:
+        """Get the cache counters
+
+        Returns:
+            dict: The number of hits, misses and evictions, and the size limit of the cache in bytes
+        """
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "maxBytes": self.maxBytes,
+        }
+
+    async def _evict(self) -> None:
+        # remove the least recently used unused files until the unused files fit in maxBytes, must be called with the lock held
+        unused = [GeorefCacheEntry.model_construct(None, **row) for row in (await self._StorageHandler.fetch("georefcache", {"refs": 0}) or [])]
+        unused.sort(key=lambda entry: str(entry.lastUsed))
+        size = sum(entry.size for entry in unused)
+        for entry in unused:
+            if size <= self.maxBytes:
+                break
+            await self._FileStorage.removeFile(entry.georeferencedFilePath)
+            if entry.mercatorFilePath:
+                await self._FileStorage.removeFile(entry.mercatorFilePath)
+            await self._StorageHandler.remove(entry.id, "georefcache")
+            size -= entry.size
+            self.evictions += 1
+
+    async def _fetch(self, params: dict) -> Union[GeorefCacheEntry, None]:
+        rows = await self._StorageHandler.fetch("georefcache", params)
+        if not rows:
+            return None
+        return GeorefCacheEntry.model_construct(None, **rows[0])
+
+def _now() -> str:
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
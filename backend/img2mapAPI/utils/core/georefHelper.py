@@ -3,32 +3,83 @@
 
 import os 
 import io 
-import tempfile
+import json
+import logging
+import threading
+import time
+import tracemalloc
 import warnings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Tuple, Union
 import numpy as np
 import rasterio as rio 
-from rasterio.transform import from_gcps 
+from rasterio.transform import Affine
 from rasterio.control import GroundControlPoint as GCP 
 from rasterio.crs import CRS 
 from rasterio.enums import Resampling 
+from rasterio.io import MemoryFile
+from rasterio.shutil import copy as rioCopy
+from rasterio.windows import Window, from_bounds
+from rasterio.errors import WindowError
+from rasterio.warp import transform_bounds, transform as transformPoints
+import morecantile
 from fastapi.responses import Response 
 from rio_tiler.io import Reader 
 from rio_tiler.errors import TileOutsideBounds 
 from PIL import Image 
 
 #internal imports
-from ..models import PointList 
-from .FileHelper import getUniqeFileName, removeFile 
+from ..models import PointList, PointSet
+from .FileHelper import getUniqeFileName, removeFile
+from .gcpFit import affineTransform
+
+logger = logging.getLogger(__name__)
 
 warnings.filterwarnings("ignore", category=rio.errors.NotGeoreferencedWarning) #ignore the not georeferenced warning
 
 defaultCrs = 'EPSG:4326'
-
-def createGcps(PointList : PointList):
+minTileZoom = 5 # tiles below this zoom level are always blank
+imageBands = [1, 2, 3] # the bands of the image georeferenced, the images are assumed to have 3 bands, any alpha channel is left out
+
+# Options for the georeferenced output file
+#   format: "COG" for a Cloud-Optimized GeoTIFF, "GTiff" for a striped GeoTIFF with overviews built afterwards
+#   blocksize: internal tile size of a COG, 256 or 512
+#   compress: DEFLATE, ZSTD, LZW, JPEG (RGB images only) or NONE
+#   quality: JPEG quality, only used with JPEG compression
+#   webMercator: also write a Web Mercator copy aligned to the map tile grid, used for rendering tiles without reprojection
+#   measureMemory: measure the peak memory use of georeferencing, reported in the raster information of the project
+#   memoryLimitMB: images that need more memory than this when decoded are georeferenced window by window, with the window buffers within this limit
+#   threads: number of threads reading windows and encoding blocks of a window by window georeference
+#   lazy: only place the image in a VRT file and warp the tiles from the image, the georeferenced file is written when it is downloaded
+#   proxy: first georeference a downsampled copy of the image for the map tiles, the full resolution file is georeferenced in the background
+#   proxySize: the long edge of the downsampled copy in pixels
+defaultOutputOptions: dict = {
+    "format": "COG",
+    "blocksize": 512,
+    "compress": "DEFLATE",
+    "quality": 85,
+    "webMercator": False,
+    "measureMemory": False,
+    "memoryLimitMB": 256,
+    "threads": 1,
+    "lazy": False,
+    "proxy": False,
+    "proxySize": 1024,
+}
+fileOptionKeys = ("format", "blocksize", "compress", "quality") # the options that change the georeferenced file itself
+
+_measureLock = threading.Lock()
+sequentialDrivers = ("PNG", "JPEG", "GIF") # formats decoded from the start of the file, their windows are read in order by one thread
+
+webMercatorTms = morecantile.tms.get("WebMercatorQuad")
+webMercatorExtent = 20037508.342789244 # half the width of the Web Mercator tile grid in meters
+
+def createGcps(points: Union[PointSet, PointList]):
     """Create Rasterio GCPs from a list of points
 
     Args:
-        PointList (PointList): The list of points
+        points (Union[PointSet, PointList]): The list of points
 
     Raises:
         Exception: Not enough points to create a transform
@@ -38,100 +89,601 @@ def createGcps(PointList : PointList):
         List[rasterio.control.GroundControlPoint]: The list of GCPs
     """
 
-    if len(PointList.points) < 3:
+    points = checkPoints(points)
+    return [
+        GCP(row=row, col=col, x=lng, y=lat, id=Idproj, info=f"Point {Idproj}")
+        for (Idproj, col, row, lng, lat) in zip(points.Idproj.tolist(), points.col.tolist(), points.row.tolist(), points.lng.tolist(), points.lat.tolist())
+    ]
+
+def pointTransform(points: Union[PointSet, PointList]) -> Affine:
+    """Get the transform from pixel to map coordinates of a list of points, fitted with least squares like rasterio.transform.from_gcps
+
+    The transform is computed from the arrays of the point set, no GCP object is made per point.
+
+    Args:
+        points (Union[PointSet, PointList]): The list of points
+
+    Raises:
+        Exception: Not enough points to create a transform
+        Exception: Points don't have Idproj
+
+    Returns:
+        Affine: The transform
+    """
+
+    return affineTransform(checkPoints(points))
+
+def checkPoints(points: Union[PointSet, PointList]) -> PointSet:
+    """Check that a list of points can place an image
+
+    Args:
+        points (Union[PointSet, PointList]): The list of points
+
+    Raises:
+        Exception: Not enough points to create a transform
+        Exception: Points don't have Idproj
+        Exception: Points don't have finite coordinates
+
+    Returns:
+        PointSet: The points as a point set
+    """
+
+    points = PointSet.of(points)
+    if len(points) < 3:
         raise Exception("Not enough points to create a transform")
-    if not PointList.points[0].Idproj:
+    if not points.Idproj.all():
         raise Exception("Points don't have Idproj")
+    if not points.isValid():
+        raise Exception("Points don't have finite coordinates, every point needs a lat, lng, col and row")
+    return points
+
+def georeferenceImage(imageBytes: bytes, points: Union[PointSet, PointList], crs: str = defaultCrs, outputOptions: dict = None) -> bytes:
+    """Georeference a PNG image in memory, from the image file bytes to the georeferenced file bytes
+
+    The image is not read into an array, GDAL streams it from the in-memory PNG through a virtual dataset that adds the transform and crs,
+    into the encoder of the output format, so the image is decoded once and encoded once.
+
+    Args:
+        imageBytes (bytes): The PNG image file
+        points (Union[PointSet, PointList]): The list of points
+        crs (str, optional): The crs of the image
+        outputOptions (dict, optional): Options for the output file, see defaultOutputOptions
+
+    Returns:
+        bytes: The georeferenced TIFF file
+    """
+
+    options = dict(defaultOutputOptions)
+    if outputOptions is not None:
+        options.update(outputOptions)
+
+    transform = pointTransform(points) #Affine transformation fitted to the points
+    bands = imageBands
+
+    with MemoryFile(imageBytes) as imageFile, MemoryFile() as outputFile:
+        writeGeoreferenced(virtualSource(imageFile.name, bands, transform, crs), outputFile.name, options, len(bands))
+        return outputFile.read()
+
+def virtualSource(imagePath: str, bands: list, transform: Affine, crs: str = defaultCrs) -> str:
+    """Get the GDAL connection string of a virtual dataset placing an image, with the bands, transform, crs and nodata of the georeferenced image
+
+    Args:
+        imagePath (str): The GDAL path to the image file
+        bands (list): The bands of the image to use
+        transform (Affine): The transform from pixel to map coordinates
+        crs (str, optional): The crs of the image
+
+    Returns:
+        str: The vrt:// connection string
+    """
+
+    return "vrt://{}?bands={}&a_srs={}&a_gt={}&a_nodata=0".format(
+        imagePath,
+        ",".join(str(band) for band in bands),
+        CRS.from_string(crs).to_wkt(),
+        ",".join(repr(value) for value in transform.to_gdal()),
+    )
+
+def writeGeoreferenced(source: str, outputPath: str, options: dict, bandCount: int) -> None:
+    """Write a georeferenced dataset to a georeferenced file in the output format, with the overviews needed for the map tiles
+
+    Args:
+        source (str): The GDAL path to the georeferenced dataset
+        outputPath (str): The path to write the georeferenced file to
+        options (dict): Options for the output file, see defaultOutputOptions
+        bandCount (int): The number of bands of the dataset
+    """
+
+    if options["format"].upper() == "COG":
+        #the COG driver writes the overviews and tiles in the order COG readers expect
+        rioCopy(source, outputPath, driver="COG", **cogCreationOptions(options, bandCount))
+    else:
+        rioCopy(source, outputPath, driver="GTiff")
+        with rio.open(outputPath, "r+") as dataset:
+            #TODO: dataset.gcps this breaks getting the bounds of the image
+            # dataset.gcps = (gcps, crs) 
+            overview_levels = [2, 4, 8, 16] #needed for generating the map tiles
+            dataset.build_overviews(overview_levels, Resampling.nearest)
+            dataset.update_tags(ns='rio_overview', resampling='nearest') 
+
+def georeferenceVrt(imagePath: str, points: Union[PointSet, PointList], crs: str = defaultCrs, gdalOptions: dict = None) -> bytes:
+    """Place an image with a list of points in a GDAL VRT file, without reading or writing any pixels
+
+    The VRT refers to the image file in storage and holds the transform and crs, GDAL warps the pixels of the image when a tile is read from it.
+
+    Args:
+        imagePath (str): The GDAL path to the image file, see FileStorage.gdalPath
+        points (Union[PointSet, PointList]): The list of points
+        crs (str, optional): The crs of the image
+        gdalOptions (dict, optional): The GDAL configuration options needed to read the image, see FileStorage.gdalOptions
+
+    Returns:
+        bytes: The VRT file
+    """
+
+    transform = pointTransform(points)
+    bands = imageBands
+    with rio.Env(**(gdalOptions or {})), MemoryFile(ext=".vrt") as vrtFile:
+        #only the header of the image is read, the VRT refers to the image file itself and not to the vrt:// connection string
+        rioCopy(virtualSource(imagePath, bands, transform, crs), vrtFile.name, driver="VRT")
+        return bytes(vrtFile.getbuffer())
+
+def georeferenceProxy(imagePath: str, points: Union[PointSet, PointList], crs: str = defaultCrs, maxSize: int = 1024, gdalOptions: dict = None) -> bytes:
+    """Georeference a downsampled copy of an image, with the same points as the full image
 
-    gcps = []  
-
-    for point in PointList.points:
-        description = f"Point {point.Idproj} at ({point.lat}, {point.lng})"
-
-        if point.error:
-            description += f" with error {point.error}"
-        if point.name:
-            description += f" with name {point.name}"
-        if point.description:
-            description += f" with description {point.description}"
-
-        gcps.append(
-            GCP(
-                row=point.row,
-                col=point.col,
-                x=point.lng,
-                y=point.lat,
-                id=point.Idproj,
-                info=description
-            )
-        )
-    return gcps
-
-def InitialGeoreferencePngImage(tempFilePath, points: PointList, crs: str = defaultCrs)->str:
-    """Georeference a PNG image with a list of points and a crs
-
-    Args:
-        tempFilePath(str): The path to the temporary file
-        points(PointList): The list of points
-        crs(str, optional): The crs of the image
-    
-    Returns:
-        str: The path to the georeferenced file
-    """ 
-
-    gcps = createGcps(points) 
-
-    filename = getUniqeFileName('.png')
-    with open(filename, "wb") as file:
-        file.write(open(tempFilePath, "rb").read())
-    
-    dataset = rio.open(tempFilePath, "r", driver="PNG")
-    bands = [1, 2, 3] # I assume that you have only 3 band i.e. no alpha channel in your PNG
-    data = dataset.read(bands)
-    
-    kwargs = {
-        "driver": "GTiff",
-        "width": data.shape[2], 
-        "height": data.shape[1],
-        "count": len(bands), 
-        "dtype": data.dtype, 
-        "nodata": 0,
+    GDAL decimates the image while it is decoded, so only the downsampled pixels are kept in memory,
+    and JPEG images are decoded at the reduced size directly. The copy is written uncompressed, as it is small and replaced soon.
+
+    Args:
+        imagePath (str): The GDAL path to the image file, see FileStorage.gdalPath
+        points (Union[PointSet, PointList]): The list of points, in pixel coordinates of the full image
+        crs (str, optional): The crs of the image
+        maxSize (int, optional): The long edge of the copy in pixels. Defaults to 1024.
+        gdalOptions (dict, optional): The GDAL configuration options needed to read the image, see FileStorage.gdalOptions
+
+    Returns:
+        bytes: The georeferenced TIFF file of the downsampled copy
+    """
+
+    bands = imageBands
+    with rio.Env(**(gdalOptions or {})), rio.open(imagePath) as source:
+        scale = max(source.width / maxSize, source.height / maxSize, 1)
+        width = max(round(source.width / scale), 1)
+        height = max(round(source.height / scale), 1)
+        data = source.read(bands, out_shape=(len(bands), height, width), resampling=Resampling.nearest)
+        #the pixels of the copy are larger, the points stay in pixel coordinates of the full image
+        transform = pointTransform(points) * Affine.scale(source.width / width, source.height / height)
+        profile = {
+            "driver": "GTiff",
+            "width": width,
+            "height": height,
+            "count": len(bands),
+            "dtype": source.dtypes[0],
+            "crs": CRS.from_string(crs),
+            "transform": transform,
+            "nodata": 0,
+            "tiled": True,
+        }
+
+    with MemoryFile() as outputFile:
+        with outputFile.open(**profile) as dataset:
+            dataset.write(data)
+            dataset.build_overviews([2, 4, 8], Resampling.nearest)
+        return bytes(outputFile.getbuffer())
+
+def materializeVrt(vrtBytes: bytes, outputOptions: dict = None, gdalOptions: dict = None) -> bytes:
+    """Write the georeferenced file of an image placed in a VRT file, see georeferenceVrt
+
+    Args:
+        vrtBytes (bytes): The VRT file
+        outputOptions (dict, optional): Options for the output file, see defaultOutputOptions
+        gdalOptions (dict, optional): The GDAL configuration options needed to read the image, see FileStorage.gdalOptions
+
+    Returns:
+        bytes: The georeferenced TIFF file
+    """
+
+    options = dict(defaultOutputOptions)
+    if outputOptions is not None:
+        options.update(outputOptions)
+
+    with rio.Env(**(gdalOptions or {})), MemoryFile(vrtBytes, ext=".vrt") as vrtFile, MemoryFile() as outputFile:
+        with rio.open(vrtFile.name) as dataset:
+            bandCount = dataset.count
+        writeGeoreferenced(vrtFile.name, outputFile.name, options, bandCount)
+        return outputFile.read()
+
+def updateGeoreference(tiffBytes: bytes, points: Union[PointSet, PointList], crs: str = defaultCrs) -> bytes:
+    """Georeference an already georeferenced TIFF again with a new list of points, by only rewriting its header
+
+    The pixel data and overviews are kept as they are, only the transform and crs in the header of the file are replaced.
+
+    Args:
+        tiffBytes (bytes): The georeferenced TIFF file
+        points (Union[PointSet, PointList]): The new list of points
+        crs (str, optional): The crs of the image
+
+    Returns:
+        bytes: The georeferenced TIFF file with the new header
+    """
+
+    transform = pointTransform(points)
+    with MemoryFile() as tiffFile:
+        #the file is copied into memory owned by GDAL, a MemoryFile made from bytes can not grow when the header is rewritten
+        tiffFile.write(tiffBytes)
+        #the header is rewritten in place, a COG stays readable but GDAL no longer reports it as a strict COG layout
+        with rio.open(tiffFile.name, "r+", IGNORE_COG_LAYOUT_BREAK="YES") as dataset:
+            dataset.transform = transform
+            dataset.crs = CRS.from_string(crs)
+        return bytes(tiffFile.getbuffer())
+
+def getImageMemorySize(imagePath: str, gdalOptions: dict = None) -> int:
+    """Get the memory needed to hold an image decoded, without decoding it
+
+    Args:
+        imagePath (str): The GDAL path to the image file, see FileStorage.gdalPath
+        gdalOptions (dict, optional): The GDAL configuration options needed to read the file, see FileStorage.gdalOptions
+
+    Returns:
+        int: The size of the pixel data of the image in bytes
+    """
+
+    with rio.Env(**(gdalOptions or {})), rio.open(imagePath) as dataset:
+        return dataset.width * dataset.height * sum(np.dtype(dtype).itemsize for dtype in dataset.dtypes)
+
+def getImageSize(imagePath: str, gdalOptions: dict = None) -> Tuple[int, int]:
+    """Get the size of an image from the header of the file, without decoding it
+
+    Args:
+        imagePath (str): The GDAL path to the image file, see FileStorage.gdalPath
+        gdalOptions (dict, optional): The GDAL configuration options needed to read the file, see FileStorage.gdalOptions
+
+    Returns:
+        Tuple[int, int]: The width and height of the image in pixels
+    """
+
+    with rio.Env(**(gdalOptions or {})), rio.open(imagePath) as dataset:
+        return (dataset.width, dataset.height)
+
+def georeferenceImageWindowed(imagePath: str, outputPath: str, points: Union[PointSet, PointList], crs: str = defaultCrs, outputOptions: dict = None,
+                              gdalOptions: dict = None, progress: Callable = None, cancelEvent: threading.Event = None) -> None:
+    """Georeference an image window by window, for images that do not fit in memory
+
+    The image is read in windows aligned to the internal tiles of the output, sized so the windows being processed stay within memoryLimitMB,
+    and written to a tiled GeoTIFF on disk. GDAL's block cache comes on top of the limit, it is shared by the process and sized with GDAL_CACHEMAX.
+    With more than one thread, windows of formats with random access are read in parallel, each thread with its own dataset handle,
+    while the calling thread writes them. GDAL releases the GIL while reading and encoding, so the threads run at the same time.
+    For a COG the tiled GeoTIFF is an uncompressed intermediate file, GDAL streams it into the COG, generating the overviews and
+    compressing the blocks with the same number of threads.
+
+    Args:
+        imagePath (str): The GDAL path to the image file, see FileStorage.gdalPath
+        outputPath (str): The path to write the georeferenced TIFF file to
+        points (Union[PointSet, PointList]): The list of points
+        crs (str, optional): The crs of the image
+        outputOptions (dict, optional): Options for the output file, see defaultOutputOptions
+        gdalOptions (dict, optional): The GDAL configuration options needed to read the image, see FileStorage.gdalOptions
+        progress (Callable, optional): Called with (windowsDone, windowsTotal) after each window is written
+        cancelEvent (threading.Event, optional): Georeferencing stops when this event is set
+
+    Raises:
+        Exception: Georeferencing was cancelled
+    """
+
+    options = dict(defaultOutputOptions)
+    if outputOptions is not None:
+        options.update(outputOptions)
+
+    transform = pointTransform(points) #Affine transformation fitted to the points
+    bands = imageBands
+    memoryLimit = int(options["memoryLimitMB"]) * 1024 * 1024
+    threads = max(int(options["threads"]), 1)
+    blocksize = int(options["blocksize"])
+    cog = options["format"].upper() == "COG"
+    tiledPath = getUniqeFileName('.tiff') if cog else outputPath
+
+    try:
+        with rio.Env(**(gdalOptions or {})):
+            with rio.open(imagePath) as source:
+                sequential = source.driver in sequentialDrivers
+                workers = 1 if sequential else threads
+                bytesPerPixel = len(bands) * np.dtype(source.dtypes[0]).itemsize
+                #the limit is shared by the windows being read and the window being written
+                windows = list(streamWindows(source.width, source.height, blocksize, bytesPerPixel, memoryLimit // (workers + 1), sequential))
+                profile = {
+                    "driver": "GTiff",
+                    "width": source.width,
+                    "height": source.height,
+                    "count": len(bands),
+                    "dtype": source.dtypes[0],
+                    "crs": CRS.from_string(crs),
+                    "transform": transform,
+                    "nodata": 0,
+                    "tiled": True,
+                    "blockxsize": blocksize,
+                    "blockysize": blocksize,
+                    "BIGTIFF": "IF_SAFER",
+                }
+
+                with rio.open(tiledPath, "w", **profile) as output:
+                    def write(index: int, window: Window, data: np.ndarray):
+                        output.write(data, window=window)
+                        if progress is not None:
+                            progress(index + 1, len(windows))
+
+                    if workers == 1:
+                        for (index, window) in enumerate(windows):
+                            _checkCancelled(cancelEvent)
+                            write(index, window, source.read(bands, window=window))
+                    else:
+                        readWindowsParallel(imagePath, bands, windows, workers, write, gdalOptions, cancelEvent)
+
+                    if not cog:
+                        overview_levels = [2, 4, 8, 16] #needed for generating the map tiles
+                        output.build_overviews(overview_levels, Resampling.nearest)
+                        output.update_tags(ns='rio_overview', resampling='nearest')
+
+            if cog:
+                _checkCancelled(cancelEvent)
+                creationOptions = cogCreationOptions(options, len(bands))
+                creationOptions["NUM_THREADS"] = threads
+                rioCopy(tiledPath, outputPath, driver="COG", **creationOptions)
+    finally:
+        if cog:
+            removeFile(tiledPath)
+
+def streamWindows(width: int, height: int, blocksize: int, bytesPerPixel: int, windowBytes: int, fullRows: bool = False):
+    """Split an image in windows of at most windowBytes, aligned to blocks of blocksize
+
+    Windows span whole rows when a strip of blocksize rows fits in windowBytes, or when fullRows is set,
+    otherwise the rows are split in columns too.
+
+    Args:
+        width (int): The width of the image
+        height (int): The height of the image
+        blocksize (int): The size of the internal tiles of the output
+        bytesPerPixel (int): The size of a pixel of all bands in bytes
+        windowBytes (int): The maximum size of a window in bytes
+        fullRows (bool, optional): Always use windows spanning whole rows, for formats that are decoded row by row
+
+    Yields:
+        Window: The windows, row by row
+    """
+
+    windowWidth = width
+    if not fullRows and width * blocksize * bytesPerPixel > windowBytes:
+        windowWidth = max(windowBytes // (blocksize * bytesPerPixel) // blocksize, 1) * blocksize
+    windowHeight = max(windowBytes // (windowWidth * bytesPerPixel), 1)
+    if windowHeight >= blocksize:
+        windowHeight = windowHeight // blocksize * blocksize
+    for row in range(0, height, windowHeight):
+        for col in range(0, width, windowWidth):
+            yield Window(col, row, min(windowWidth, width - col), min(windowHeight, height - row))
+
+def readWindowsParallel(imagePath: str, bands: list, windows: list, workers: int, write: Callable, gdalOptions: dict = None, cancelEvent: threading.Event = None) -> None:
+    """Read windows of an image in parallel and pass them to write in order, with at most workers windows read ahead
+
+    Args:
+        imagePath (str): The GDAL path to the image file
+        bands (list): The bands to read
+        windows (list): The windows to read
+        workers (int): The number of threads reading windows
+        write (Callable): Called with (index, window, data) for each window, in the calling thread
+        gdalOptions (dict, optional): The GDAL configuration options needed to read the file, see FileStorage.gdalOptions
+        cancelEvent (threading.Event, optional): Reading stops when this event is set
+
+    Raises:
+        Exception: Georeferencing was cancelled
+    """
+
+    local = threading.local()
+    datasets = []
+    datasetsLock = threading.Lock()
+    gdalOptions = gdalOptions or {}
+
+    def read(window: Window) -> np.ndarray:
+        # rasterio datasets can not be shared between threads, so each worker opens its own dataset
+        dataset = getattr(local, "dataset", None)
+        if dataset is None:
+            with rio.Env(**gdalOptions):
+                dataset = rio.open(imagePath)
+            local.dataset = dataset
+            with datasetsLock:
+                datasets.append(dataset)
+        with rio.Env(**gdalOptions):
+            return dataset.read(bands, window=window)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="georefWindow") as pool:
+            pending = deque()
+            for (index, window) in enumerate(windows):
+                _checkCancelled(cancelEvent)
+                pending.append((index, window, pool.submit(read, window)))
+                if len(pending) >= workers:
+                    (doneIndex, doneWindow, future) = pending.popleft()
+                    write(doneIndex, doneWindow, future.result())
+            while pending:
+                _checkCancelled(cancelEvent)
+                (doneIndex, doneWindow, future) = pending.popleft()
+                write(doneIndex, doneWindow, future.result())
+    finally:
+        with datasetsLock:
+            for dataset in datasets:
+                dataset.close()
+
+def _checkCancelled(cancelEvent: Union[threading.Event, None]) -> None:
+    if cancelEvent is not None and cancelEvent.is_set():
+        raise Exception("Georeferencing was cancelled")
+
+def runMeasured(measureMemory: bool, function: Callable, *args) -> Tuple[any, dict]:
+    """Run a function and measure its duration, and optionally its peak memory use
+
+    Peak memory is measured with tracemalloc, it covers memory allocated by Python, like arrays and file bytes, but not memory allocated inside GDAL.
+    tracemalloc traces the whole process, so measured runs are done one at a time.
+
+    Args:
+        measureMemory (bool): If the peak memory use should be measured
+        function (Callable): The function to run
+        *args: The arguments to the function
+
+    Returns:
+        Tuple[any, dict]: The return value of the function, and the seconds and peakMemoryBytes (None if not measured) of the run
+    """
+
+    if not measureMemory:
+        start = time.perf_counter()
+        result = function(*args)
+        return (result, {"seconds": round(time.perf_counter() - start, 3), "peakMemoryBytes": None})
+
+    with _measureLock:
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            result = function(*args)
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+    return (result, {"seconds": round(time.perf_counter() - start, 3), "peakMemoryBytes": peak})
+
+def cogCreationOptions(options: dict, bandCount: int) -> dict:
+    """Get the GDAL creation options for writing a COG
+
+    The overviews are generated by GDAL until the smallest one fits in one internal tile, so the number of overviews follows the size of the image.
+
+    Args:
+        options (dict): Options for the output file, see defaultOutputOptions
+        bandCount (int): The number of bands in the image
+
+    Raises:
+        Exception: JPEG compression is only supported for RGB images
+
+    Returns:
+        dict: The creation options for the COG driver
+    """
+
+    compress = str(options["compress"]).upper()
+    creationOptions = {
+        "BLOCKSIZE": int(options["blocksize"]),
+        "COMPRESS": compress,
+        "OVERVIEWS": "AUTO",
+        "OVERVIEW_RESAMPLING": "NEAREST",
+        "BIGTIFF": "IF_SAFER",
+        "NUM_THREADS": "ALL_CPUS",
     }
-    
-    path = getUniqeFileName('.tiff') 
+    if compress in ("DEFLATE", "ZSTD", "LZW"):
+        creationOptions["PREDICTOR"] = "YES"
+    elif compress == "JPEG":
+        if bandCount != 3:
+            raise Exception("JPEG compression is only supported for RGB images")
+        creationOptions["QUALITY"] = int(options["quality"])
+    return creationOptions
+
+def reprojectToWebMercator(tiffBytes: bytes, outputOptions: dict = None) -> bytes:
+    """Make a Web Mercator copy of a georeferenced TIFF, as a COG aligned to the map tile grid
+
+    GDAL picks the zoom level closest to the resolution of the image, and snaps the copy to the tiles of that zoom level,
+    so the internal tiles and overviews of the copy are the map tiles, and tiles can be read without reprojection.
+
+    Args:
+        tiffBytes (bytes): The georeferenced TIFF file
+        outputOptions (dict, optional): Options for the output file, see defaultOutputOptions
+
+    Returns:
+        bytes: The Web Mercator copy
+    """
+
+    options = dict(defaultOutputOptions)
+    if outputOptions is not None:
+        options.update(outputOptions)
+
+    with MemoryFile(tiffBytes) as tiffFile, tiffFile.open() as dataset, MemoryFile() as outputFile:
+        creationOptions = cogCreationOptions(options, dataset.count)
+        del creationOptions["BLOCKSIZE"] # the tile size of the tiling scheme is used
+        creationOptions["TILING_SCHEME"] = "GoogleMapsCompatible"
+        creationOptions["WARP_RESAMPLING"] = "NEAREST"
+        rioCopy(dataset, outputFile.name, driver="COG", **creationOptions)
+        return outputFile.read()
+
+def getRasterInfo(tiffBytes: bytes, gdalOptions: dict = None) -> dict:
+    """Get information about a georeferenced TIFF, to store with the project at georeference time
+
+    Args:
+        tiffBytes (bytes): The georeferenced TIFF file, or a VRT file made by georeferenceVrt
+        gdalOptions (dict, optional): The GDAL configuration options needed to read the image a VRT file refers to, see FileStorage.gdalOptions
+
+    Returns:
+        dict: The footprint of the image, as bounds [west, south, east, north] in longitude and latitude,
+              as mercatorBounds [minx, miny, maxx, maxy] in Web Mercator meters, and as coordinates [west, north, east, south] in the crs of the image
+              like getImageCoordinates, and the width, height, band count, data type, crs, transform (a, b, c, d, e, f) and overview levels of the file
+    """
+
+    with rio.Env(**(gdalOptions or {})), MemoryFile(tiffBytes) as tiffFile, tiffFile.open() as dataset:
+        bounds = transform_bounds(dataset.crs, "EPSG:4326", *dataset.bounds, densify_pts=21)
+        mercatorBounds = transform_bounds(dataset.crs, "EPSG:3857", *dataset.bounds, densify_pts=21)
+        return {
+            "bounds": list(bounds),
+            "mercatorBounds": list(mercatorBounds),
+            "coordinates": [dataset.bounds.left, dataset.bounds.top, dataset.bounds.right, dataset.bounds.bottom],
+            "width": dataset.width,
+            "height": dataset.height,
+            "count": dataset.count,
+            "dtype": dataset.dtypes[0],
+            "crs": dataset.crs.to_string(),
+            "transform": list(dataset.transform)[:6],
+            "overviews": dataset.overviews(1),
+        }
+
+def parseRasterInfo(rasterInfo: Union[str, None]) -> Union[dict, None]:
+    """Parse the raster information stored with a project
+
+    Args:
+        rasterInfo (Union[str, None]): The raster information as JSON, see getRasterInfo
 
-    produced_file = rio.open(path, "w+", **kwargs)
-    produced_file.write(data, indexes=bands)
-    produced_file.close()
-   
-    dataset = rio.open(path, "r+") 
-    transform = from_gcps(gcps) #Affine transformation returned from the GCPs
-    dataset.transform = transform 
-    dataset.crs = CRS.from_string(crs) 
+    Returns:
+        Union[dict, None]: The raster information, None if the project has none
+    """
+
+    if not rasterInfo:
+        return None
+    return json.loads(rasterInfo)
+
+def tileIntersects(mercatorBounds: list, x: int, y: int, z: int) -> bool:
+    """Check if a map tile intersects the footprint of an image, without opening the image
 
-    #TODO: dataset.gcps this breaks getting the bounds of the image
-    # dataset.gcps = (gcps, crs) 
+    Args:
+        mercatorBounds (list): The footprint of the image, [minx, miny, maxx, maxy] in Web Mercator meters
+        x (int): column index of the tile.
+        y (int): row index of the tile.
+        z (int): Zoom level of the tile.
 
-    overview_levels = [2, 4, 8, 16] #needed for generating the map tiles
-    dataset.build_overviews(overview_levels, Resampling.nearest)
-    dataset.update_tags(ns='rio_overview', resampling='nearest') 
-    dataset.close()
+    Returns:
+        bool: True if the tile intersects the footprint
+    """
 
-    removeFile(filename) 
-    return path
+    size = 2 * webMercatorExtent / (1 << z)
+    left = -webMercatorExtent + x * size
+    top = webMercatorExtent - y * size
+    (minx, miny, maxx, maxy) = mercatorBounds
+    return left < maxx and left + size > minx and top > miny and top - size < maxy
 
-def getImageCoordinates(tiff_path):
+def getImageCoordinates(tiff_path, gdalOptions: dict = None):
     """
     Get the Image coordinates (longitude, latitude) of a georeferenced TIFF.
 
     Args:
-        tiff_path: Path to the georeferenced TIFF file.
+        tiff_path: Path to the georeferenced TIFF file, or a GDAL virtual file system path.
+        gdalOptions (dict, optional): GDAL configuration options needed to open the path.
 
     Returns:
         [west, north, east south]: A list of corner coordinates in the order.
     """
 
-    with rio.open(tiff_path) as dataset:
+    with rio.Env(**(gdalOptions or {})), rio.open(tiff_path) as dataset:
         bounds = dataset.bounds
 
         # get west, south, east, north coordinates
@@ -144,50 +696,199 @@ def getImageCoordinates(tiff_path):
 
 
 
-async def generateTile(tiff_bytes: bytes, x: int, y: int, z: int):
-    """Generate a tile image from a georeferenced TIFF file.
+def previewGeoreference(affine: list, width: int, height: int, crs: str = defaultCrs) -> dict:
+    """Get where an image will be placed by a transform, without making the georeferenced file
+
+    Args:
+        affine (list): The transform from pixel to map coordinates (a, b, c, d, e, f), x = a*col + b*row + c and y = d*col + e*row + f
+        width (int): The width of the image in pixels
+        height (int): The height of the image in pixels
+        crs (str, optional): The crs of the map coordinates
+
+    Returns:
+        dict: The transform, the corners of the image [x, y] in the crs (top left, top right, bottom right, bottom left),
+              the bounds [west, north, east, south] in the crs like getImageCoordinates, the world file and a GeoJSON footprint in longitude and latitude
+    """
+
+    transform = Affine(*affine)
+    corners = [transform * (col, row) for (col, row) in ((0, 0), (width, 0), (width, height), (0, height))]
+    (xs, ys) = zip(*corners)
+    if CRS.from_string(crs) != CRS.from_epsg(4326):
+        (lngs, lats) = transformPoints(crs, "EPSG:4326", xs, ys)
+    else:
+        (lngs, lats) = (xs, ys)
+    ring = [[lng, lat] for (lng, lat) in zip(lngs, lats)]
+    return {
+        "width": width,
+        "height": height,
+        "crs": crs,
+        "transform": list(affine),
+        "corners": [[x, y] for (x, y) in corners],
+        "bounds": [min(xs), max(ys), max(xs), min(ys)],
+        "worldFile": worldFile(transform),
+        "geojson": {
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [ring + [ring[0]]]},
+            "properties": {"width": width, "height": height, "crs": crs},
+        },
+    }
+
+def worldFile(transform: Affine) -> str:
+    """Get the world file (.pgw for a PNG) of a transform
+
+    A world file places the center of the top left pixel, while the transform places its top left corner.
 
     Args:
-        tiff_bytes (bytes): TIFF file as bytes.
+        transform (Affine): The transform from pixel to map coordinates
+
+    Returns:
+        str: The six lines of the world file
+    """
+
+    (x, y) = transform * (0.5, 0.5)
+    return "\n".join(repr(value) for value in (transform.a, transform.d, transform.b, transform.e, x, y)) + "\n"
+
+def renderTile(src: Reader, x: int, y: int, z: int) -> Union[bytes, None]:
+    """Render a tile from an open rio-tiler Reader.
+
+    Args:
+        src (Reader): The open reader of the georeferenced image.
         x (int): column index of the tile.
         y (int): row index of the tile.
         z (int): Zoom level of the tile.
 
-    Raises:
-        e: Unhandled exception from rio-tiler.
+    Returns:
+        Union[bytes, None]: the tile image as PNG bytes, None if the tile is outside the image.
+    """
+
+    try:
+        tile, mask = src.tile(x, y, z)
+    except TileOutsideBounds:
+        return None
+    if not mask.any():
+        return None
+    return encodeTile(tile, mask)
+
+def renderMercatorTile(src: Reader, x: int, y: int, z: int, tileSize: int = 256) -> Union[bytes, None]:
+    """Render a tile from an open Web Mercator copy, see reprojectToWebMercator.
+
+    The copy is aligned to the tile grid, so the tile is a windowed read, and GDAL reads from the overview matching the zoom level.
+
+    Args:
+        src (Reader): The open reader of the Web Mercator copy.
+        x (int): column index of the tile.
+        y (int): row index of the tile.
+        z (int): Zoom level of the tile.
+        tileSize (int, optional): The width and height of the tile in pixels.
+
+    Returns:
+        Union[bytes, None]: the tile image as PNG bytes, None if the tile is outside the image.
+    """
+
+    dataset = src.dataset
+    window = from_bounds(*webMercatorTms.xy_bounds(x, y, z), transform=dataset.transform)
+    try:
+        clipped = window.intersection(Window(0, 0, dataset.width, dataset.height))
+    except WindowError:
+        return None
+
+    #the part of the tile covered by the image, in tile pixels
+    scaleX = tileSize / window.width
+    scaleY = tileSize / window.height
+    left = int(round((clipped.col_off - window.col_off) * scaleX))
+    top = int(round((clipped.row_off - window.row_off) * scaleY))
+    width = min(int(round(clipped.width * scaleX)), tileSize - left)
+    height = min(int(round(clipped.height * scaleY)), tileSize - top)
+    if width <= 0 or height <= 0:
+        return None
+
+    data = dataset.read(window=clipped, out_shape=(dataset.count, height, width), resampling=Resampling.nearest)
+    mask = dataset.dataset_mask(window=clipped, out_shape=(height, width), resampling=Resampling.nearest)
+    if not mask.any():
+        return None
+    tile = np.zeros((dataset.count, tileSize, tileSize), dtype=data.dtype)
+    tileMask = np.zeros((tileSize, tileSize), dtype=np.uint8)
+    tile[:, top:top + height, left:left + width] = data
+    tileMask[top:top + height, left:left + width] = mask
+    return encodeTile(tile, tileMask)
+
+def encodeTile(tile: np.ndarray, mask: np.ndarray) -> bytes:
+    """Encode tile data and its mask as an RGBA PNG.
+
+    Args:
+        tile (np.ndarray): The tile data, with the bands first.
+        mask (np.ndarray): The mask of the tile, 0 where the tile is empty.
 
     Returns:
-        bytes: the tile image as bytes.
+        bytes: the tile image as PNG bytes.
+    """
+
+    tile = np.moveaxis(tile, 0, -1)
+    mask = np.expand_dims(mask, axis=-1)
+    data = np.concatenate((tile, mask), axis=-1)
+
+    img = Image.fromarray(data, 'RGBA')
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format='PNG')
+    return img_byte_arr.getvalue()
+
+def blankTile() -> bytes:
+    """Create a transparent 256x256 tile.
+
+    Returns:
+        bytes: the blank tile as PNG bytes.
     """
 
     blank_tile = Image.new('RGBA', (256, 256), (255, 255, 255, 0))
     bytes_io = io.BytesIO()
     blank_tile.save(bytes_io, format='PNG')
-    blank_tile_bytes = bytes_io.getvalue()
+    return bytes_io.getvalue()
+
+emptyTile: bytes = blankTile() # encoded once, served for every tile outside an image
+
+def generateTile(src: Reader, x: int, y: int, z: int) -> bytes:
+    """Generate a tile image from an open georeferenced image.
+
+    Args:
+        src (Reader): The open reader of the georeferenced image.
+        x (int): column index of the tile.
+        y (int): row index of the tile.
+        z (int): Zoom level of the tile.
 
-    temp_path = None
+    Raises:
+        e: Unhandled exception from rio-tiler.
 
-    MAX_ZOOM = 5
-    if z < MAX_ZOOM:
-        return (blank_tile_bytes, temp_path)
+    Returns:
+        bytes: the tile image as bytes, a blank tile if the tile is outside the image.
+    """
+
+    if z < minTileZoom:
+        return emptyTile
     try:
-        with tempfile.NamedTemporaryFile(delete=False) as temp:
-            temp.write(tiff_bytes)
-            temp_path = temp.name
-        with Reader(temp_path) as src:
-                tile, mask = src.tile(x, y, z) 
-                tile = np.moveaxis(tile, 0, -1)  
-                mask = np.expand_dims(mask, axis=-1)  
-                data = np.concatenate((tile, mask), axis=-1)
-                
-                img = Image.fromarray(data, 'RGBA')
-                img_byte_arr = io.BytesIO()
-                img.save(img_byte_arr, format='PNG')
-                img_byte_arr.seek(0)
-
-        return (img_byte_arr.getvalue(), temp_path)
-    except TileOutsideBounds:
-        return (blank_tile_bytes, temp_path)
-    except Exception as e:
-        print(e)
-        raise e
+        tile = renderTile(src, x, y, z)
+    except Exception:
+        logger.exception("Tile %s/%s/%s could not be rendered from %s", z, x, y, src.input)
+        raise
+    if tile is None:
+        tile = emptyTile
+    return tile
+
+def generateMercatorTile(src: Reader, x: int, y: int, z: int) -> bytes:
+    """Generate a tile image from an open Web Mercator copy of a georeferenced image.
+
+    Args:
+        src (Reader): The open reader of the Web Mercator copy.
+        x (int): column index of the tile.
+        y (int): row index of the tile.
+        z (int): Zoom level of the tile.
+
+    Returns:
+        bytes: the tile image as bytes, a blank tile if the tile is outside the image.
+    """
+
+    if z < minTileZoom:
+        return emptyTile
+    tile = renderMercatorTile(src, x, y, z)
+    if tile is None:
+        tile = emptyTile
+    return tile
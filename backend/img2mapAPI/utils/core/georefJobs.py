@@ -0,0 +1,216 @@
+""" This module contains the queue for asynchronous georeferencing jobs.
+
+A job moves through the statuses:
+    - queued: Waiting for a free worker
+    - running: Being georeferenced
+    - done: The georeferenced file is saved to the project
+    - failed: Georeferencing raised an error
+    - cancelled: Superseded by a newer job, or the points of the project changed
+"""
+
+import asyncio
+import datetime
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Union
+
+activeStatuses = ("queued", "running")
+
+class GeorefJob:
+    """A georeferencing job of a project.
+
+    Attributes:
+        id (str): The id of the job
+        projectId (int): The id of the project
+        key (str): Identifies the input of the job, jobs with the same key give the same result
+        status (str): queued, running, done, failed or cancelled
+        error (Union[str, None]): The error message of a failed or cancelled job
+        result (Union[str, None]): The content hash of the georeferenced file of a finished job
+        created (float): The time the job was submitted
+        started (Union[float, None]): The time the job started running
+        finished (Union[float, None]): The time the job finished
+        cancelEvent (threading.Event): Set when the job is cancelled
+        progress (Union[float, None]): The part of the image georeferenced so far, from 0 to 1, only reported for images georeferenced window by window
+    """
+
+    def __init__(self, projectId: int, key: str):
+        self.id = uuid.uuid4().hex
+        self.projectId = projectId
+        self.key = key
+        self.status = "queued"
+        self.error = None
+        self.result = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancelEvent = threading.Event()
+        self.progress = None
+        self._task: asyncio.Task = None
+
+    def toDict(self) -> dict:
+        """Get the status of the job
+
+        Returns:
+            dict: The id, project id, status, progress, error, timestamps and the seconds spent queued and running
+        """
+
+        now = time.time()
+        return {
+            "id": self.id,
+            "projectId": self.projectId,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "result": self.result,
+            "created": _isoTime(self.created),
+            "started": _isoTime(self.started),
+            "finished": _isoTime(self.finished),
+            "queuedSeconds": round((self.started or self.finished or now) - self.created, 3),
+            "runSeconds": round((self.finished or now) - self.started, 3) if self.started is not None else None,
+        }
+
+    def setProgress(self, done: int, total: int) -> None:
+        """Set the progress of the job, can be called from any thread
+
+        Args:
+            done (int): The number of finished steps
+            total (int): The total number of steps
+        """
+
+        self.progress = round(done / total, 3) if total else None
+
+class GeorefJobQueue:
+    """This class runs georeferencing jobs in the background, with a bounded number of jobs running at once.
+
+    One job per project is active at a time. Submitting a job with the same key as the active job of the project returns the active job,
+    submitting a job with a different key cancels the active job, as its result would be replaced anyway.
+    Finished jobs are kept so their status can be polled, up to maxHistory jobs.
+
+    Attributes:
+        workers (int): The maximum number of jobs running at once
+        maxHistory (int): The maximum number of finished jobs kept
+
+    Functions:
+        submit(projectId: int, key: str, runner: Callable) -> GeorefJob: Submit a job, or get the identical active job
+        get(jobId: str) -> Union[GeorefJob, None]: Get a job by id
+        cancelProject(projectId: int, reason: str) -> int: Cancel the active job of a project
+        stats() -> dict: Get the number of jobs per status
+    """
+
+    def __init__(self, workers: int = 2, maxHistory: int = 1000):
+        self.workers = workers
+        self.maxHistory = maxHistory
+        self._semaphore: asyncio.Semaphore = None
+        self._jobs: OrderedDict = OrderedDict() # jobId -> GeorefJob, in submit order
+        self._active: dict = {} # projectId -> GeorefJob
+
+    def submit(self, projectId: int, key: str, runner: Callable) -> GeorefJob:
+        """Submit a job, or get the identical active job of the project, must be called from the event loop
+
+        Args:
+            projectId (int): The id of the project
+            key (str): Identifies the input of the job
+            runner (Callable): Coroutine function doing the work, called with the cancelEvent and setProgress of the job, returns the result of the job
+
+        Returns:
+            GeorefJob: The submitted job, or the active job with the same key
+        """
+
+        active = self._active.get(projectId)
+        if active is not None and active.status in activeStatuses:
+            if active.key == key:
+                return active
+            self._cancel(active, "Superseded by a newer job")
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+
+        job = GeorefJob(projectId, key)
+        self._jobs[job.id] = job
+        self._active[projectId] = job
+        job._task = asyncio.get_running_loop().create_task(self._run(job, runner))
+        self._trimHistory()
+        return job
+
+    def get(self, jobId: str) -> Union[GeorefJob, None]:
+        """Get a job by id
+
+        Args:
+            jobId (str): The id of the job
+
+        Returns:
+            Union[GeorefJob, None]: The job, None if there is no job with the id
+        """
+
+        return self._jobs.get(jobId)
+
+    def cancelProject(self, projectId: int, reason: str = "Cancelled") -> int:
+        """Cancel the active job of a project, called when the input of the job changes
+
+        Args:
+            projectId (int): The id of the project
+            reason (str, optional): The reason, reported as the error of the job
+
+        Returns:
+            int: The number of cancelled jobs
+        """
+
+        active = self._active.get(projectId)
+        if active is None or active.status not in activeStatuses:
+            return 0
+        self._cancel(active, reason)
+        return 1
+
+    def stats(self) -> dict:
+        """Get the number of jobs per status
+
+        Returns:
+            dict: The number of workers and the number of kept jobs per status
+        """
+
+        ret = {"workers": self.workers, "queued": 0, "running": 0, "done": 0, "failed": 0, "cancelled": 0}
+        for job in self._jobs.values():
+            ret[job.status] += 1
+        return ret
+
+    def _cancel(self, job: GeorefJob, reason: str) -> None:
+        # a running job is stopped before its result is saved, a queued job is stopped before it starts
+        job.cancelEvent.set()
+        job.status = "cancelled"
+        job.error = reason
+        job.finished = time.time()
+        if self._active.get(job.projectId) is job:
+            del self._active[job.projectId]
+
+    async def _run(self, job: GeorefJob, runner: Callable) -> None:
+        async with self._semaphore:
+            if job.cancelEvent.is_set():
+                return
+            job.status = "running"
+            job.started = time.time()
+            try:
+                result = await runner(job.cancelEvent, job.setProgress)
+                if not job.cancelEvent.is_set():
+                    job.result = result
+                    job.status = "done"
+            except Exception as e:
+                if not job.cancelEvent.is_set():
+                    job.status = "failed"
+                    job.error = str(e)
+            finally:
+                if job.finished is None:
+                    job.finished = time.time()
+                if self._active.get(job.projectId) is job:
+                    del self._active[job.projectId]
+
+    def _trimHistory(self) -> None:
+        # forget the oldest finished jobs above maxHistory
+        finished = [jobId for (jobId, job) in self._jobs.items() if job.status not in activeStatuses]
+        for jobId in finished[:max(len(finished) - self.maxHistory, 0)]:
+            del self._jobs[jobId]
+
+def _isoTime(timestamp: Union[float, None]) -> Union[str, None]:
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
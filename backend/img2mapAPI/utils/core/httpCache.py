@@ -0,0 +1,120 @@
+""" This module contains functions for HTTP caching of files and tiles, with ETag and Last-Modified validators.
+"""
+
+import datetime
+import hashlib
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Union
+
+immutableCacheControl = "public, max-age=31536000, immutable" # for versioned URLs, the content of the URL never changes
+revalidateCacheControl = "no-cache" # for unversioned URLs, the client may store the response but must revalidate it
+
+def contentHash(data: bytes) -> str:
+    """Get the content hash of a file, used as its version
+
+    Args:
+        data (bytes): The file data
+
+    Returns:
+        str: The SHA-256 hash of the data as a hex string
+    """
+
+    return hashlib.sha256(data).hexdigest()
+
+def makeETag(*parts) -> str:
+    """Make a strong ETag from the parts identifying a response
+
+    Args:
+        *parts: The parts identifying the response, like a content hash and tile coordinates
+
+    Returns:
+        str: The quoted ETag
+    """
+
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+def etagMatches(ifNoneMatch: Union[str, None], etag: str) -> bool:
+    """Check if an If-None-Match header matches an ETag
+
+    Args:
+        ifNoneMatch (Union[str, None]): The value of the If-None-Match header
+        etag (str): The current ETag of the response
+
+    Returns:
+        bool: True if the client already has the current response
+    """
+
+    if not ifNoneMatch:
+        return False
+    for tag in ifNoneMatch.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+def toHttpDate(timestamp: Union[str, datetime.datetime, None]) -> Union[str, None]:
+    """Format a stored timestamp as an HTTP date
+
+    Args:
+        timestamp (Union[str, datetime.datetime, None]): The timestamp, a datetime or a "%Y-%m-%d %H:%M:%S" string in local time
+
+    Returns:
+        Union[str, None]: The HTTP date, None if there is no valid timestamp
+    """
+
+    if timestamp is None or timestamp == "":
+        return None
+    try:
+        if isinstance(timestamp, str):
+            timestamp = datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.astimezone() # stored in local time
+        return format_datetime(timestamp.astimezone(datetime.timezone.utc), usegmt=True)
+    except (ValueError, TypeError):
+        return None
+
+def notModified(etag: str, lastModified: Union[str, None], ifNoneMatch: Union[str, None], ifModifiedSince: Union[str, None]) -> bool:
+    """Check the conditional request headers against the current validators of a response
+
+    If-None-Match takes precedence, If-Modified-Since is only used when the client sent no If-None-Match.
+
+    Args:
+        etag (str): The current ETag of the response
+        lastModified (Union[str, None]): The current Last-Modified HTTP date of the response
+        ifNoneMatch (Union[str, None]): The value of the If-None-Match header
+        ifModifiedSince (Union[str, None]): The value of the If-Modified-Since header
+
+    Returns:
+        bool: True if a 304 Not Modified response should be sent
+    """
+
+    if ifNoneMatch:
+        return etagMatches(ifNoneMatch, etag)
+    if ifModifiedSince and lastModified:
+        try:
+            return parsedate_to_datetime(lastModified) <= parsedate_to_datetime(ifModifiedSince)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def cacheHeaders(etag: str, lastModified: Union[str, None] = None, immutable: bool = False) -> dict:
+    """Get the caching headers of a response
+
+    Args:
+        etag (str): The ETag of the response
+        lastModified (Union[str, None], optional): The Last-Modified HTTP date of the response
+        immutable (bool, optional): True if the URL is versioned, so the response can be cached for a long time
+
+    Returns:
+        dict: The ETag, Last-Modified and Cache-Control headers
+    """
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": immutableCacheControl if immutable else revalidateCacheControl,
+    }
+    if lastModified is not None:
+        headers["Last-Modified"] = lastModified
+    return headers
@@ -0,0 +1,330 @@
+""" This module contains the disk cache of uploaded .pdf files.
+
+A .pdf file is uploaded once and kept on disk under the content hash of the file, its handle.
+The number of pages, the size of each page and a small image of each page are read once, when the file is added,
+and kept next to the file, so the pages can be listed, previewed and converted by the handle without uploading or parsing the file again.
+Each file is stored in its own folder:
+    <folder>/<handle>/document.pdf: The .pdf file
+    <folder>/<handle>/inventory.json: The name of the file, the number of pages and the size of each page
+    <folder>/<handle>/page-<n>.png: The small image of page n
+    <folder>/<handle>/render-<n>-<options>.png: Page n rendered with the options, kept as a server-side handle to the image
+The least recently used files are removed when the files in the cache exceed the size limit, except files being added or rendered from.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+from typing import List, Union
+from fastapi import UploadFile
+
+#internal imports
+from .ImageHelper import pdfInventory, pdfThumbnailFiles
+from .taskExecutor import TaskExecutor
+
+class PdfCache:
+    """This class keeps uploaded .pdf files on disk by the content hash of the file, with their page inventory and thumbnails.
+
+    Attributes:
+        folder (str): The folder of the cache
+        maxBytes (int): The maximum total size of the cached files, the least recently used files are removed above it
+        thumbnailSize (int): The long edge of the thumbnails in pixels
+        threads (int): The number of pdftoppm processes rendering the thumbnails of a file at once
+        hits (int): Number of uploads of a file that was already in the cache
+        misses (int): Number of uploads that added a file to the cache
+        evictions (int): Number of files removed to stay within maxBytes
+
+    Functions:
+        add(file: UploadFile) -> dict: Add an uploaded .pdf file to the cache and get its inventory
+        inventory(handle: str) -> Union[dict, None]: Get the inventory of a cached .pdf file
+        acquire(handle: str) -> Union[str, None]: Get the path to a cached .pdf file and keep the file until it is released
+        release(handle: str) -> None: Release a cached .pdf file acquired with acquire
+        pdfPath(handle: str) -> Union[str, None]: Get the path to a cached .pdf file
+        thumbnailPath(handle: str, page: int) -> Union[str, None]: Get the path to the thumbnail of a page of a cached .pdf file
+        storeRender(handle: str, page: int, options: str, imagePath: str) -> Union[str, None]: Keep a rendered page of a cached .pdf file
+        renderPath(handle: str, page: int, options: str) -> Union[str, None]: Get the path to a kept rendered page of a cached .pdf file
+        stats() -> dict: Get the cache counters
+    """
+
+    def __init__(self, folder: str, maxBytes: int = 512 * 1024 * 1024, thumbnailSize: int = 256, threads: int = 2):
+        self.folder = folder
+        self.maxBytes = maxBytes
+        self.thumbnailSize = thumbnailSize
+        self.threads = threads
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = asyncio.Lock()
+        self._building: dict = {}
+        self._inUse: dict = {}
+
+    async def add(self, file: UploadFile) -> dict:
+        """Add an uploaded .pdf file to the cache, reading its pages and rendering the thumbnails if the file is not cached yet
+
+        The lock of the cache is only held to look up the file and to finish adding it, not while the thumbnails are rendered.
+        An upload of a file that is already being added waits for it instead of adding it again.
+
+        Args:
+            file (UploadFile): The .pdf file
+
+        Returns:
+            dict: The inventory of the file, see inventory
+
+        Raises:
+            Exception: If the file could not be read
+        """
+
+        os.makedirs(self.folder, exist_ok=True)
+        #copy the upload to disk in chunks while hashing it, the file is not read into memory
+        tempPath = os.path.join(self.folder, f".upload-{os.getpid()}-{id(file)}.pdf")
+        digest = hashlib.sha256()
+        try:
+            await file.seek(0)
+            with open(tempPath, 'w+b') as pdf:
+                while True:
+                    chunk = await file.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    pdf.write(chunk)
+            handle = digest.hexdigest()
+            entryFolder = os.path.join(self.folder, handle)
+            async with self._lock:
+                inventory = self.inventory(handle)
+                if inventory is not None:
+                    self.hits += 1
+                    return inventory
+                building = self._building.get(handle)
+                adding = building is None
+                if adding:
+                    #the marker keeps other uploads of the file and _evict away from the folder until the file is added
+                    self.misses += 1
+                    building = self._building[handle] = asyncio.Event()
+                    os.makedirs(entryFolder, exist_ok=True)
+                    os.replace(tempPath, os.path.join(entryFolder, "document.pdf"))
+                else:
+                    self.hits += 1
+        finally:
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+
+        if not adding:
+            await building.wait()
+            inventory = self.inventory(handle)
+            if inventory is None:
+                raise Exception("The .pdf file could not be read")
+            return inventory
+
+        try:
+            inventory = await TaskExecutor.getInstance().run("convert", buildPdfEntry, entryFolder, file.filename, self.thumbnailSize, self.threads)
+        except BaseException:
+            shutil.rmtree(entryFolder, ignore_errors=True)
+            raise
+        finally:
+            async with self._lock:
+                del self._building[handle]
+                building.set()
+                if os.path.isdir(entryFolder):
+                    self._evict(handle)
+        return {"handle": handle, **inventory}
+
+    def acquire(self, handle: str) -> Union[str, None]:
+        """Get the path to a cached .pdf file and keep the file from being removed until it is released, for rendering pages from it
+
+        Args:
+            handle (str): The content hash of the file
+
+        Returns:
+            Union[str, None]: The path to the file, None if the file is not in the cache, then it is not acquired
+        """
+
+        path = self.pdfPath(handle)
+        if path is not None:
+            self._inUse[handle] = self._inUse.get(handle, 0) + 1
+        return path
+
+    def release(self, handle: str) -> None:
+        """Release a cached .pdf file acquired with acquire, so it can be removed again
+
+        Args:
+            handle (str): The content hash of the file
+        """
+
+        count = self._inUse.get(handle, 0) - 1
+        if count > 0:
+            self._inUse[handle] = count
+        else:
+            self._inUse.pop(handle, None)
+
+    def inventory(self, handle: str) -> Union[dict, None]:
+        """Get the inventory of a cached .pdf file, and mark the file as used
+
+        Args:
+            handle (str): The content hash of the file
+
+        Returns:
+            Union[dict, None]: The handle, the name of the file, the number of pages, the width and height of each page in points
+                               and the number of thumbnails, None if the file is not in the cache
+        """
+
+        entryFolder = self._entryFolder(handle)
+        if entryFolder is None:
+            return None
+        try:
+            with open(os.path.join(entryFolder, "inventory.json"), 'r') as file:
+                inventory = json.load(file)
+        except (OSError, ValueError):
+            return None
+        os.utime(entryFolder)
+        return {"handle": handle, **inventory}
+
+    def pdfPath(self, handle: str) -> Union[str, None]:
+        """Get the path to a cached .pdf file, and mark the file as used
+
+        Args:
+            handle (str): The content hash of the file
+
+        Returns:
+            Union[str, None]: The path to the file, None if the file is not in the cache
+        """
+
+        entryFolder = self._entryFolder(handle)
+        if entryFolder is None or not os.path.isfile(os.path.join(entryFolder, "inventory.json")):
+            return None
+        os.utime(entryFolder)
+        return os.path.join(entryFolder, "document.pdf")
+
+    def thumbnailPath(self, handle: str, page: int) -> Union[str, None]:
+        """Get the path to the thumbnail of a page of a cached .pdf file
+
+        Args:
+            handle (str): The content hash of the file
+            page (int): The page number
+
+        Returns:
+            Union[str, None]: The path to the thumbnail, None if the file or page is not in the cache
+        """
+
+        entryFolder = self._entryFolder(handle)
+        if entryFolder is None:
+            return None
+        path = os.path.join(entryFolder, f"page-{int(page)}.png")
+        if not os.path.isfile(path):
+            return None
+        return path
+
+    async def storeRender(self, handle: str, page: int, options: str, imagePath: str) -> Union[str, None]:
+        """Keep a rendered page of a cached .pdf file, moving the image into the cache
+
+        Args:
+            handle (str): The content hash of the file
+            page (int): The page number
+            options (str): The options the page was rendered with, like "d200" for 200 dpi, only letters and digits
+            imagePath (str): The path to the rendered image, the file is moved
+
+        Returns:
+            Union[str, None]: The path to the kept image, None if the file is not in the cache, then the image is removed
+        """
+
+        async with self._lock:
+            entryFolder = self._entryFolder(handle)
+            if entryFolder is None or re.fullmatch(r"[0-9A-Za-z]+", options) is None:
+                if os.path.exists(imagePath):
+                    os.remove(imagePath)
+                return None
+            path = os.path.join(entryFolder, f"render-{int(page)}-{options}.png")
+            os.replace(imagePath, path)
+            os.utime(entryFolder)
+            self._evict(handle)
+            return path
+
+    def renderPath(self, handle: str, page: int, options: str) -> Union[str, None]:
+        """Get the path to a kept rendered page of a cached .pdf file
+
+        Args:
+            handle (str): The content hash of the file
+            page (int): The page number
+            options (str): The options the page was rendered with, see storeRender
+
+        Returns:
+            Union[str, None]: The path to the image, None if the page was not kept with the options
+        """
+
+        entryFolder = self._entryFolder(handle)
+        if entryFolder is None or re.fullmatch(r"[0-9A-Za-z]+", options) is None:
+            return None
+        path = os.path.join(entryFolder, f"render-{int(page)}-{options}.png")
+        if not os.path.isfile(path):
+            return None
+        os.utime(entryFolder)
+        return path
+
+    def stats(self) -> dict:
+        """Get the cache counters
+
+        Returns:
+            dict: The number of hits, misses and evictions, and the size limit of the cache in bytes
+        """
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "maxBytes": self.maxBytes,
+        }
+
+    def _evict(self, keep: str) -> None:
+        # remove the least recently used files until the cache fits in maxBytes, must be called with the lock held
+        # files being added or acquired for rendering count towards the size, but are not removed
+        entries = []
+        size = 0
+        for handle in os.listdir(self.folder):
+            entryFolder = self._entryFolder(handle)
+            if entryFolder is None:
+                continue
+            entrySize = sum(entry.stat().st_size for entry in os.scandir(entryFolder) if entry.is_file())
+            size += entrySize
+            if handle != keep and handle not in self._building and handle not in self._inUse:
+                entries.append((os.stat(entryFolder).st_mtime, entrySize, entryFolder))
+        for (_, entrySize, entryFolder) in sorted(entries):
+            if size <= self.maxBytes:
+                break
+            shutil.rmtree(entryFolder, ignore_errors=True)
+            size -= entrySize
+            self.evictions += 1
+
+    def _entryFolder(self, handle: str) -> Union[str, None]:
+        # the handle is used in paths, so only SHA-256 hex strings are accepted
+        if not isinstance(handle, str) or re.fullmatch(r"[0-9a-f]{64}", handle) is None:
+            return None
+        entryFolder = os.path.join(self.folder, handle)
+        if not os.path.isdir(entryFolder):
+            return None
+        return entryFolder
+
+def buildPdfEntry(entryFolder: str, name: str, thumbnailSize: int, threads: int = 1) -> dict:
+    """Read the pages and render the thumbnails of a .pdf file added to the cache, blocking
+
+    The inventory is written last, so a file is only used when it is complete.
+
+    Args:
+        entryFolder (str): The folder of the file in the cache, holding document.pdf
+        name (str): The name of the uploaded file
+        thumbnailSize (int): The long edge of the thumbnails in pixels
+        threads (int, optional): The number of pdftoppm processes rendering the thumbnails at once. Defaults to 1.
+
+    Returns:
+        dict: The name of the file, the number of pages, the width and height of each page in points and the number of thumbnails
+    """
+
+    pdfPath = os.path.join(entryFolder, "document.pdf")
+    inventory = {"name": name, **pdfInventory(pdfPath)}
+    paths: List[str] = pdfThumbnailFiles(pdfPath, entryFolder, thumbnailSize, threads)
+    for (page, path) in enumerate(paths, start=1):
+        os.replace(path, os.path.join(entryFolder, f"page-{page}.png"))
+    inventory["thumbnails"] = len(paths)
+    with open(os.path.join(entryFolder, "inventory.json"), 'w') as file:
+        json.dump(inventory, file)
+    return inventory
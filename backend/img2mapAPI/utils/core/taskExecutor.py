@@ -0,0 +1,190 @@
+""" This module contains the execution layer for blocking work, so it does not run on the event loop.
+
+Blocking work is split in categories, each with its own pool and concurrency limit:
+    - tiles: Rendering map tiles and opening georeferenced datasets
+    - georef: Georeferencing images
+    - convert: Converting and cropping images and .pdf files
+
+The pool of a category is either a thread pool or a process pool. Functions run in a process pool must be defined at module level,
+and their arguments and return values must be picklable. Only the convert category submits such functions, the tiles and georef categories
+submit bound methods, closures and cancel events, so they always run in a thread pool.
+"""
+
+import os
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable
+
+# category -> (mode, workers), used when no environment variable is set
+defaultConfig: dict = {
+    "tiles": ("thread", 4),
+    "georef": ("thread", 2),
+    "convert": ("thread", 2),
+}
+
+# categories whose functions and arguments can be sent to a process pool
+processCategories: tuple = ("convert",)
+
+class TaskExecutor:
+    """This class runs blocking functions in a bounded pool per category and keeps queue metrics.
+
+    The pools are first in first out, so of the submitted and unfinished calls in a category, the first `workers` calls are running and the rest are queued.
+    Intended use as a singleton class, get the shared instance with getInstance().
+
+    Attributes:
+        config (dict): The mode ("thread" or "process") and number of workers of each category, only the categories in processCategories can use "process"
+
+    Functions:
+        run(category: str, function: Callable, *args) -> any: Run a function in the pool of a category
+        submit(category: str, function: Callable, *args) -> Future: Submit a function to the pool of a category without waiting for it
+        stats() -> dict: Get the queue metrics of each category
+        shutdown() -> None: Shut down all pools
+        getInstance() -> TaskExecutor: Get the shared instance, configured from environment variables
+    """
+
+    _instance = None
+
+    def __init__(self, config: dict = None):
+        """Create the executor, the pools are started on first use
+
+        Args:
+            config (dict, optional): The mode and number of workers of the categories to change from defaultConfig
+
+        Raises:
+            Exception: If a mode is unknown, a category can not run in a process pool or the number of workers is below 1
+        """
+
+        self.config = dict(defaultConfig)
+        if config is not None:
+            self.config.update(config)
+        for (category, (mode, workers)) in self.config.items():
+            if mode not in ("thread", "process"):
+                raise Exception(f"Unknown executor mode for {category}: {mode}, expected thread or process")
+            if mode == "process" and category not in processCategories:
+                raise Exception(f"The {category} executor category can not run in process mode, its functions can not be sent to another process")
+            if workers < 1:
+                raise Exception(f"The {category} executor category needs at least one worker")
+        self._pools: dict = {}
+        self._stats: dict = {category: {"pending": 0, "maxPending": 0, "completed": 0, "failed": 0, "totalTime": 0.0} for category in self.config}
+        self._lock = threading.Lock()
+
+    async def run(self, category: str, function: Callable, *args):
+        """Run a function in the pool of a category and wait for the result
+
+        Args:
+            category (str): The category of the work, one of the keys in config
+            function (Callable): The blocking function to run
+            *args: The arguments to the function
+
+        Returns:
+            any: The return value of the function
+        """
+
+        return await asyncio.wrap_future(self.submit(category, function, *args))
+
+    def submit(self, category: str, function: Callable, *args) -> Future:
+        """Submit a function to the pool of a category without waiting for it
+
+        A call that already runs can not be stopped, cancelling the future only stops a queued call.
+        Add a done callback to the future to clean up after a call whose result is no longer wanted.
+
+        Args:
+            category (str): The category of the work, one of the keys in config
+            function (Callable): The blocking function to run
+            *args: The arguments to the function
+
+        Returns:
+            Future: The future of the call, see concurrent.futures.Future
+        """
+
+        if category not in self.config:
+            raise Exception(f"Unknown executor category: {category}")
+        stats = self._stats[category]
+        with self._lock:
+            stats["pending"] += 1
+            stats["maxPending"] = max(stats["maxPending"], stats["pending"])
+        submitted = time.perf_counter()
+
+        def finished(future: Future) -> None:
+            with self._lock:
+                stats["pending"] -= 1
+                stats["failed" if future.cancelled() or future.exception() is not None else "completed"] += 1
+                stats["totalTime"] += time.perf_counter() - submitted
+
+        try:
+            future = self._getPool(category).submit(function, *args)
+        except:
+            #the pool is shut down
+            with self._lock:
+                stats["pending"] -= 1
+                stats["failed"] += 1
+            raise
+        future.add_done_callback(finished)
+        return future
+
+    def stats(self) -> dict:
+        """Get the queue metrics of each category
+
+        Returns:
+            dict: For each category the mode, workers, running and queued calls, the highest number of pending calls,
+                  the calls that returned and the calls that raised or were cancelled, and the average time from submit to result or error in milliseconds
+        """
+
+        ret = {}
+        with self._lock:
+            for (category, (mode, workers)) in self.config.items():
+                stats = self._stats[category]
+                finished = stats["completed"] + stats["failed"]
+                ret[category] = {
+                    "mode": mode,
+                    "workers": workers,
+                    "running": min(stats["pending"], workers),
+                    "queued": max(stats["pending"] - workers, 0),
+                    "maxPending": stats["maxPending"],
+                    "completed": stats["completed"],
+                    "failed": stats["failed"],
+                    "avgTimeMs": round(stats["totalTime"] / finished * 1000, 3) if finished else 0,
+                }
+        return ret
+
+    def shutdown(self) -> None:
+        """Shut down all pools, waiting for running calls to finish
+        """
+
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.shutdown(wait=True)
+
+    def _getPool(self, category: str) -> Executor:
+        # the pools are created on first use, so process pools are not started when they are not needed
+        with self._lock:
+            pool = self._pools.get(category)
+            if pool is None:
+                (mode, workers) = self.config[category]
+                if mode == "process":
+                    pool = ProcessPoolExecutor(max_workers=workers)
+                else:
+                    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=category)
+                self._pools[category] = pool
+            return pool
+
+    @staticmethod
+    def getInstance():
+        """Get the shared instance, configured from the environment variables EXECUTOR_<CATEGORY>_MODE and EXECUTOR_<CATEGORY>_WORKERS
+
+        Returns:
+            TaskExecutor: The shared instance
+        """
+
+        if TaskExecutor._instance is None:
+            config = {}
+            for (category, (mode, workers)) in defaultConfig.items():
+                mode = os.environ.get(f"EXECUTOR_{category.upper()}_MODE", mode).lower()
+                workers = int(os.environ.get(f"EXECUTOR_{category.upper()}_WORKERS", workers))
+                config[category] = (mode, workers)
+            TaskExecutor._instance = TaskExecutor(config)
+        return TaskExecutor._instance
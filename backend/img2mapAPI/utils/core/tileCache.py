@@ -0,0 +1,139 @@
+""" This module contains an in-memory LRU cache for rendered map tiles.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Union
+
+class TileCache:
+    """In-memory least recently used cache for encoded tile bytes, bounded by the total size of the cached tiles.
+
+    Tiles are keyed by (projectId, version, z, x, y), where version identifies the georeferenced raster the tile was rendered from.
+    When the raster of a project is replaced, the old tiles are never served again, and invalidate(projectId) frees them right away.
+    The cache is safe to use from several threads.
+
+    Attributes:
+        maxBytes (int): The maximum total size of the cached tiles in bytes
+        hits (int): Number of lookups that found a tile
+        misses (int): Number of lookups that did not find a tile
+        evictions (int): Number of tiles removed to stay within maxBytes
+
+    Functions:
+        get(projectId: int, version: str, z: int, x: int, y: int) -> Union[bytes, None]: Get a tile from the cache
+        put(projectId: int, version: str, z: int, x: int, y: int, tile: bytes) -> None: Add a tile to the cache
+        invalidate(projectId: int) -> int: Remove all tiles of a project from the cache
+        clear() -> None: Remove all tiles from the cache
+        stats() -> dict: Get the cache counters
+    """
+
+    def __init__(self, maxBytes: int = 64 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._tiles: OrderedDict = OrderedDict()
+        self._projectKeys: dict = {} # projectId -> set of keys, for fast invalidation
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, projectId: int, version: str, z: int, x: int, y: int) -> Union[bytes, None]:
+        """Get a tile from the cache
+
+        Args:
+            projectId (int): The id of the project
+            version (str): The version of the georeferenced raster
+            z (int): Zoom level of the tile
+            x (int): Column index of the tile
+            y (int): Row index of the tile
+
+        Returns:
+            Union[bytes, None]: The tile as bytes, None if the tile is not cached
+        """
+
+        key = (projectId, version, z, x, y)
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is None:
+                self.misses += 1
+                return None
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return tile
+
+    def put(self, projectId: int, version: str, z: int, x: int, y: int, tile: bytes) -> None:
+        """Add a tile to the cache, evicting the least recently used tiles if the cache is full
+
+        Args:
+            projectId (int): The id of the project
+            version (str): The version of the georeferenced raster
+            z (int): Zoom level of the tile
+            x (int): Column index of the tile
+            y (int): Row index of the tile
+            tile (bytes): The encoded tile
+        """
+
+        if len(tile) > self.maxBytes:
+            return
+        key = (projectId, version, z, x, y)
+        with self._lock:
+            if key in self._tiles:
+                self._size -= len(self._tiles[key])
+            self._tiles[key] = tile
+            self._tiles.move_to_end(key)
+            self._projectKeys.setdefault(projectId, set()).add(key)
+            self._size += len(tile)
+            while self._size > self.maxBytes:
+                oldKey, oldTile = self._tiles.popitem(last=False)
+                self._forget(oldKey, oldTile)
+                self.evictions += 1
+
+    def invalidate(self, projectId: int) -> int:
+        """Remove all tiles of a project from the cache
+
+        Args:
+            projectId (int): The id of the project
+
+        Returns:
+            int: The number of removed tiles
+        """
+
+        with self._lock:
+            keys = self._projectKeys.pop(projectId, set())
+            for key in keys:
+                self._size -= len(self._tiles.pop(key))
+            return len(keys)
+
+    def clear(self) -> None:
+        """Remove all tiles from the cache
+        """
+
+        with self._lock:
+            self._tiles.clear()
+            self._projectKeys.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        """Get the cache counters
+
+        Returns:
+            dict: The number of hits, misses, evictions and cached tiles, and the size of the cache in bytes
+        """
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "tiles": len(self._tiles),
+                "bytes": self._size,
+                "maxBytes": self.maxBytes,
+            }
+
+    def _forget(self, key: tuple, tile: bytes) -> None:
+        # bookkeeping for a tile that has been popped from _tiles, must be called with the lock held
+        self._size -= len(tile)
+        keys = self._projectKeys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._projectKeys[key[0]]
@@ -0,0 +1,346 @@
+""" This module contains functions to pre-render the map tiles of a georeferenced image into a SQLite tile store (MBTiles layout).
+
+The tile store contains the tables of the MBTiles specification:
+    - metadata(name, value): Information about the tile store, like the zoom range and the raster version it was rendered from
+    - tiles(zoom_level, tile_column, tile_row, tile_data): The PNG encoded tiles, with tile_row in TMS order
+
+Empty tiles are not stored. The metadata key 'zoom_done' holds the highest zoom level that has been completely rendered,
+so a missing tile at or below that zoom level is known to be blank, while a missing tile above it has not been rendered yet.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Callable, Tuple, Union
+from morecantile import TileMatrixSet
+from rio_tiler.io import Reader
+
+#internal imports
+from .georefHelper import renderTile, minTileZoom
+from .FileHelper import getUniqeFileName, removeFile, writeFile
+from .datasetPool import PooledDataset
+from .taskExecutor import TaskExecutor
+
+logger = logging.getLogger(__name__)
+
+writeBatch = 64 # the number of rendered tiles written to the tile store at a time
+
+def getZoomRange(tiffPath: str) -> Tuple[int, int]:
+    """Get the zoom range to render tiles for
+
+    The range starts at the lowest zoom level the tile endpoint renders, and ends at the native resolution of the image.
+
+    Args:
+        tiffPath (str): Path to the georeferenced TIFF file
+
+    Returns:
+        Tuple[int, int]: The minimum and maximum zoom level
+    """
+
+    with Reader(tiffPath) as src:
+        maxzoom = max(src.maxzoom, minTileZoom)
+    return (minTileZoom, maxzoom)
+
+def createTileStore(storePath: str, version: str, minzoom: int, maxzoom: int) -> None:
+    """Create an empty tile store
+
+    Args:
+        storePath (str): Path to the tile store file
+        version (str): The version of the georeferenced raster the tiles are rendered from
+        minzoom (int): The minimum zoom level
+        maxzoom (int): The maximum zoom level
+    """
+
+    conn = sqlite3.connect(storePath)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL") # lets the tile endpoint read while the pyramid is rendered
+        conn.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT)")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS name ON metadata (name)")
+        conn.execute("CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)")
+        metadata = {
+            "name": "img2map",
+            "format": "png",
+            "type": "overlay",
+            "minzoom": str(minzoom),
+            "maxzoom": str(maxzoom),
+            "version": version,
+            "zoom_done": str(minzoom - 1),
+        }
+        conn.executemany("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", metadata.items())
+        conn.commit()
+    finally:
+        conn.close()
+
+def readTile(storePath: str, z: int, x: int, y: int) -> Tuple[Union[bytes, None], bool]:
+    """Read a tile from a tile store
+
+    Args:
+        storePath (str): Path to the tile store file
+        z (int): Zoom level of the tile
+        x (int): Column index of the tile
+        y (int): Row index of the tile (XYZ order)
+
+    Returns:
+        Tuple[Union[bytes, None], bool]: The tile bytes if stored, and True if the zoom level has been completely rendered
+    """
+
+    conn = sqlite3.connect(f"file:{storePath}?mode=ro", uri=True)
+    try:
+        row = conn.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, (2 ** z) - 1 - y)
+        ).fetchone()
+        if row is not None:
+            return (row[0], True)
+        done = conn.execute("SELECT value FROM metadata WHERE name = 'zoom_done'").fetchone()
+        return (None, done is not None and z <= int(done[0]))
+    finally:
+        conn.close()
+
+def openTileStore(storePath: str) -> sqlite3.Connection:
+    """Open a tile store for writing, the connection can be used from any thread, one thread at a time
+
+    Args:
+        storePath (str): Path to a tile store created with createTileStore
+
+    Returns:
+        sqlite3.Connection: The connection to the tile store
+    """
+
+    return sqlite3.connect(storePath, check_same_thread=False)
+
+def writeTiles(conn: sqlite3.Connection, rows: list, zoomDone: int = None) -> None:
+    """Write rendered tiles to a tile store, and commit them when a zoom level is complete
+
+    Args:
+        conn (sqlite3.Connection): The connection from openTileStore
+        rows (list): The tiles as (zoom_level, tile_column, tile_row, tile_data) rows, with tile_row in TMS order
+        zoomDone (int, optional): The zoom level completed by these tiles, None if the zoom level is not complete yet. Defaults to None.
+    """
+
+    conn.executemany("INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)", rows)
+    if zoomDone is not None:
+        conn.execute("UPDATE metadata SET value = ? WHERE name = 'zoom_done'", (str(zoomDone),))
+        conn.commit()
+
+def finishTileStore(conn: sqlite3.Connection) -> None:
+    """Turn a complete tile store into a single file again, so the store can be copied to file storage
+
+    Args:
+        conn (sqlite3.Connection): The connection from openTileStore
+    """
+
+    conn.execute("PRAGMA journal_mode=DELETE")
+
+async def renderPyramid(tiffPath: str, storePath: str, minzoom: int, maxzoom: int, cancelEvent: threading.Event, inFlight: int = 2) -> bool:
+    """Render all tiles of a georeferenced TIFF file between two zoom levels into a tile store
+
+    The tiles are rendered in the "tiles" category of the TaskExecutor, zoom level by zoom level, and written to the store in batches as they complete.
+    The store is written in the "tiles" category as well, nothing blocking runs on the event loop.
+    At most inFlight tiles are submitted at a time, so a large zoom level does not fill the queue ahead of the tile requests.
+
+    Args:
+        tiffPath (str): Path to the georeferenced TIFF file
+        storePath (str): Path to a tile store created with createTileStore
+        minzoom (int): The minimum zoom level
+        maxzoom (int): The maximum zoom level
+        cancelEvent (threading.Event): Rendering stops when this event is set
+        inFlight (int, optional): The number of tiles rendered at a time. Defaults to 2.
+
+    Returns:
+        bool: True if the whole pyramid was rendered, False if it was cancelled
+    """
+
+    executor = TaskExecutor.getInstance()
+    inFlight = max(inFlight, 1)
+    #one handle to the file per tile rendered at a time, as a dataset handle can not be used by two threads at once
+    dataset = await executor.run("tiles", PooledDataset, (None, tiffPath), tiffPath, None, inFlight)
+    running = {}
+    rows = []
+    conn = await executor.run("tiles", openTileStore, storePath)
+    try:
+        (tms, bounds) = await executor.run("tiles", dataset.use, tileGrid)
+        for z in range(minzoom, maxzoom + 1):
+            tiles = tms.tiles(*bounds, zooms=[z])
+            while True:
+                while len(running) < inFlight and not cancelEvent.is_set():
+                    tile = next(tiles, None)
+                    if tile is None:
+                        break
+                    running[asyncio.ensure_future(executor.run("tiles", dataset.use, renderTile, tile.x, tile.y, tile.z))] = tile
+                if cancelEvent.is_set():
+                    return False
+                if not running:
+                    break
+                (done, _) = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tile = running.pop(task)
+                    data = task.result()
+                    if data is not None:
+                        rows.append((z, tile.x, (2 ** z) - 1 - tile.y, sqlite3.Binary(data)))
+                if len(rows) >= writeBatch:
+                    await executor.run("tiles", writeTiles, conn, rows)
+                    rows = []
+            await executor.run("tiles", writeTiles, conn, rows, z)
+            rows = []
+        await executor.run("tiles", finishTileStore, conn)
+        return True
+    finally:
+        #the dataset is closed once no tile is rendered from it
+        if running:
+            await asyncio.wait(running.keys())
+        await executor.run("tiles", conn.close)
+        await executor.run("tiles", dataset.close)
+
+def tileGrid(src: Reader) -> Tuple[TileMatrixSet, Tuple[float, float, float, float]]:
+    """Get the tile grid and the geographic bounds of a georeferenced file, the tiles of the pyramid are the tiles of the grid within the bounds
+
+    Args:
+        src (Reader): The open reader of the file
+
+    Returns:
+        Tuple[TileMatrixSet, Tuple[float, float, float, float]]: The tile matrix set, and the bounds as (west, south, east, north)
+    """
+
+    return (src.tms, src.get_geographic_bounds(src.tms.rasterio_geographic_crs))
+
+class TilePyramidBuilder:
+    """This class renders the tile pyramids of projects in the background.
+
+    One build can run per project, starting a new build for a project cancels the previous one.
+    The local paths of the tile stores are kept, so tiles can be served from a store while it is being rendered.
+
+    Attributes:
+        enabled (bool): If pyramids should be rendered after georeferencing
+        workers (int): The number of tiles of a pyramid rendered at a time, in the "tiles" category of the TaskExecutor
+
+    Functions:
+        start(projectId: int, version: str, tiffBytes: bytes, onDone: Callable) -> None: Start rendering the pyramid of a project
+        cancel(projectId: int) -> None: Cancel the build of a project and forget its local tile store
+        getLocalStore(projectId: int, version: str) -> Union[str, None]: Get the local path of the tile store of a project
+        setLocalStore(projectId: int, version: str, storePath: str) -> None: Register a local copy of a finished tile store
+        readTile(projectId: int, version: str, z: int, x: int, y: int) -> Tuple[Union[bytes, None], bool]: Read a tile from the tile store of a project
+    """
+
+    def __init__(self, enabled: bool = False, workers: int = 2):
+        self.enabled = enabled
+        self.workers = workers
+        self._builds: dict = {} # projectId -> (version, cancelEvent, asyncio.Task)
+        self._stores: dict = {} # projectId -> (version, local store path)
+
+    def start(self, projectId: int, version: str, tiffBytes: bytes, onDone: Callable) -> None:
+        """Start rendering the pyramid of a project, must be called from the event loop
+
+        Args:
+            projectId (int): The id of the project
+            version (str): The version of the georeferenced raster
+            tiffBytes (bytes): The georeferenced TIFF file as bytes
+            onDone (Callable): Coroutine function called with (projectId, version, storePath) when the pyramid is complete
+        """
+
+        self.cancel(projectId)
+        cancelEvent = threading.Event()
+        task = asyncio.get_running_loop().create_task(self._build(projectId, version, tiffBytes, cancelEvent, onDone))
+        self._builds[projectId] = (version, cancelEvent, task)
+
+    def cancel(self, projectId: int) -> None:
+        """Cancel the build of a project and forget its local tile store
+
+        Args:
+            projectId (int): The id of the project
+        """
+
+        build = self._builds.pop(projectId, None)
+        if build is not None:
+            build[1].set()
+        store = self._stores.pop(projectId, None)
+        if store is not None and build is None:
+            removeFile(store[1])
+
+    def getLocalStore(self, projectId: int, version: str) -> Union[str, None]:
+        """Get the local path of the tile store of a project
+
+        Args:
+            projectId (int): The id of the project
+            version (str): The version of the georeferenced raster
+
+        Returns:
+            Union[str, None]: The path to the tile store, None if there is no local store for this version
+        """
+
+        store = self._stores.get(projectId)
+        if store is None or store[0] != version:
+            return None
+        return store[1]
+
+    def setLocalStore(self, projectId: int, version: str, storePath: str) -> None:
+        """Register a local copy of a finished tile store, the local store it replaces is removed
+
+        While a pyramid of the project is rendering, the store being rendered is kept and the copy is removed instead.
+
+        Args:
+            projectId (int): The id of the project
+            version (str): The version of the georeferenced raster
+            storePath (str): Path to the local tile store file
+        """
+
+        if projectId in self._builds:
+            removeFile(storePath)
+            return
+        replaced = self._stores.get(projectId)
+        self._stores[projectId] = (version, storePath)
+        if replaced is not None and replaced[1] != storePath:
+            removeFile(replaced[1])
+
+    def readTile(self, projectId: int, version: str, z: int, x: int, y: int) -> Tuple[Union[bytes, None], bool]:
+        """Read a tile from the local tile store of a project, blocking, run it in the "tiles" category of the TaskExecutor
+
+        Args:
+            projectId (int): The id of the project
+            version (str): The version of the georeferenced raster
+            z (int): Zoom level of the tile
+            x (int): Column index of the tile
+            y (int): Row index of the tile
+
+        Returns:
+            Tuple[Union[bytes, None], bool]: The tile bytes if stored, and True if a missing tile is known to be blank
+        """
+
+        storePath = self.getLocalStore(projectId, version)
+        if storePath is None:
+            return (None, False)
+        try:
+            return readTile(storePath, z, x, y)
+        except sqlite3.Error:
+            # the store is busy or incomplete, let the caller render the tile
+            return (None, False)
+
+    async def _build(self, projectId: int, version: str, tiffBytes: bytes, cancelEvent: threading.Event, onDone: Callable) -> None:
+        executor = TaskExecutor.getInstance()
+        tiffPath = getUniqeFileName('tiff')
+        storePath = getUniqeFileName('mbtiles')
+        complete = False
+        try:
+            await executor.run("tiles", writeFile, tiffPath, tiffBytes)
+            (minzoom, maxzoom) = await executor.run("tiles", getZoomRange, tiffPath)
+            await executor.run("tiles", createTileStore, storePath, version, minzoom, maxzoom)
+            self._stores[projectId] = (version, storePath)
+            complete = await renderPyramid(tiffPath, storePath, minzoom, maxzoom, cancelEvent, self.workers)
+            if complete and not cancelEvent.is_set():
+                await onDone(projectId, version, storePath)
+        except Exception:
+            complete = False
+            logger.exception("Tile pyramid for project %s could not be rendered", projectId)
+        finally:
+            removeFile(tiffPath)
+            build = self._builds.get(projectId)
+            if build is not None and build[1] is cancelEvent:
+                del self._builds[projectId]
+            if cancelEvent.is_set() or not complete:
+                if self._stores.get(projectId, (None, None))[1] == storePath:
+                    del self._stores[projectId]
+                removeFile(storePath)
+                removeFile(storePath + '-wal')
+                removeFile(storePath + '-shm')
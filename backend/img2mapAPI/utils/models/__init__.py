@@ -3,11 +3,15 @@
 Classes:
     - Point: A class representing a point
     - PointList: A class representing a list of points
+    - PointSet: A class holding the coordinates of a list of points as arrays
     - Project: A class representing a project
+    - GeorefCacheEntry: A class representing a georeferenced file shared by projects with the same georeference input
 """
 
 from .point import Point
 from .pointList import PointList
+from .pointSet import PointSet
 from .project import Project
+from .georefCacheEntry import GeorefCacheEntry
 
-__ALL__ = ["Point", "PointList", "Project"]
\ No newline at end of file
+__ALL__ = ["Point", "PointList", "PointSet", "Project", "GeorefCacheEntry"]
\ No newline at end of file
@@ -0,0 +1,36 @@
+from typing import Union
+from pydantic import BaseModel
+import datetime
+
+class GeorefCacheEntry(BaseModel):
+    """Georeference cache entry model, a georeferenced file in file storage shared by the projects georeferenced with the same input
+
+    Attributes:
+        id (Union[int, None]): The id of the entry in the database
+        cacheKey (str): The content hash of the input of the georeference: the image hash, the points, the crs and the output options
+        georeferencedFilePath (str): The path to the georeferenced file
+        georeferencedHash (Union[str, None]): The content hash (SHA-256) of the georeferenced file
+        mercatorFilePath (Union[str, None]): The path to the Web Mercator copy of the georeferenced file
+        rasterInfo (Union[str, None]): Information about the georeferenced file as JSON, see Project.rasterInfo
+        size (int): The size of the georeferenced file and its Web Mercator copy in bytes
+        refs (int): The number of projects using the georeferenced file
+        lastUsed (Union[str, None]): The last time the entry was stored or used by a project
+    """
+    id: Union[int, None] = None
+    cacheKey: str
+    georeferencedFilePath: str
+    georeferencedHash: Union[str, None] = None
+    mercatorFilePath: Union[str, None] = None
+    rasterInfo: Union[str, None] = None
+    size: int = 0
+    refs: int = 0
+    lastUsed: Union[str, None] = None
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.id = data.get('id') if data.get('id') is not None else None
+        self.mercatorFilePath = data.get('mercatorFilePath') if data.get('mercatorFilePath') is not None else None
+        self.rasterInfo = data.get('rasterInfo') if data.get('rasterInfo') is not None else None
+        self.size = data.get('size') if data.get('size') is not None else 0
+        self.refs = data.get('refs') if data.get('refs') is not None else 0
+        self.lastUsed = data.get('lastUsed') if data.get('lastUsed') is not None else datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,115 @@
+from typing import Iterable, List, Union
+import numpy as np
+from .point import Point
+from .pointList import PointList
+
+class PointSet:
+    """PointSet, the coordinates of a list of points held as one NumPy array per field
+
+    Used where the points are only computed with, like fitting and georeferencing,
+    so no Point object is made per point. Point objects are only made where points are sent or received by the API.
+
+    Attributes:
+        Idproj (np.ndarray): The id of each point in the project (int64), 0 if the point has none
+        col (np.ndarray): The column of each point (float64)
+        row (np.ndarray): The row of each point (float64)
+        lng (np.ndarray): The longitude of each point (float64)
+        lat (np.ndarray): The latitude of each point (float64)
+        error (np.ndarray): The error of each point (float64), NaN if the point has none
+        columns (tuple): The fields in the order of the rows read by fromRows, as named in storage
+
+    Functions:
+        fromRows(rows: Iterable[tuple]) -> PointSet: Make a point set from rows of values read from storage
+        fromPoints(points: Iterable[Union[Point, dict]]) -> PointSet: Make a point set from point objects or dictionaries
+        of(points: Union[PointSet, PointList, List[Point]]) -> PointSet: Get a point set from any list of points
+        isValid() -> bool: Check that every point has all its coordinates
+        pixels() -> np.ndarray: Get the pixel coordinates (n, 2) as col, row
+        coords() -> np.ndarray: Get the map coordinates (n, 2) as x (lng), y (lat)
+    """
+    __slots__ = ("Idproj", "col", "row", "lng", "lat", "error")
+    columns = ("Idproj", "col", "row", "lng", "lat", "error")
+
+    def __init__(self, Idproj: np.ndarray, col: np.ndarray, row: np.ndarray, lng: np.ndarray, lat: np.ndarray, error: np.ndarray = None):
+        self.Idproj = np.asarray(Idproj, dtype=np.int64)
+        self.col = np.asarray(col, dtype=np.float64)
+        self.row = np.asarray(row, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.error = np.asarray(error, dtype=np.float64) if error is not None else np.full(len(self.Idproj), np.nan)
+
+    def __len__(self) -> int:
+        return len(self.Idproj)
+
+    @classmethod
+    def fromRows(cls, rows: Iterable[tuple]) -> "PointSet":
+        """Make a point set from rows of values read from storage, in the order of PointSet.columns
+
+        Args:
+            rows (Iterable[tuple]): The rows, missing values (None) are read as NaN, or 0 for the Idproj
+
+        Returns:
+            PointSet: The point set
+        """
+
+        values = np.array(list(rows), dtype=np.float64).reshape(-1, len(cls.columns))
+        return cls(np.nan_to_num(values[:, 0]), values[:, 1], values[:, 2], values[:, 3], values[:, 4], values[:, 5])
+
+    @classmethod
+    def fromPoints(cls, points: Iterable[Union[Point, dict]]) -> "PointSet":
+        """Make a point set from point objects or dictionaries
+
+        Args:
+            points (Iterable[Union[Point, dict]]): The points
+
+        Returns:
+            PointSet: The point set
+        """
+
+        return cls.fromRows(
+            tuple(point.get(column) if isinstance(point, dict) else getattr(point, column, None) for column in cls.columns)
+            for point in points
+        )
+
+    @classmethod
+    def of(cls, points: Union["PointSet", PointList, List[Point]]) -> "PointSet":
+        """Get a point set from any list of points
+
+        Args:
+            points (Union[PointSet, PointList, List[Point]]): The points
+
+        Returns:
+            PointSet: The points as a point set, the same object if it already is one
+        """
+
+        if isinstance(points, PointSet):
+            return points
+        if isinstance(points, PointList):
+            return cls.fromPoints(points.points)
+        return cls.fromPoints(points)
+
+    def isValid(self) -> bool:
+        """Check that every point has all its coordinates
+
+        Returns:
+            bool: True if the lat, lng, col and row of every point are set and finite
+        """
+
+        return bool(np.isfinite(self.lat).all() and np.isfinite(self.lng).all() and np.isfinite(self.col).all() and np.isfinite(self.row).all())
+
+    def pixels(self) -> np.ndarray:
+        """Get the pixel coordinates of the points
+
+        Returns:
+            np.ndarray: The pixel coordinates (n, 2) as col, row
+        """
+
+        return np.column_stack((self.col, self.row))
+
+    def coords(self) -> np.ndarray:
+        """Get the map coordinates of the points
+
+        Returns:
+            np.ndarray: The map coordinates (n, 2) as x (lng), y (lat)
+        """
+
+        return np.column_stack((self.lng, self.lat))
@@ -14,6 +14,11 @@ class Project(BaseModel):
         crs (Union[str, None]): The crs of the project
         imageFilePath (Union[str, None]): The path to the image file
         georeferencedFilePath (Union[str, None]): The path to the georeferenced file
+        tilesFilePath (Union[str, None]): The path to the pre-rendered tile store (MBTiles) of the georeferenced file
+        mercatorFilePath (Union[str, None]): The path to the Web Mercator copy of the georeferenced file, used for rendering map tiles
+        imageHash (Union[str, None]): The content hash (SHA-256) of the image file, used as its version
+        georeferencedHash (Union[str, None]): The content hash (SHA-256) of the georeferenced file, used as its version
+        rasterInfo (Union[str, None]): Information about the georeferenced file captured at georeference time as JSON, like its footprint, size, crs, transform and overviews, and its quality: proxy for a downsampled copy of the image or full
         selfdestructtime (Union[str, None]): The self destruct time of the project
         created (Union[str, None]): The creation time of the project
         lastModified (Union[str, None]): The last modification time of the project
@@ -25,6 +30,11 @@ class Project(BaseModel):
     crs: Union[str, None] = None
     imageFilePath: Union[str, None] = None
     georeferencedFilePath: Union[str, None] = None
+    tilesFilePath: Union[str, None] = None
+    mercatorFilePath: Union[str, None] = None
+    imageHash: Union[str, None] = None
+    georeferencedHash: Union[str, None] = None
+    rasterInfo: Union[str, None] = None
     selfdestructtime: Union[str, None] = None
     created: Union[str, None] = None
     lastModified: Union[str, None] = None
@@ -34,6 +44,11 @@ class Project(BaseModel):
         self.points = data.get('points') if data.get('points') is not None else PointList()
         self.imageFilePath = data.get('imageFilePath') if data.get('imageFilePath') is not None else None
         self.georeferencedFilePath = data.get('georeferencedFilePath') if data.get('georeferencedFilePath') is not None else None
+        self.tilesFilePath = data.get('tilesFilePath') if data.get('tilesFilePath') is not None else None
+        self.mercatorFilePath = data.get('mercatorFilePath') if data.get('mercatorFilePath') is not None else None
+        self.imageHash = data.get('imageHash') if data.get('imageHash') is not None else None
+        self.georeferencedHash = data.get('georeferencedHash') if data.get('georeferencedHash') is not None else None
+        self.rasterInfo = data.get('rasterInfo') if data.get('rasterInfo') is not None else None
         self.crs = data.get('crs') if data.get('crs') is not None else None
         self.selfdestructtime = data.get('selfdestructtime') if data.get('selfdestructtime') is not None else None
         self.created = data.get('created') if data.get('created') is not None else datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -5,16 +5,33 @@
 # The project data is stored in a list in the router file.
 
 # Importing the required modules
+import asyncio
 import tempfile
-from typing import List
-from img2mapAPI.utils.models import Project, Point
+import json
+import threading
+import logging
+from typing import Callable, List, Union
+from img2mapAPI.utils.models import Project, Point, GeorefCacheEntry, PointSet
 from img2mapAPI.utils.models.pointList import PointList
 from .storage.files.fileStorage import FileStorage
 from .storage.data.storageHandler import StorageHandler
 from .core import georefHelper as georef
-from .core.FileHelper import removeFile
+from .core import gcpFit
+from .core.FileHelper import removeFile, getUniqeFileName, writeFile
+from .core.tileCache import TileCache
+from .core.tilePyramid import TilePyramidBuilder
+from .core.datasetPool import DatasetPool
+from .core.taskExecutor import TaskExecutor
+from .core.httpCache import contentHash
+from .core.georefJobs import GeorefJobQueue, GeorefJob
+from .core.georefCache import GeorefCache, georefCacheKey
 import datetime
 
+logger = logging.getLogger(__name__)
+
+tileStoreChunkSize = 8 * 1024 * 1024 # the bytes of a tile store read from file storage at a time when it is copied to the local disk
+fileFields = ["imageFilePath", "imageHash", "georeferencedFilePath", "georeferencedHash", "mercatorFilePath", "tilesFilePath", "rasterInfo"] # set by the project handler, not by project updates from the API
+
 class ProjectHandler:
     """This class contains functions to handle the project. 
 
@@ -24,38 +41,83 @@ class ProjectHandler:
     Attributes:
         _FileStorage (FileStorage): The file storage object
         _StorageHandler (StorageHandler): The storage handler object
+        _TileCache (TileCache): The cache for rendered map tiles
+        _TilePyramid (TilePyramidBuilder): The builder for pre-rendered tile stores
+        _DatasetPool (DatasetPool): The pool of open georeferenced datasets for rendering tiles
+        _Executor (TaskExecutor): The execution layer for blocking georeferencing and tile rendering work
+        _GeorefOptions (dict): Options for the georeferenced output file, see georefHelper.defaultOutputOptions
+        _GeorefJobs (GeorefJobQueue): The queue for asynchronous georeferencing jobs
+        _GeorefCache (GeorefCache): The cache of georeferenced files shared by projects with the same georeference input
+        _TileStoreLoads (dict): The running copies of tile stores from file storage, by (projectId, version)
 
     Functions:
         createProject(project: Project) -> int: Create a project and save it to storage
-        updateProject(projectId: int, project: Project) -> bool: Update a project
+        updateProject(projectId: int, project: Project, withFiles: bool = False) -> bool: Update a project
         deleteProject(projectId: int) -> None: Delete a project
-        getProject(projectId: int) -> Project: Get a project by id
+        getProject(projectId: int, withPoints: bool = True) -> Project: Get a project by id
         projectExists(projectId: int) -> bool: Check if a project exists
         getProjectPoints(projectId: int) -> List[Point]: Get all points of a project
+        getPointSet(projectId: int) -> PointSet: Get the coordinates of all points of a project as arrays
         getPoint(projectId: int, pointId: int, byDBID:bool = False) -> Point: Get a point of a project by id
         removeAllProjectPoints(projectId: int) -> bool: Remove all points from a project
         removePoint(projectId: int, pointId: int) -> bool: Remove a point from a project
         addPoint(projectId: int, point: Point) -> int: Add a point to a project
         updatePoint(projectId: int, pointId: int, point: Point) -> bool: Update a point of a project
+        updatePoints(projectId: int, points: List[Point]) -> bool: Update several points of a project in one batch
+        fitPoints(projectId: int, order: int = 1, save: bool = True) -> dict: Fit the transform of a project to its points and get the residuals
         validatepoints(points: List[Point]) -> bool: Validate the points
         getImageFile(projectId: int) -> bytes: Get the image file of a project
         getImageFilePath(projectId: int) -> str: Get the image file path of a project
+        getProjectRecord(projectId: int) -> dict: Get the stored record of a project, to pass to getFileVersions and getTile
+        getFileVersions(projectId: int, project: dict = None) -> dict: Get the content hashes of the files of a project and its last modification time
         saveImageFile(projectId: int, file: tempfile, fileType: str) -> None: Save the image file of a project
         removeImageFile(projectId: int) -> None: Remove the image file of a project
         getGeoreferencedFile(projectId: int) -> bytes: Get the georeferenced file of a project
         getGeoreferencedFilePath(projectId: int) -> str: Get the georeferenced file path of a project
-        saveGeoreferencedFile(projectId: int, file: bytes, fileType: str) -> None: Save the georeferenced file of a project
+        saveGeoreferencedFile(projectId: int, file: bytes, fileType: str, mercatorFile: bytes = None, rasterInfo: dict = None, cacheKey: str = None) -> None: Save the georeferenced file of a project
+        useGeoreferencedFile(projectId: int, entry: GeorefCacheEntry) -> None: Use a georeferenced file from the georeference cache for a project
+        releaseGeoreferencedFile(georeferencedFilePath: str, mercatorFilePath: str = None) -> None: Release a georeferenced file no longer used by a project
         removeGeoreferencedFile(projectId: int) -> None: Remove the georeferenced file of a project
-        georefPNGImage(projectId: int, crs: str = None) -> None: Georeference the image of a project
+        georefPNGImage(projectId: int, crs: str = None, cancelEvent: threading.Event = None, progress: Callable = None, lazy: bool = None, proxy: bool = None) -> Union[GeorefJob, None]: Georeference the image of a project
+        storeGeoreference(projectId: int, project: Project, georeferenced_image_bytes: bytes, stats: dict, cacheKey: str = None, cancelEvent: threading.Event = None) -> None: Save a georeferenced file made from the image of a project
+        canUpdateGeoreference(project: Project) -> bool: Check if the georeferenced file of a project can be updated by only rewriting its header
+        isLazyGeoreference(project: Project) -> bool: Check if a project only has a VRT file placing its image
+        materializeGeoreference(projectId: int) -> bool: Write the full resolution georeferenced file of a project with a lazy georeference or a proxy
+        discardPendingGeoreference(projectId: int) -> bool: Drop the lazy georeference or proxy of a project whose image is replaced or removed
+        georefFileOptions() -> dict: Get the output options that change the georeferenced file itself
+        georefCacheKey(project: Project, points: PointSet, crs: str) -> Union[str, None]: Get the georeference cache key of the current input of a project
+        submitGeorefJob(projectId: int, crs: str = None, lazy: bool = None, proxy: bool = None) -> GeorefJob: Submit a job georeferencing the image of a project in the background
+        getGeorefJob(projectId: int, jobId: str) -> GeorefJob: Get a georeferencing job of a project
         getImageCoordinates(projectId: int) -> List: Get the corner coordinates of the image of a project
+        previewGeoreference(projectId: int, crs: str = None) -> dict: Get where the image of a project will be placed by its current points
+        getTile(projectId: int, z: int, x: int, y: int, project: dict = None) -> bytes: Get a map tile of the georeferenced image of a project
+        loadTileStore(projectId: int, version: str, tilesFilePath: str) -> None: Make a local copy of the tile store of a project
+        saveTileStore(projectId: int, version: str, storePath: str) -> None: Save a finished tile store of a project
+        removeTileStore(projectId: int) -> None: Cancel the tile pyramid build and remove the tile store of a project
     """
 
     _FileStorage: FileStorage = None
     _StorageHandler: StorageHandler = None
-
-    def __init__(self, FileS: FileStorage, SHandler: StorageHandler):
+    _TileCache: TileCache = None
+    _TilePyramid: TilePyramidBuilder = None
+    _DatasetPool: DatasetPool = None
+    _Executor: TaskExecutor = None
+    _GeorefOptions: dict = None
+    _GeorefJobs: GeorefJobQueue = None
+    _GeorefCache: GeorefCache = None
+    _TileStoreLoads: dict = None
+
+    def __init__(self, FileS: FileStorage, SHandler: StorageHandler, tileCache: TileCache = None, tilePyramid: TilePyramidBuilder = None, datasetPool: DatasetPool = None, executor: TaskExecutor = None, georefOptions: dict = None, georefJobs: GeorefJobQueue = None, georefCache: GeorefCache = None):
         self._FileStorage = FileS
         self._StorageHandler = SHandler
+        self._TileCache = tileCache if tileCache is not None else TileCache()
+        self._TilePyramid = tilePyramid if tilePyramid is not None else TilePyramidBuilder()
+        self._DatasetPool = datasetPool if datasetPool is not None else DatasetPool()
+        self._Executor = executor if executor is not None else TaskExecutor.getInstance()
+        self._GeorefOptions = georefOptions if georefOptions is not None else dict(georef.defaultOutputOptions)
+        self._GeorefJobs = georefJobs if georefJobs is not None else GeorefJobQueue()
+        self._GeorefCache = georefCache if georefCache is not None else GeorefCache(FileS, SHandler)
+        self._TileStoreLoads = {}
     
     ### Projects
     async def createProject(self, project: Project) -> int:
@@ -69,8 +131,8 @@ class ProjectHandler:
         """
 
         project.id = None
-        project.imageFilePath = ""
-        project.georeferencedFilePath = ""
+        for field in fileFields:
+            setattr(project, field, "")
         project.selfdestructtime = None #TODO: add self destruct time logic
         project.created = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         project.lastModified = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -78,12 +140,16 @@ class ProjectHandler:
         ID = await self._StorageHandler.saveInStorage(project, "project")
         return ID
     
-    async def updateProject(self, projectId: int, project: Project) -> bool:
+    async def updateProject(self, projectId: int, project: Project, withFiles: bool = False) -> bool:
         """Update a project
 
+        The file fields of a project (the paths, content hashes and raster information of its files) are owned by the project handler,
+        they are only updated with withFiles, so an update from the API never detaches a project from its files.
+
         Args:
             projectId (int): The id of the project to update
             project (Project): The updated project object
+            withFiles (bool, optional): Also update the file fields, only set by the project handler when it saves or removes files. Defaults to False.
 
         Returns:
             bool: True if the project was updated successfully, False otherwise
@@ -109,6 +175,8 @@ class ProjectHandler:
         innProject: dict = dict(project)
         fetchedProjectDict: dict = dict(fetchedProject)
         specialFields = ["id", "created", "lastModified", "points"]
+        if not withFiles:
+            specialFields += fileFields
         for key in fetchedProjectDict:
             if key in innProject:
                 if key == "points":
@@ -136,18 +204,24 @@ class ProjectHandler:
         project = await self._StorageHandler.fetchOne(projectId, "project")
         if project is None: raise Exception("Project not found")
         if project["imageFilePath"] != "": await self._FileStorage.removeFile(project["imageFilePath"])
-        if project["georeferencedFilePath"] != "": await self._FileStorage.removeFile(project["georeferencedFilePath"])
+        if project["georeferencedFilePath"]: await self.releaseGeoreferencedFile(project["georeferencedFilePath"], project["mercatorFilePath"])
+        if project["tilesFilePath"]: await self._FileStorage.removeFile(project["tilesFilePath"])
+        self._TilePyramid.cancel(projectId)
+        self._DatasetPool.invalidate(projectId)
+        self._TileCache.invalidate(projectId)
+        self._GeorefJobs.cancelProject(projectId, "The project was deleted")
 
         points = await self._StorageHandler.fetch("point", {"projectId": projectId})
         for point in points:
             await self._StorageHandler.remove(point["id"], "point")
         await self._StorageHandler.remove(projectId, "project")
     
-    async def getProject(self, projectId: int) -> Project:
+    async def getProject(self, projectId: int, withPoints: bool = True) -> Project:
         """Get a project by id
 
         Args:
             projectId (int): The id of the project to get
+            withPoints (bool, optional): Get the points of the project as Point objects, set False when the points are read with getPointSet. Defaults to True.
 
         Returns:
             Project: The project object with the given id if it exists.
@@ -156,6 +230,9 @@ class ProjectHandler:
         project = await self._StorageHandler.fetchOne(projectId, "project")
         project : Project = Project.model_construct(None, **project)
         if project is None: raise Exception("Project not found")
+        if not withPoints:
+            project.points = PointList()
+            return project
         try:
             points = await self.getProjectPoints(projectId)
         except:
@@ -204,6 +281,19 @@ class ProjectHandler:
         list: List[Point] = [Point.model_construct(None ,**point) for point in Points]
         if len(list) == 0: raise Exception("points is empty")
         return list
+
+    async def getPointSet(self, projectId: int) -> PointSet:
+        """Get the coordinates of all points of a project as arrays, without making a Point object per point
+
+        Args:
+            projectId (int): The id of the project, which points to get
+
+        Returns:
+            PointSet: The points of the project ordered by Idproj, empty if the project has no points
+        """
+
+        rows = await self._StorageHandler.fetchColumns("point", list(PointSet.columns), {"projectId": projectId}, "Idproj")
+        return PointSet.fromRows(rows or [])
     
     async def getPoint(self, projectId: int, pointId: int, byDBID:bool = False) -> Point:
         """Get a point of a project by id
@@ -255,6 +345,7 @@ class ProjectHandler:
         if points is not None and points != []:
             for point in points:
                 await self._StorageHandler.remove(point["id"], "point")
+            self._GeorefJobs.cancelProject(projectId, "The points of the project changed")
             return True
         raise Exception("No points found for this project")
 
@@ -275,6 +366,7 @@ class ProjectHandler:
         points = await self._StorageHandler.fetch("point", params)
         if points is not None and points != []:
             await self._StorageHandler.remove(points[0]["id"], "point")
+            self._GeorefJobs.cancelProject(projectId, "The points of the project changed")
             return True
         raise Exception("Point not found")
 
@@ -310,6 +402,7 @@ class ProjectHandler:
         dbid = await self._StorageHandler.saveInStorage(point, "point", "id")
         if dbid is None:
             raise Exception("Failed to save point")
+        self._GeorefJobs.cancelProject(projectId, "The points of the project changed")
         return (point.Idproj, dbid)
 
     async def updatePoint(self, projectId: int, pointId: int, point: Point) -> bool:
@@ -347,33 +440,96 @@ class ProjectHandler:
         newpoint : Point = updatedPoint
         dbid = fetchedPointDict["id"]
         await self._StorageHandler.update(dbid, newpoint, "point")
+        self._GeorefJobs.cancelProject(projectId, "The points of the project changed")
         return True
 
-    def validatepoints(self, points: List[Point]) -> bool:
-        """Validate the points
+    async def updatePoints(self, projectId: int, points: List[Point]) -> bool:
+        """Update several points of a project in one batch, like updatePoint
 
         Args:
-            points (List[Point]): The list of points to validate
+            projectId (int): The id of the project, which the points belong to
+            points (List[Point]): The updated point objects, matched to the points of the project by Idproj
 
         Returns:
-            bool: True if the points are valid, False otherwise
+            bool: True if the points were updated successfully
         """
-        
+
+        if await self.projectExists(projectId) == False:
+            raise Exception("Project not found")
+        if self.validatepoints(points) == False:
+            raise Exception("Invalid point")
+
+        fetchedPoints = await self._StorageHandler.fetch("point", {"projectId": projectId})
+        fetchedPointDicts = {fetchedPointDict["Idproj"]: fetchedPointDict for fetchedPointDict in (fetchedPoints or [])}
+        items = []
+        moved = False
         for point in points:
-            if isinstance(point, Point) == False:
-                try:
-                    point = Point.model_construct(None, **point)
-                    if point is None:
-                        raise Exception("Invalid point object")
-                except:
-                    raise Exception("Invalid point object")
-            if hasattr(point, "lat") == False or hasattr(point, "lng") == False or hasattr(point, "col") == False or hasattr(point, "row") == False:
-                raise Exception("Failed to validate points attributes")
-                #return False #TODO: check if this is the correct way to handle this
-            if point.lat is None or point.lng is None or point.col is None or point.row is None:
-                return False
-            
+            fetchedPointDict = fetchedPointDicts.get(point.Idproj)
+            if fetchedPointDict is None:
+                raise Exception(f"Point not found: {point.Idproj}")
+            updatedPoint: Point = Point.model_construct(None, **fetchedPointDict)
+            moved = moved or (updatedPoint.lat, updatedPoint.lng, updatedPoint.col, updatedPoint.row) != (point.lat, point.lng, point.col, point.row)
+            #Tranfering values
+            updatedPoint.lat = point.lat
+            updatedPoint.lng = point.lng
+            updatedPoint.col = point.col
+            updatedPoint.row = point.row
+            updatedPoint.error = point.error
+            updatedPoint.name = point.name
+            updatedPoint.description = point.description
+            items.append((fetchedPointDict["id"], updatedPoint))
+
+        await self._StorageHandler.updateMany(items, "point")
+        #only the error, name or description changed, the georeferenced result stays the same
+        if moved:
+            self._GeorefJobs.cancelProject(projectId, "The points of the project changed")
         return True
+
+    async def fitPoints(self, projectId: int, order: int = 1, save: bool = True) -> dict:
+        """Fit the transform from pixel to map coordinates of a project to its points, and get the residual of each point
+
+        Only the points are used, the image is not read, see gcpFit.fitTransform.
+
+        Args:
+            projectId (int): The id of the project, which the points belong to
+            order (int, optional): The order of the polynomial, 1 for an affine transform. Defaults to 1.
+            save (bool, optional): Save the error in pixels of each point to the error field of the point. Defaults to True.
+
+        Raises:
+            ValueError: If the points can not be fitted, see gcpFit.fitTransform, nothing is saved then
+
+        Returns:
+            dict: The fitted transform, the root mean square error and the residuals of the points, see gcpFit.fitTransform
+        """
+
+        if not save:
+            return gcpFit.fitTransform(await self.getPointSet(projectId), order)
+        points = await self.getProjectPoints(projectId)
+        fit = gcpFit.fitTransform(PointSet.fromPoints(points), order)
+        for (point, error) in zip(points, fit["residuals"]["errorPixels"]):
+            point.error = error
+        await self.updatePoints(projectId, points)
+        return fit
+
+    def validatepoints(self, points: List[Point]) -> bool:
+        """Validate the points
+
+        Args:
+            points (List[Point]): The list of points to validate, point objects or dictionaries
+
+        Raises:
+            Exception: If a point is not a point object or dictionary, or a coordinate is not a number
+
+        Returns:
+            bool: True if the lat, lng, col and row of every point are set and finite, False otherwise
+        """
+
+        if any(isinstance(point, (Point, dict)) == False for point in points):
+            raise Exception("Invalid point object")
+        try:
+            return PointSet.fromPoints(points).isValid()
+        except (TypeError, ValueError):
+            raise Exception("Invalid point object")
     
     ### Files
     async def getImageFile(self, projectId: int) -> bytes:
@@ -406,6 +562,46 @@ class ProjectHandler:
         project = await self._StorageHandler.fetchOne(projectId, "project")
         return project["imageFilePath"]
     
+    async def getProjectRecord(self, projectId: int) -> dict:
+        """Get the stored record of a project, so a request can read it once and pass it to getFileVersions and getTile
+
+        Args:
+            projectId (int): The id of the project
+
+        Returns:
+            dict: The stored fields of the project
+
+        Raises:
+            Exception: If the project does not exist
+        """
+
+        project = await self._StorageHandler.fetchOne(projectId, "project")
+        if project is None:
+            raise Exception("Project not found")
+        return project
+
+    async def getFileVersions(self, projectId: int, project: dict = None) -> dict:
+        """Get the content hashes of the files of a project and its last modification time, without reading the files
+
+        Args:
+            projectId (int): The id of the project
+            project (dict, optional): The record of the project from getProjectRecord, read from storage if not given. Defaults to None.
+
+        Returns:
+            dict: The imageHash, georeferencedHash and lastModified of the project,
+                  and the lazyHash of the VRT file the georeferenced file was written from, if any
+        """
+
+        if project is None:
+            project = await self.getProjectRecord(projectId)
+        #files saved before content hashes were stored are identified by their path, which is unique for every saved file
+        return {
+            "imageHash": project["imageHash"] or contentHash(str(project["imageFilePath"]).encode()),
+            "georeferencedHash": project["georeferencedHash"] or contentHash(str(project["georeferencedFilePath"]).encode()),
+            "lastModified": project["lastModified"],
+            "lazyHash": ((georef.parseRasterInfo(project["rasterInfo"]) or {}).get("georef") or {}).get("lazyHash"),
+        }
+
     async def saveImageFile(self, projectId: int, file: tempfile, fileType: str) -> None:
         """Save the image file of a project
 
@@ -420,6 +616,8 @@ class ProjectHandler:
         if fileType.find("png") == -1:
             raise Exception(status_code=415, description="Invalid file type")
         
+        #a lazy georeference or proxy refers to the old image, it is dropped instead of georeferencing the image being replaced
+        await self.discardPendingGeoreference(projectId)
         project = await self._StorageHandler.fetchOne(projectId, "project")
 
         if "imageFilePath" in project and project["imageFilePath"]:
@@ -437,8 +635,10 @@ class ProjectHandler:
         except Exception as e:
             raise Exception(f"Failed to save file: {e}")
         project["imageFilePath"] = filePath
+        project["imageHash"] = contentHash(file)
         project = Project.model_construct(None, **project)
-        await self.updateProject(projectId, project)
+        await self.updateProject(projectId, project, withFiles=True)
+        self._GeorefJobs.cancelProject(projectId, "The image of the project changed")
 
     async def removeImageFile(self, projectId: int) -> None:
         """Remove the image file of a project
@@ -447,11 +647,13 @@ class ProjectHandler:
             projectId (int): The id of the project, which the image belongs to
         """
 
+        await self.discardPendingGeoreference(projectId)
         project = await self._StorageHandler.fetchOne(projectId, "project")
         await self._FileStorage.remove(project["imageFilePath"])
         project["imageFilePath"] = ""
+        project["imageHash"] = ""
         project = Project.model_construct(None, **project)
-        await self.updateProject(projectId, project)
+        await self.updateProject(projectId, project, withFiles=True)
     
     async def getGeoreferencedFile(self, projectId: int) -> bytes:
         """Get the georeferenced file of a project
@@ -460,9 +662,10 @@ class ProjectHandler:
             projectId (int): The id of the project, which the georeferenced file belongs to
 
         Returns:
-            bytes: The georeferenced file in bytes of the project
+            bytes: The georeferenced file in bytes of the project, written first if the project has a lazy georeference
         """
 
+        await self.materializeGeoreference(projectId)
         project = await self._StorageHandler.fetchOne(projectId, "project")
         filePath = project["georeferencedFilePath"]
         file = await self._FileStorage.readFile(filePath)
@@ -483,28 +686,88 @@ class ProjectHandler:
         project = await self._StorageHandler.fetchOne(projectId, "project")
         return project["georeferencedFilePath"]
           
-    async def saveGeoreferencedFile(self, projectId: int, file: bytes, fileType: str) -> None:
+    async def saveGeoreferencedFile(self, projectId: int, file: bytes, fileType: str, mercatorFile: bytes = None, rasterInfo: dict = None, cacheKey: str = None) -> None:
         """Save the georeferenced file of a project
 
         Args:
             projectId (int): The id of the project, which the georeferenced file belongs to
             file (bytes): The georeferenced file to save
-            fileType (str): The type of the file
+            fileType (str): The type of the file, tiff or vrt for a lazy georeference
+            mercatorFile (bytes, optional): The Web Mercator copy of the georeferenced file, used for rendering map tiles
+            rasterInfo (dict, optional): Information about the georeferenced file, see georefHelper.getRasterInfo
+            cacheKey (str, optional): The georeference cache key of the file, if set the file is shared with projects georeferenced with the same input
         """
 
-        if fileType.find("tiff") == -1:
+        if fileType.find("tiff") == -1 and fileType != "vrt":
             raise Exception("Invalid file type")
         
         project = await self._StorageHandler.fetchOne(projectId, "project")
 
         if "georeferencedFilePath" in project and project["georeferencedFilePath"]:
             await self.removeGeoreferencedFile(projectId)
+            project = await self._StorageHandler.fetchOne(projectId, "project")
+        self._TilePyramid.cancel(projectId)
 
-        filePath = await self._FileStorage.saveFile(file, ".tiff")
+        filePath = await self._FileStorage.saveFile(file, ".vrt" if fileType == "vrt" else ".tiff")
+        mercatorFilePath = ""
+        if mercatorFile is not None:
+            mercatorFilePath = await self._FileStorage.saveFile(mercatorFile, ".tiff")
 
         project["georeferencedFilePath"] = filePath
+        project["georeferencedHash"] = contentHash(file)
+        project["mercatorFilePath"] = mercatorFilePath
+        project["rasterInfo"] = json.dumps(rasterInfo) if rasterInfo is not None else ""
+        if cacheKey is not None:
+            entry = GeorefCacheEntry(
+                cacheKey=cacheKey,
+                georeferencedFilePath=filePath,
+                georeferencedHash=project["georeferencedHash"],
+                mercatorFilePath=mercatorFilePath,
+                rasterInfo=project["rasterInfo"],
+                size=len(file) + (len(mercatorFile) if mercatorFile is not None else 0),
+            )
+            await self._GeorefCache.store(cacheKey, entry)
+        project = Project.model_construct(None, **project)
+        await self.updateProject(projectId, project, withFiles=True)
+        self._DatasetPool.invalidate(projectId)
+        self._TileCache.invalidate(projectId)
+
+    async def useGeoreferencedFile(self, projectId: int, entry: GeorefCacheEntry) -> None:
+        """Use a georeferenced file from the georeference cache as the georeferenced file of a project, only the metadata is copied
+
+        Args:
+            projectId (int): The id of the project
+            entry (GeorefCacheEntry): The cache entry, acquired from the georeference cache for this project
+        """
+
+        project = await self._StorageHandler.fetchOne(projectId, "project")
+        if "georeferencedFilePath" in project and project["georeferencedFilePath"]:
+            await self.removeGeoreferencedFile(projectId)
+            project = await self._StorageHandler.fetchOne(projectId, "project")
+        self._TilePyramid.cancel(projectId)
+
+        project["georeferencedFilePath"] = entry.georeferencedFilePath
+        project["georeferencedHash"] = entry.georeferencedHash
+        project["mercatorFilePath"] = entry.mercatorFilePath or ""
+        project["rasterInfo"] = entry.rasterInfo or ""
         project = Project.model_construct(None, **project)
-        await self.updateProject(projectId, project)
+        await self.updateProject(projectId, project, withFiles=True)
+        self._DatasetPool.invalidate(projectId)
+        self._TileCache.invalidate(projectId)
+
+    async def releaseGeoreferencedFile(self, georeferencedFilePath: str, mercatorFilePath: str = None) -> None:
+        """Release a georeferenced file no longer used by a project, the file is removed unless it is kept by the georeference cache
+
+        Args:
+            georeferencedFilePath (str): The path to the georeferenced file
+            mercatorFilePath (str, optional): The path to the Web Mercator copy of the georeferenced file
+        """
+
+        if await self._GeorefCache.release(georeferencedFilePath):
+            return
+        await self._FileStorage.removeFile(georeferencedFilePath)
+        if mercatorFilePath:
+            await self._FileStorage.removeFile(mercatorFilePath)
 
     async def removeGeoreferencedFile(self, projectId: int) -> None:
         """Remove the georeferenced file of a project
@@ -513,50 +776,373 @@ class ProjectHandler:
             projectId (int): The id of the project, which the georeferenced file belongs to
         """
 
+        await self.removeTileStore(projectId)
         project = await self._StorageHandler.fetchOne(projectId, "project")
-        await self._FileStorage.removeFile(project["georeferencedFilePath"])
+        await self.releaseGeoreferencedFile(project["georeferencedFilePath"], project["mercatorFilePath"])
         project["georeferencedFilePath"] = ""
+        project["georeferencedHash"] = ""
+        project["mercatorFilePath"] = ""
+        project["rasterInfo"] = ""
         project = Project.model_construct(None, **project)
-        await self.updateProject(projectId, project)
+        await self.updateProject(projectId, project, withFiles=True)
+        self._DatasetPool.invalidate(projectId)
+        self._TileCache.invalidate(projectId)
     
     ### Georeferencing
-    async def georefPNGImage(self, projectId: int, crs: str = None) -> None:
+    async def georefPNGImage(self, projectId: int, crs: str = None, cancelEvent: threading.Event = None, progress: Callable = None, lazy: bool = None, proxy: bool = None) -> Union[GeorefJob, None]:
         """Georeference the image of a project
 
+        If the same image was georeferenced before with the same points, crs and output options, by this or another project,
+        the georeferenced file in the georeference cache is used without georeferencing the image again.
+        If the image has not changed since the georeferenced file was made with the same output options,
+        only the header of the georeferenced file is rewritten with the new points, see canUpdateGeoreference.
+        Images that need more than the memoryLimitMB georeferencing option when decoded are streamed from storage window by window.
+        A lazy georeference only stores a VRT file placing the image, tiles are warped from the image and the georeferenced file
+        is written when it is downloaded, see materializeGeoreference. Images above memoryLimitMB are always georeferenced.
+        With a proxy, a copy of the image downsampled to the proxySize georeferencing option is georeferenced first, so tiles can be served at once,
+        and a job georeferencing the full resolution image is submitted, its file replaces the proxy when it is done.
+        The quality in the raster information of the project tells which of the two the tiles are served from.
+
         Args:
             projectId (int): The id of the project, which the image belongs to
             crs (str, optional): Cordinate refrence system. Defaults to None.
-        """
+            cancelEvent (threading.Event, optional): If set before the georeferenced file is saved, nothing is saved
+            progress (Callable, optional): Called with (windowsDone, windowsTotal) while an image is georeferenced window by window
+            lazy (bool, optional): Only store a VRT file placing the image. Defaults to the lazy georeferencing option.
+            proxy (bool, optional): Georeference a downsampled copy first. Defaults to the proxy georeferencing option.
 
-        #get the project and read the image file
-        project = await self.getProject(projectId)
-        imageBytes = await self._FileStorage.readFile(project.imageFilePath)
+        Raises:
+            Exception: Georeferencing was cancelled
 
-        #write the image bytes to a temporary image file
-        with tempfile.NamedTemporaryFile(delete=False) as temp_image:
-            temp_image.write(imageBytes)
-            temp_image_path = temp_image.name
+        Returns:
+            Union[GeorefJob, None]: The job georeferencing the full resolution image if a proxy was made, otherwise None
+        """
 
-        #get the points of the project and georeference the image
-        points : PointList = project.points
-        temp_georeferenced_image = None
+        #get the project and the points of the project
+        project = await self.getProject(projectId, withPoints=False)
+        points = await self.getPointSet(projectId)
+        georeferenced_image_bytes = None
+        measure = self._GeorefOptions.get("measureMemory", False)
         if crs is None:
-            temp_georeferenced_image = georef.InitialGeoreferencePngImage(temp_image_path, points) #goreference the image, return the path to the georeferenced file
-        else:
-            temp_georeferenced_image = georef.InitialGeoreferencePngImage(temp_image_path, points, crs) #goreference the image, return the path to the georeferenced file
-
-        #we are done with the temporary image file, remove it
-        removeFile(temp_image_path)
+            crs = georef.defaultCrs
+        if lazy is None:
+            lazy = self._GeorefOptions.get("lazy", False)
+        if proxy is None:
+            proxy = self._GeorefOptions.get("proxy", False)
+
+        #the input was georeferenced before, only the metadata of the cached georeferenced file is copied to the project
+        cacheKey = self.georefCacheKey(project, points, crs)
+        if cacheKey is not None:
+            entry = await self._GeorefCache.acquire(cacheKey)
+            if entry is not None:
+                if entry.georeferencedFilePath == project.georeferencedFilePath:
+                    #the project already uses the file, give back the extra reference
+                    await self._GeorefCache.release(entry.georeferencedFilePath)
+                    return
+                if cancelEvent is not None and cancelEvent.is_set():
+                    await self._GeorefCache.release(entry.georeferencedFilePath)
+                    raise Exception("Georeferencing was cancelled")
+                await self.useGeoreferencedFile(projectId, entry)
+                if self._TilePyramid.enabled:
+                    georeferenced_image_bytes = await self._FileStorage.readFile(entry.georeferencedFilePath)
+                    self._TilePyramid.start(projectId, entry.georeferencedFilePath, georeferenced_image_bytes, self.saveTileStore)
+                return
+
+        imagePath = self._FileStorage.gdalPath(project.imageFilePath)
+        gdalOptions = self._FileStorage.gdalOptions()
+        memoryLimit = int(self._GeorefOptions.get("memoryLimitMB", georef.defaultOutputOptions["memoryLimitMB"])) * 1024 * 1024
+        imageSize = None
+
+        #only place the image, nothing is decoded until a tile is requested
+        if lazy:
+            imageSize = await self._Executor.run("georef", georef.getImageMemorySize, imagePath, gdalOptions)
+            if imageSize <= memoryLimit:
+                vrt_bytes = await self._Executor.run("georef", georef.georeferenceVrt, imagePath, points, crs, gdalOptions)
+                raster_info = None
+                try:
+                    raster_info = await self._Executor.run("georef", georef.getRasterInfo, vrt_bytes, gdalOptions)
+                    raster_info["imageHash"] = project.imageHash
+                    raster_info["quality"] = "full"
+                    raster_info["georef"] = {"mode": "lazy"}
+                    #the georeferenced file written from the VRT is added to the georeference cache under the key of this input
+                    raster_info["cacheKey"] = cacheKey
+                except Exception as e:
+                    logger.warning("Raster information for project %s could not be read : %s", projectId, e)
+                if cancelEvent is not None and cancelEvent.is_set():
+                    raise Exception("Georeferencing was cancelled")
+                await self.saveGeoreferencedFile(projectId, vrt_bytes, "vrt", None, raster_info)
+                return
+
+        #only the points changed, reuse the pixel data and overviews of the georeferenced file
+        if self.canUpdateGeoreference(project):
+            try:
+                tiffBytes = await self._FileStorage.readFile(project.georeferencedFilePath)
+                (georeferenced_image_bytes, stats) = await self._Executor.run("georef", georef.runMeasured, measure, georef.updateGeoreference, tiffBytes, points, crs)
+                mode = "header"
+            except Exception as e:
+                logger.warning("Georeferenced file for project %s could not be updated, georeferencing the image again : %s", projectId, e)
+                georeferenced_image_bytes = None
+
+        #serve the tiles from a downsampled copy until the full resolution image is georeferenced in the background
+        if georeferenced_image_bytes is None and proxy:
+            proxySize = int(self._GeorefOptions.get("proxySize", georef.defaultOutputOptions["proxySize"]))
+            (width, height) = await self._Executor.run("georef", georef.getImageSize, imagePath, gdalOptions)
+            if max(width, height) > proxySize:
+                (proxy_bytes, stats) = await self._Executor.run("georef", georef.runMeasured, measure, georef.georeferenceProxy, imagePath, points, crs, proxySize, gdalOptions)
+                raster_info = None
+                try:
+                    raster_info = await self._Executor.run("georef", georef.getRasterInfo, proxy_bytes)
+                    raster_info["imageHash"] = project.imageHash
+                    raster_info["quality"] = "proxy"
+                    raster_info["georef"] = {"mode": "proxy", **stats}
+                except Exception as e:
+                    logger.warning("Raster information for project %s could not be read : %s", projectId, e)
+                if cancelEvent is not None and cancelEvent.is_set():
+                    raise Exception("Georeferencing was cancelled")
+                await self.saveGeoreferencedFile(projectId, proxy_bytes, "tiff", None, raster_info)
+                return await self.submitGeorefJob(projectId, crs, lazy=False, proxy=False)
+
+        if georeferenced_image_bytes is None:
+            if imageSize is None:
+                imageSize = await self._Executor.run("georef", georef.getImageMemorySize, imagePath, gdalOptions)
+            if imageSize > memoryLimit:
+                #the image is too large to decode at once, stream it from storage window by window into a file on disk
+                temp_georeferenced_image = getUniqeFileName('.tiff')
+                try:
+                    (_, stats) = await self._Executor.run("georef", georef.runMeasured, measure, georef.georeferenceImageWindowed,
+                                                          imagePath, temp_georeferenced_image, points, crs, self._GeorefOptions, gdalOptions, progress, cancelEvent)
+                    with open(temp_georeferenced_image, 'rb') as file:
+                        georeferenced_image_bytes = file.read()
+                finally:
+                    removeFile(temp_georeferenced_image)
+                mode = "windowed"
+            else:
+                #goreference the image bytes in the executor, the image is only written to GDAL's in-memory file system
+                imageBytes = await self._FileStorage.readFile(project.imageFilePath)
+                (georeferenced_image_bytes, stats) = await self._Executor.run("georef", georef.runMeasured, measure, georef.georeferenceImage, imageBytes, points, crs, self._GeorefOptions)
+                mode = "full"
 
         # if for some reason the image could not be georeferenced, raise an exception
-        if temp_georeferenced_image is None:
+        if not georeferenced_image_bytes:
             raise Exception("Image could not be georeferenced")
-        
-        #get the bytes of the georeferenced image, remove the temporary file and save the bytes to storage
-        with open(temp_georeferenced_image, 'rb') as file:
-            georeferenced_image_bytes = file.read()
-        removeFile(temp_georeferenced_image)
-        await self.saveGeoreferencedFile(projectId, georeferenced_image_bytes, "tiff")
+        await self.storeGeoreference(projectId, project, georeferenced_image_bytes, {"mode": mode, **stats}, cacheKey, cancelEvent)
+
+    async def storeGeoreference(self, projectId: int, project: Project, georeferenced_image_bytes: bytes, stats: dict, cacheKey: str = None, cancelEvent: threading.Event = None) -> None:
+        """Save a georeferenced file made from the image of a project, with its raster information and Web Mercator copy
+
+        Args:
+            projectId (int): The id of the project
+            project (Project): The project, as it was when georeferencing started
+            georeferenced_image_bytes (bytes): The georeferenced file
+            stats (dict): How the file was made, stored in the raster information
+            cacheKey (str, optional): The georeference cache key of the input
+            cancelEvent (threading.Event, optional): If set before the georeferenced file is saved, nothing is saved
+
+        Raises:
+            Exception: Georeferencing was cancelled
+        """
+
+        #capture the footprint of the georeferenced image, so tiles outside it are answered without opening the image
+        raster_info = None
+        try:
+            raster_info = await self._Executor.run("georef", georef.getRasterInfo, georeferenced_image_bytes)
+            #remember what the file was made from, so the next georeference can reuse it
+            raster_info["imageHash"] = project.imageHash
+            raster_info["outputOptions"] = self.georefFileOptions()
+            raster_info["quality"] = "full"
+            raster_info["georef"] = stats
+        except Exception as e:
+            logger.warning("Raster information for project %s could not be read : %s", projectId, e)
+
+        #reproject the georeferenced image to Web Mercator once, so tiles are rendered without reprojection
+        mercator_image_bytes = None
+        if self._GeorefOptions.get("webMercator"):
+            try:
+                mercator_image_bytes = await self._Executor.run("georef", georef.reprojectToWebMercator, georeferenced_image_bytes, self._GeorefOptions)
+            except Exception as e:
+                #the tiles can still be rendered from the georeferenced image
+                logger.warning("Web Mercator copy for project %s could not be created : %s", projectId, e)
+
+        if cancelEvent is not None and cancelEvent.is_set():
+            raise Exception("Georeferencing was cancelled")
+        await self.saveGeoreferencedFile(projectId, georeferenced_image_bytes, "tiff", mercator_image_bytes, raster_info, cacheKey)
+
+        #pre-render the tile pyramid in the background if enabled
+        if self._TilePyramid.enabled:
+            version = await self.getGeoreferencedFilePath(projectId)
+            self._TilePyramid.start(projectId, version, georeferenced_image_bytes, self.saveTileStore)
+
+    def canUpdateGeoreference(self, project: Project) -> bool:
+        """Check if the georeferenced file of a project can be georeferenced again by only rewriting its header
+
+        Args:
+            project (Project): The project
+
+        Returns:
+            bool: True if the georeferenced file was made from the current image with the current output options
+        """
+
+        if not project.georeferencedFilePath or not project.imageHash or self.isLazyGeoreference(project):
+            return False
+        rasterInfo = georef.parseRasterInfo(project.rasterInfo)
+        if rasterInfo is None:
+            return False
+        return rasterInfo.get("imageHash") == project.imageHash and rasterInfo.get("outputOptions") == self.georefFileOptions()
+
+    def isLazyGeoreference(self, project: Project) -> bool:
+        """Check if a project only has a lazy georeference, a VRT file placing its image instead of a georeferenced file
+
+        Args:
+            project (Project): The project
+
+        Returns:
+            bool: True if the georeferenced file of the project is a VRT file
+        """
+
+        return bool(project.georeferencedFilePath) and project.georeferencedFilePath.endswith(".vrt")
+
+    async def materializeGeoreference(self, projectId: int) -> bool:
+        """Write the full resolution georeferenced file of a project with a lazy georeference or a proxy
+
+        For a lazy georeference the file is written from the VRT file placing the image, it has the placement of the VRT file, also if the points changed since.
+        For a proxy the image is georeferenced with the current points, without waiting for the job that will replace the proxy.
+
+        Args:
+            projectId (int): The id of the project
+
+        Returns:
+            bool: True if the georeferenced file was written, False if the project already has a full resolution georeferenced file
+        """
+
+        project = await self.getProject(projectId, withPoints=False)
+        rasterInfo = georef.parseRasterInfo(project.rasterInfo) or {}
+        if project.georeferencedFilePath and rasterInfo.get("quality") == "proxy":
+            await self.georefPNGImage(projectId, rasterInfo.get("crs"), lazy=False, proxy=False)
+            return True
+        if not self.isLazyGeoreference(project):
+            return False
+        vrtPath = project.georeferencedFilePath
+        vrtBytes = await self._FileStorage.readFile(vrtPath)
+        measure = self._GeorefOptions.get("measureMemory", False)
+        (georeferenced_image_bytes, stats) = await self._Executor.run("georef", georef.runMeasured, measure, georef.materializeVrt,
+                                                                      vrtBytes, self._GeorefOptions, self._FileStorage.gdalOptions())
+        #another request may have written the file or georeferenced the project again in the meantime
+        if await self.getGeoreferencedFilePath(projectId) != vrtPath:
+            return True
+        #the hash of the VRT file is kept, so jobs that made it still find their result
+        stats = {"mode": "materialized", "lazyHash": project.georeferencedHash, **stats}
+        await self.storeGeoreference(projectId, project, georeferenced_image_bytes, stats, rasterInfo.get("cacheKey"))
+        return True
+
+    async def discardPendingGeoreference(self, projectId: int) -> bool:
+        """Drop the lazy georeference or proxy of a project whose image is replaced or removed
+
+        A lazy georeference or proxy still reads the image of the project, so it can not outlive the image.
+        The georeferenced file is released from the georeference cache and the georeference of the project is cleared.
+        A full resolution georeferenced file does not read the image and is kept.
+        Failing to drop the georeference is logged and does not stop the change of the image.
+
+        Args:
+            projectId (int): The id of the project
+
+        Returns:
+            bool: True if a lazy georeference or proxy was dropped
+        """
+
+        try:
+            project = await self.getProject(projectId, withPoints=False)
+            rasterInfo = georef.parseRasterInfo(project.rasterInfo) or {}
+            if not self.isLazyGeoreference(project) and not (project.georeferencedFilePath and rasterInfo.get("quality") == "proxy"):
+                return False
+            await self.removeGeoreferencedFile(projectId)
+            return True
+        except Exception:
+            logger.exception("Failed to drop the lazy georeference of project %s", projectId)
+            return False
+
+    def georefFileOptions(self) -> dict:
+        """Get the output options that change the georeferenced file itself
+
+        Returns:
+            dict: The file options of the georeferencing output options, see georefHelper.fileOptionKeys
+        """
+
+        return {key: self._GeorefOptions.get(key) for key in georef.fileOptionKeys}
+
+    def georefCacheKey(self, project: Project, points: PointSet, crs: str) -> Union[str, None]:
+        """Get the georeference cache key of the current input of a project
+
+        Args:
+            project (Project): The project
+            points (PointSet): The points of the project, see getPointSet
+            crs (str): Cordinate refrence system
+
+        Returns:
+            Union[str, None]: The cache key, None if the content hash of the image is not known
+        """
+
+        if not project.imageHash:
+            return None
+        outputOptions = {**self.georefFileOptions(), "webMercator": bool(self._GeorefOptions.get("webMercator"))}
+        return georefCacheKey(project.imageHash, points, crs, outputOptions)
+
+    async def submitGeorefJob(self, projectId: int, crs: str = None, lazy: bool = None, proxy: bool = None) -> GeorefJob:
+        """Submit a job georeferencing the image of a project in the background
+
+        If a job with the same image, points and crs is already queued or running for the project, that job is returned.
+        A queued or running job with other input is cancelled.
+
+        Args:
+            projectId (int): The id of the project, which the image belongs to
+            crs (str, optional): Cordinate refrence system. Defaults to None.
+            lazy (bool, optional): Only store a VRT file placing the image, see georefPNGImage. Defaults to the lazy georeferencing option.
+            proxy (bool, optional): Georeference a downsampled copy of the image before submitting the job, see georefPNGImage. Defaults to the proxy georeferencing option.
+
+        Returns:
+            GeorefJob: The job, poll its status with getGeorefJob
+        """
+
+        project = await self.getProject(projectId, withPoints=False)
+        if not project.imageFilePath:
+            raise Exception("Project has no image")
+        if crs is None:
+            crs = georef.defaultCrs
+        if lazy is None:
+            lazy = self._GeorefOptions.get("lazy", False)
+        if proxy is None:
+            proxy = self._GeorefOptions.get("proxy", False)
+        if proxy and not lazy:
+            #the proxy is made before this returns, the job georeferencing the full resolution image is submitted by georefPNGImage
+            job = await self.georefPNGImage(projectId, crs, lazy=False, proxy=True)
+            if job is not None:
+                return job
+
+        #the key identifies the input of the job, identical input gives an identical georeferenced file
+        pointSet = await self.getPointSet(projectId)
+        points = list(zip(pointSet.Idproj.tolist(), pointSet.lat.tolist(), pointSet.lng.tolist(), pointSet.col.tolist(), pointSet.row.tolist()))
+        key = contentHash(json.dumps([project.imageHash or project.imageFilePath, crs, points, lazy]).encode())
+
+        async def runner(cancelEvent: threading.Event, progress: Callable) -> str:
+            await self.georefPNGImage(projectId, crs, cancelEvent, progress, lazy, proxy=False)
+            return (await self.getFileVersions(projectId))["georeferencedHash"]
+
+        return self._GeorefJobs.submit(projectId, key, runner)
+
+    async def getGeorefJob(self, projectId: int, jobId: str) -> GeorefJob:
+        """Get a georeferencing job of a project
+
+        Args:
+            projectId (int): The id of the project
+            jobId (str): The id of the job
+
+        Returns:
+            GeorefJob: The job
+        """
+
+        job = self._GeorefJobs.get(jobId)
+        if job is None or job.projectId != projectId:
+            raise Exception("Job not found")
+        return job
 
     async def getImageCoordinates(self, projectId: int):
         """Get the corner coordinates of the image of a project
@@ -568,22 +1154,182 @@ class ProjectHandler:
             [west, north, east south]: A list of corner coordinates in the order
         """
 
-        # get the project and read the image file
-        project = await self.getProject(projectId)
-        image = project.georeferencedFilePath
-        image_bytes = await self._FileStorage.readFile(image)
-        coordinates = None
+        # get the project, the bounds are stored with the project when the image is georeferenced
+        project = await self.getProject(projectId, withPoints=False)
+        rasterInfo = georef.parseRasterInfo(project.rasterInfo)
+        if rasterInfo is not None and "coordinates" in rasterInfo:
+            return rasterInfo["coordinates"]
 
-        # create a temporary file and get the image coordinates, then remove the temporary file
-        with tempfile.NamedTemporaryFile(delete=False) as temp:
-            temp.write(image_bytes)
-            temp_path = temp.name
-            temp.close()
-            coordinates = georef.getImageCoordinates(temp_path)
-            removeFile(temp_path)
+        # georeferenced before the bounds were stored, read them from the header of the georeferenced file, without reading the whole file
+        if not project.georeferencedFilePath:
+            raise Exception("Project has no georeferenced image")
+        path = self._FileStorage.gdalPath(project.georeferencedFilePath)
+        coordinates = await self._Executor.run("tiles", georef.getImageCoordinates, path, self._FileStorage.gdalOptions())
 
         # if the coordinates could not be found, raise an exception, otherwise return the coordinates
         if coordinates is None:
             raise Exception("Coordinates not found")
         return coordinates
- 
\ No newline at end of file
+
+    async def previewGeoreference(self, projectId: int, crs: str = None) -> dict:
+        """Get where the image of a project will be placed by its current points, without georeferencing the image
+
+        The affine transform is fitted to the points and only the size of the image is read from the header of the image file.
+
+        Args:
+            projectId (int): The id of the project
+            crs (str, optional): Cordinate refrence system. Defaults to None.
+
+        Returns:
+            dict: The transform, corners, bounds, world file and GeoJSON footprint of the image, see georefHelper.previewGeoreference
+        """
+
+        project = await self.getProject(projectId, withPoints=False)
+        if not project.imageFilePath:
+            raise Exception("Project has no image")
+        if crs is None:
+            crs = georef.defaultCrs
+        affine = gcpFit.fitTransform(await self.getPointSet(projectId), 1)["affine"]
+        path = self._FileStorage.gdalPath(project.imageFilePath)
+        (width, height) = await self._Executor.run("tiles", georef.getImageSize, path, self._FileStorage.gdalOptions())
+        return georef.previewGeoreference(affine, width, height, crs)
+
+    async def getTile(self, projectId: int, z: int, x: int, y: int, project: dict = None) -> bytes:
+        """Get a map tile of the georeferenced image of a project
+
+        Tiles are served from the tile cache when possible, otherwise the tile is rendered and cached.
+        Tiles are rendered from the Web Mercator copy of the georeferenced file if the project has one, otherwise from the georeferenced file.
+        Tiles outside the footprint of the image are answered blank, by the footprint stored with the project,
+        or by the footprint of the open file for projects georeferenced before the footprint was stored.
+
+        Args:
+            projectId (int): The id of the project
+            z (int): Zoom level of the tile
+            x (int): Column index of the tile
+            y (int): Row index of the tile
+            project (dict, optional): The record of the project from getProjectRecord, read from storage if not given. Defaults to None.
+
+        Returns:
+            bytes: The tile as PNG bytes
+        """
+
+        if project is None:
+            project = await self.getProjectRecord(projectId)
+        version = project["georeferencedFilePath"]
+        if not version:
+            raise Exception("Project has no georeferenced file")
+
+        #tiles outside the footprint of the image are empty, answer them without any file storage access
+        if z < georef.minTileZoom:
+            return georef.emptyTile
+        mercatorBounds = (georef.parseRasterInfo(project["rasterInfo"]) or {}).get("mercatorBounds")
+        if mercatorBounds is not None and not georef.tileIntersects(mercatorBounds, x, y, z):
+            return georef.emptyTile
+
+        tile = self._TileCache.get(projectId, version, z, x, y)
+        if tile is not None:
+            return tile
+
+        #look the tile up in the pre-rendered tile store, the store may still be rendering
+        if project["tilesFilePath"] and self._TilePyramid.getLocalStore(projectId, version) is None:
+            await self.loadTileStore(projectId, version, project["tilesFilePath"])
+        if self._TilePyramid.getLocalStore(projectId, version) is not None:
+            (tile, isKnown) = await self._Executor.run("tiles", self._TilePyramid.readTile, projectId, version, z, x, y)
+            if tile is None and isKnown:
+                tile = georef.emptyTile
+            if tile is not None:
+                self._TileCache.put(projectId, version, z, x, y, tile)
+                return tile
+
+        #render the tile from the open dataset of the project, opening it on first use
+        source = version
+        render = georef.generateTile
+        if project["mercatorFilePath"]:
+            source = project["mercatorFilePath"]
+            render = georef.generateMercatorTile
+        dataset = self._DatasetPool.acquire(projectId, source)
+        if dataset is None:
+            #GDAL reads only the byte ranges of the file it needs for the tile, instead of the whole file
+            path = self._FileStorage.gdalPath(source)
+            dataset = await self._Executor.run("tiles", self._DatasetPool.open, projectId, source, path, self._FileStorage.gdalOptions())
+        try:
+            if mercatorBounds is None and dataset.mercatorBounds is not None and not georef.tileIntersects(dataset.mercatorBounds, x, y, z):
+                tile = georef.emptyTile
+            else:
+                tile = await self._Executor.run("tiles", dataset.use, render, x, y, z)
+        finally:
+            self._DatasetPool.release(dataset)
+        self._TileCache.put(projectId, version, z, x, y, tile)
+        return tile
+
+    async def loadTileStore(self, projectId: int, version: str, tilesFilePath: str) -> None:
+        """Make a local copy of the tile store of a project, so tiles can be read from it
+
+        Concurrent requests for the same tile store wait for one copy, instead of each making their own.
+
+        Args:
+            projectId (int): The id of the project
+            version (str): The version of the georeferenced file the tile store was rendered from
+            tilesFilePath (str): The path to the tile store in file storage
+        """
+
+        key = (projectId, version)
+        load = self._TileStoreLoads.get(key)
+        if load is None:
+            load = asyncio.ensure_future(self._copyTileStore(projectId, version, tilesFilePath))
+            self._TileStoreLoads[key] = load
+            load.add_done_callback(lambda _: self._TileStoreLoads.pop(key, None))
+        #a cancelled request does not cancel the copy the other requests wait for
+        await asyncio.shield(load)
+
+    async def _copyTileStore(self, projectId: int, version: str, tilesFilePath: str) -> None:
+        # the store is copied in chunks, a large store is never held in memory at once
+        storePath = getUniqeFileName('mbtiles')
+        try:
+            offset = 0
+            while True:
+                chunk = await self._FileStorage.readFileRange(tilesFilePath, offset, tileStoreChunkSize)
+                await self._Executor.run("tiles", writeFile, storePath, chunk, offset > 0)
+                offset += len(chunk)
+                if len(chunk) < tileStoreChunkSize:
+                    break
+        except BaseException:
+            removeFile(storePath)
+            raise
+        self._TilePyramid.setLocalStore(projectId, version, storePath)
+
+    async def saveTileStore(self, projectId: int, version: str, storePath: str) -> None:
+        """Save a finished tile store of a project to file storage, called when the tile pyramid is rendered
+
+        Args:
+            projectId (int): The id of the project
+            version (str): The version of the georeferenced file the tile store was rendered from
+            storePath (str): The path to the local tile store file
+        """
+
+        project = await self._StorageHandler.fetchOne(projectId, "project")
+        if project is None or project["georeferencedFilePath"] != version:
+            return # the project was deleted or georeferenced again while rendering
+        filePath = await self._FileStorage.saveFileFromPath(storePath, ".mbtiles")
+        project["tilesFilePath"] = filePath
+        project = Project.model_construct(None, **project)
+        await self.updateProject(projectId, project, withFiles=True)
+
+    async def removeTileStore(self, projectId: int) -> None:
+        """Cancel the tile pyramid build and remove the tile store of a project
+
+        Args:
+            projectId (int): The id of the project
+        """
+
+        self._TilePyramid.cancel(projectId)
+        project = await self._StorageHandler.fetchOne(projectId, "project")
+        if project is None or not project["tilesFilePath"]:
+            return
+        try:
+            await self._FileStorage.removeFile(project["tilesFilePath"])
+        except Exception as e:
+            logger.warning("Failed to remove tile store with path: %s :: Exception: %s, continuing...", project["tilesFilePath"], e)
+        project["tilesFilePath"] = ""
+        project = Project.model_construct(None, **project)
+        await self.updateProject(projectId, project, withFiles=True)
@@ -1,5 +1,5 @@
 """ """
-from typing import List, Union
+from typing import List, Tuple, Union
 import psycopg2
 from pydantic import BaseModel 
 from psycopg2 import sql
@@ -8,6 +8,17 @@ from img2mapAPI.utils.models.project import Project
 from img2mapAPI.utils.storage.data.storageHandler import StorageHandler as sh
 from img2mapAPI.utils.core.helper.postgresSqlHelper import *
 
+# Columns added after the first release, in the order they were added: {table: [(column, type)]}
+tableMigrations: dict = {
+    'project': [
+        ('tilesFilePath', 'VARCHAR (255)'),
+        ('mercatorFilePath', 'VARCHAR (255)'),
+        ('imageHash', 'VARCHAR (64)'),
+        ('georeferencedHash', 'VARCHAR (64)'),
+        ('rasterInfo', 'TEXT'),
+    ],
+}
+
 class PostgresSqlHandler(sh):
     """This class is the implementation of the storage handler for PostgresSql
 
@@ -61,8 +72,8 @@ class PostgresSqlHandler(sh):
         if type == 'project':
             try:
                 cur.execute(
-                    sql.SQL("INSERT INTO project (name, description, crs, imageFilePath, georeferencedFilePath, selfdestructtime, created, lastModified) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id"),
-                    (data.name, data.description, data.crs, data.imageFilePath, data.georeferencedFilePath, data.selfdestructtime, data.created, data.lastModified))
+                    sql.SQL("INSERT INTO project (name, description, crs, imageFilePath, georeferencedFilePath, selfdestructtime, created, lastModified, tilesFilePath, mercatorFilePath, imageHash, georeferencedHash, rasterInfo) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id"),
+                    (data.name, data.description, data.crs, data.imageFilePath, data.georeferencedFilePath, data.selfdestructtime, data.created, data.lastModified, data.tilesFilePath, data.mercatorFilePath, data.imageHash, data.georeferencedHash, data.rasterInfo))
                 conn.commit()
                 id = cur.fetchone()[0]
                 return id
@@ -86,6 +97,20 @@ class PostgresSqlHandler(sh):
             finally:
                 cur.close()
                 conn.close()
+        if type == 'georefcache':
+            try:
+                cur.execute(
+                    sql.SQL("INSERT INTO georefcache (cacheKey, georeferencedFilePath, georeferencedHash, mercatorFilePath, rasterInfo, size, refs, lastUsed) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id"),
+                    (data.cacheKey, data.georeferencedFilePath, data.georeferencedHash, data.mercatorFilePath, data.rasterInfo, data.size, data.refs, data.lastUsed))
+                conn.commit()
+                id = cur.fetchone()[0]
+                return id
+            except Exception as e:
+                print(f"Error Accured in: Save :: Error {e}")
+                pass
+            finally:
+                cur.close()
+                conn.close()
         return None
 
     async def remove(self, id: int, type: str)->None:
@@ -132,8 +157,8 @@ class PostgresSqlHandler(sh):
         if type == 'project':
             try:
                 cur.execute(
-                    sql.SQL("UPDATE project SET name = %s, description = %s, crs = %s, imageFilePath = %s, georeferencedFilePath = %s, selfdestructtime = %s, created = %s, lastModified = %s WHERE id = %s;"),
-                    (data.name, data.description, data.crs, data.imageFilePath, data.georeferencedFilePath, data.selfdestructtime, data.created, data.lastModified, id)
+                    sql.SQL("UPDATE project SET name = %s, description = %s, crs = %s, imageFilePath = %s, georeferencedFilePath = %s, selfdestructtime = %s, created = %s, lastModified = %s, tilesFilePath = %s, mercatorFilePath = %s, imageHash = %s, georeferencedHash = %s, rasterInfo = %s WHERE id = %s;"),
+                    (data.name, data.description, data.crs, data.imageFilePath, data.georeferencedFilePath, data.selfdestructtime, data.created, data.lastModified, data.tilesFilePath, data.mercatorFilePath, data.imageHash, data.georeferencedHash, data.rasterInfo, id)
                 )
                 print(f"Updated project with id {data.id}") #Todo: log this
                 conn.commit()
@@ -156,6 +181,48 @@ class PostgresSqlHandler(sh):
             finally:
                 cur.close()
                 conn.close()
+        if type == 'georefcache':
+            try:
+                cur.execute(
+                    sql.SQL("UPDATE georefcache SET cacheKey = %s, georeferencedFilePath = %s, georeferencedHash = %s, mercatorFilePath = %s, rasterInfo = %s, size = %s, refs = %s, lastUsed = %s WHERE id = %s"),
+                    (data.cacheKey, data.georeferencedFilePath, data.georeferencedHash, data.mercatorFilePath, data.rasterInfo, data.size, data.refs, data.lastUsed, id)
+                )
+                conn.commit()
+            except Exception as e:
+                print(f"Error Accured in: Update :: Error {e}")
+                pass
+            finally:
+                cur.close()
+                conn.close()
+
+    async def updateMany(self, items: List[Tuple[int, BaseModel]], type: str)->None:
+        """Update several rows of data in storage in one transaction
+
+        Args:
+            items (List[Tuple[int, BaseModel]]): The id and the updated data of each row
+            type (str): The type of the data / the table name / the model class name
+        """
+
+        if type != 'point':
+            for (id, data) in items:
+                await self.update(id, data, type)
+            return
+        if (self.setupDone == False): 
+            await self.setup() #make sure the database is setup
+        conn = psycopg2.connect(self.dnsString, sslmode=self.localsslmode)
+        cur = conn.cursor()
+        try:
+            cur.executemany(
+                sql.SQL("UPDATE point SET projectId = %s, Idproj = %s, lat = %s, lng = %s, row = %s, col = %s, error = %s, name = %s, description = %s WHERE id = %s"),
+                [(data.projectId, data.Idproj, data.lat, data.lng, data.row, data.col, data.error, data.name, data.description, id) for (id, data) in items]
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"Error Accured in: UpdateMany :: Error {e}")
+            pass
+        finally:
+            cur.close()
+            conn.close()
 
     async def fetchOne(self, id: int, type: str)->Union[None, dict]:
         """Fetch one data from storage
@@ -228,6 +295,49 @@ class PostgresSqlHandler(sh):
             print(f"Error Accured in: Fetch :: Error {e}")
             raise e
     
+    async def fetchColumns(self, type: str, columns: List[str], params: dict = {}, orderBy: str = None)->Union[None, List[tuple]]:
+        """Fetch some columns of data from storage as rows of values, without making a dictionary per row
+
+        Args:
+            type (str): The type of the data / the table name / the model class name
+            columns (List[str]): The columns to fetch, the values of each row are in this order
+            params (dict, optional): dict of additional fields [Key] to search and the value to match by [value] . Defaults to {}.
+            orderBy (str, optional): The column to order the rows by. Defaults to None.
+
+        Returns:
+            List[tuple]: The fetched rows
+        """
+
+        if (self.setupDone == False):
+            await self.setup()
+
+        conn = psycopg2.connect(self.dnsString, sslmode=self.localsslmode)
+        cur = conn.cursor()
+        try:
+            query = sql.SQL("SELECT {columns} FROM {type}").format(
+                columns=sql.SQL(', ').join(sql.Identifier(column.lower()) for column in columns),
+                type=sql.Identifier(type.lower())
+            )
+            if params:
+                query += sql.SQL(" WHERE {params}").format(
+                    params=sql.SQL(' AND ').join(
+                        sql.SQL("{key} = {value}").format(
+                            key=sql.Identifier(k.lower()),
+                            value=sql.Literal(v)
+                        ) for k, v in params.items()
+                    )
+                )
+            if orderBy is not None:
+                query += sql.SQL(" ORDER BY {orderBy}").format(orderBy=sql.Identifier(orderBy.lower()))
+            cur.execute(query)
+            return cur.fetchall()
+        except Exception as e:
+            print(f"Error Accured in: Fetch Columns :: Error {e}")
+            raise e
+        finally:
+            cur.close()
+            conn.close()
+
     async def fetchAll(self, type: str) ->Union[None, list]:
         """Fetch all data from storage
 
@@ -269,7 +379,7 @@ class PostgresSqlHandler(sh):
 
 
     async def createModelTable(self):
-        """Create a tables for the project model & point model part of the database setup
+        """Create a tables for the project model, point model & georeference cache entry model part of the database setup
 
         """
         #Crating table if not exists for project model
@@ -282,7 +392,12 @@ class PostgresSqlHandler(sh):
                     georeferencedFilePath VARCHAR (255),
                     selfdestructtime TIMESTAMPTZ,
                     created TIMESTAMPTZ,
-                    lastModified TIMESTAMPTZ
+                    lastModified TIMESTAMPTZ,
+                    tilesFilePath VARCHAR (255),
+                    mercatorFilePath VARCHAR (255),
+                    imageHash VARCHAR (64),
+                    georeferencedHash VARCHAR (64),
+                    rasterInfo TEXT
                 );
             '''
         try:
@@ -312,7 +427,39 @@ class PostgresSqlHandler(sh):
         except Exception as e:
             print(f"Error Accured in: Creating Table for Points :: Error {e}")
             pass #Todo: handle exception
+
+        georefcache_table = '''CREATE TABLE IF NOT EXISTS georefcache (
+                    id SERIAL PRIMARY KEY,
+                    cacheKey VARCHAR (64) NOT NULL UNIQUE,
+                    georeferencedFilePath VARCHAR (255) NOT NULL,
+                    georeferencedHash VARCHAR (64),
+                    mercatorFilePath VARCHAR (255),
+                    rasterInfo TEXT,
+                    size BIGINT NOT NULL,
+                    refs INTEGER NOT NULL,
+                    lastUsed TIMESTAMPTZ
+                );
+            '''
+        try:
+            await createTable(self.dnsString, georefcache_table)
+        except Exception as e:
+            print(f"Error Accured in: Creating Table for Georeference Cache :: Error {e}")
+            pass #Todo: handle exception
     
+    async def migrateModelTable(self):
+        """Add columns missing from tables created by older versions, part of the database setup
+
+        New columns are always added at the end of the table, so the column order matches createModelTable.
+        """
+
+        for (table, columns) in tableMigrations.items():
+            for (column, columnType) in columns:
+                try:
+                    await createTable(self.dnsString, f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {columnType};")
+                except Exception as e:
+                    print(f"Error Accured in: Migrating Table {table} :: Error {e}")
+                    pass #Todo: handle exception
+
     def convertSequenseToDict(self, row: tuple, type: str)->dict:
         """Convert a sequence to a dictionary
 
@@ -335,7 +482,12 @@ class PostgresSqlHandler(sh):
                 'georeferencedFilePath': row[5],
                 'selfdestructtime': row[6],
                 'created': row[7],
-                'lastModified': row[8]
+                'lastModified': row[8],
+                'tilesFilePath': row[9],
+                'mercatorFilePath': row[10],
+                'imageHash': row[11],
+                'georeferencedHash': row[12],
+                'rasterInfo': row[13]
             }
         if type == 'point':
             return {
@@ -350,6 +502,18 @@ class PostgresSqlHandler(sh):
                 'name': row[8],
                 'description': row[9]
             }
+        if type == 'georefcache':
+            return {
+                'id': row[0],
+                'cacheKey': row[1],
+                'georeferencedFilePath': row[2],
+                'georeferencedHash': row[3],
+                'mercatorFilePath': row[4],
+                'rasterInfo': row[5],
+                'size': row[6],
+                'refs': row[7],
+                'lastUsed': row[8]
+            }
 
     async def setup(self):
         """Setup the database
@@ -358,6 +522,7 @@ class PostgresSqlHandler(sh):
         try:
             # await createDB(self.dnsString)
             await self.createModelTable()
+            await self.migrateModelTable()
             self.doneSetup = True
         except Exception as e:
             print(f"Error Accured in: Setup :: Error {e}")
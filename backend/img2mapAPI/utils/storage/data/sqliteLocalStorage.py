@@ -1,15 +1,27 @@
 import sqlite3 as sql
-from typing import Union
+from typing import List, Tuple, Union
 from pydantic import BaseModel
 from img2mapAPI.utils.storage.data.storageHandler import StorageHandler as sh
 from img2mapAPI.utils.core.helper.sqliteHelper import *
 
+# Columns added after the first release, in the order they were added: {table: [(column, type)]}
+tableMigrations: dict = {
+    'project': [
+        ('tilesFilePath', 'TEXT'),
+        ('mercatorFilePath', 'TEXT'),
+        ('imageHash', 'TEXT'),
+        ('georeferencedHash', 'TEXT'),
+        ('rasterInfo', 'TEXT'),
+    ],
+}
+
 class SQLiteStorage(sh):
     """This class is the implementation of the StorageHandler class for sqlite3 databases
 
     Functions:
         settupDatabase: Settup the sqlite3 database
         createTables: Create the tables in the database
+        migrateTables: Add columns missing from tables created by older versions
         convertSequenseToDict: Convert a sequence to a dictionary
 
     Inherited abstract functions:
@@ -17,6 +29,7 @@ class SQLiteStorage(sh):
         saveInStorage: Save data to storage
         remove: Remove data from storage
         update: Update data in storage
+        updateMany: Update several rows of data in storage
         fetchOne: Fetch one data from storage
         fetch: Fetch data from storage
         fetchAll: Fetch all data from storage
@@ -40,6 +53,7 @@ class SQLiteStorage(sh):
         if self.dbPath is None:
             self.dbPath = createNewDatabase('georefProjects.db')
         await self.createTables()
+        await self.migrateTables()
         self.hasSettup = True
     
     async def createTables(self):
@@ -64,7 +78,12 @@ class SQLiteStorage(sh):
                             georeferencedFilePath TEXT,
                             selfdestructtime TEXT,
                             created TEXT,
-                            lastModified TEXT)'''
+                            lastModified TEXT,
+                            tilesFilePath TEXT,
+                            mercatorFilePath TEXT,
+                            imageHash TEXT,
+                            georeferencedHash TEXT,
+                            rasterInfo TEXT)'''
                             )
             #create the table for the points
             cursor.execute('''CREATE TABLE IF NOT EXISTS point(
@@ -82,13 +101,50 @@ class SQLiteStorage(sh):
                            )
                             '''
                             )
+            #create the table for the georeference cache
+            cursor.execute('''CREATE TABLE IF NOT EXISTS georefcache(
+                            id INTEGER PRIMARY KEY,
+                            cacheKey TEXT NOT NULL UNIQUE,
+                            georeferencedFilePath TEXT NOT NULL,
+                            georeferencedHash TEXT,
+                            mercatorFilePath TEXT,
+                            rasterInfo TEXT,
+                            size INTEGER NOT NULL,
+                            refs INTEGER NOT NULL,
+                            lastUsed TEXT
+                           )
+                            '''
+                            )
             conn.commit()
         except Exception as e:
             print(e)
         finally:
             conn.close()
 
+    async def migrateTables(self):
+        """Add columns missing from tables created by older versions
 
+        New columns are always added at the end of the table, so the column order matches createTables.
+
+        Raises:
+            Exception: Could not connect to the database
+        """
+
+        conn: sql.Connection = await self.connect()
+        if conn is None:
+            raise Exception('Could not connect to the database')
+        cursor = conn.cursor()
+        try:
+            for (table, columns) in tableMigrations.items():
+                existing = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+                for (column, columnType) in columns:
+                    if column not in existing:
+                        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {columnType}")
+            conn.commit()
+        except Exception as e:
+            print(e)
+        finally:
+            conn.close()
 
     async def connect(self, db: str ='', user: str = '', password: str='', host: str='', port: int=0)->sql.Connection:
         try:
@@ -169,6 +225,33 @@ class SQLiteStorage(sh):
                 conn.close()
         pass
 
+    async def updateMany(self, items: List[Tuple[int, BaseModel]], type: str)->None:
+        if self.hasSettup is False:
+            await self.settupDatabase()
+        if len(items) == 0:
+            return
+        conn: sql.Connection = await self.connect()
+        if conn is not None:
+            cursor = conn.cursor()
+            try:
+                rows = []
+                for (id, data) in items:
+                    data: dict = dict(data)
+                    data.pop('id', None)
+                    if type == 'project':
+                        data.pop('points', None)
+                    rows.append(list(data.values()) + [id])
+                #all rows are the same model, so they share the query
+                placeholders = ', '.join([f"{key} = ?" for key in data])
+                query = f"UPDATE {type} SET {placeholders} WHERE id = ?"
+
+                cursor.executemany(query, rows)
+                conn.commit()
+            except Exception as e:
+                print(e)
+            finally:
+                conn.close()
+
     async def fetchOne(self, id: int, type: str) -> Union[None, dict]:
         if self.hasSettup is False:
             await self.settupDatabase()
@@ -217,6 +300,26 @@ class SQLiteStorage(sh):
                 conn.close()
         pass
     
+    async def fetchColumns(self, type: str, columns: List[str], params: dict = {}, orderBy: str = None)->Union[None, List[tuple]]:
+        if self.hasSettup is False:
+            await self.settupDatabase()
+        conn: sql.Connection = await self.connect()
+        if conn is not None:
+            cursor = conn.cursor()
+            try:
+                query = f"SELECT {', '.join(columns)} FROM {type}"
+                if params:
+                    query += " WHERE " + " AND ".join(f"{key} = ?" for key in params)
+                if orderBy is not None:
+                    query += f" ORDER BY {orderBy}"
+                cursor.execute(query, list(params.values()))
+                return cursor.fetchall()
+            except Exception as e:
+                print(e)
+            finally:
+                conn.close()
+        pass
+
     async def fetchAll(self, type: str)->Union[None, list]:
         if self.hasSettup is False:
             await self.settupDatabase()
@@ -260,7 +363,12 @@ class SQLiteStorage(sh):
                 'georeferencedFilePath': row[5],
                 'selfdestructtime': row[6],
                 'created': row[7],
-                'lastModified': row[8]
+                'lastModified': row[8],
+                'tilesFilePath': row[9],
+                'mercatorFilePath': row[10],
+                'imageHash': row[11],
+                'georeferencedHash': row[12],
+                'rasterInfo': row[13]
             }
         if type == 'point':
             return {
@@ -275,6 +383,18 @@ class SQLiteStorage(sh):
                 'name': row[8],
                 'description': row[9]
             }
+        if type == 'georefcache':
+            return {
+                'id': row[0],
+                'cacheKey': row[1],
+                'georeferencedFilePath': row[2],
+                'georeferencedHash': row[3],
+                'mercatorFilePath': row[4],
+                'rasterInfo': row[5],
+                'size': row[6],
+                'refs': row[7],
+                'lastUsed': row[8]
+            }
 
     def __new__(cls, dbName: str = 'test.db'):
         if cls._instance is None:
@@ -2,7 +2,7 @@
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Union
+from typing import List, Tuple, Union
 from pydantic import BaseModel
 
 class StorageHandler(ABC):
@@ -16,6 +16,7 @@ class StorageHandler(ABC):
         saveInStorage: Save data to storage
         remove: Remove data from storage
         update: Update data in storage
+        updateMany: Update several rows of data in storage
         fetchOne: Fetch one data from storage
         fetch: Fetch data from storage
         fetchAll: Fetch all data from storage
@@ -75,6 +76,16 @@ class StorageHandler(ABC):
         """
         pass
     
+    @abstractmethod
+    async def updateMany(self, items: List[Tuple[int, BaseModel]], type: str)->None:
+        """Update several rows of data in storage in one transaction
+
+        Args:
+            items (List[Tuple[int, BaseModel]]): The id and the updated data of each row
+            type (str): The type of the data / the table name / the model class name
+        """
+        pass
+
     @abstractmethod
     async def fetchOne(self, id: int, type: str) -> Union[None, dict]:
         """Fetch one "Row" of data from storage
@@ -101,6 +112,21 @@ class StorageHandler(ABC):
         """
         pass
 
+    @abstractmethod
+    async def fetchColumns(self, type: str, columns: List[str], params: dict = {}, orderBy: str = None)->Union[None, List[tuple]]:
+        """Fetch some columns of data from storage as rows of values, without making a dictionary per row
+
+        Args:
+            type (str): The type of the data / the table name / the model class name
+            columns (List[str]): The columns to fetch, the values of each row are in this order
+            params (dict, optional): dict of additional fields [Key] to search and the value to match by [value] . Defaults to {}.
+            orderBy (str, optional): The column to order the rows by. Defaults to None.
+
+        Returns:
+            Union[None, List[tuple]]: The rows fetched from the storage. None if an error occured.
+        """
+        pass
+
     @abstractmethod
     async def fetchAll(self, type: str)->Union[None, List[dict]]:
         """Fetch all data from storage
@@ -14,9 +14,16 @@ class FileStorage(ABC):
         readFile: Read a file from storage
         fileExists: Check if a file exists in storage
         saveFileFromPath: Save a file to storage from a path 
+        readFileRange: Read a byte range of a file from storage
+        gdalPath: Get the path GDAL can open a file in storage with
+        gdalOptions: Get the GDAL configuration options needed to open a file in storage
+
+    Attributes:
+        blockCacheSize: The size in bytes of the cache GDAL keeps of the byte ranges it read of each file opened from storage
     """
 
     _instance = None
+    blockCacheSize: int = 32 * 1024 * 1024
 
     @abstractmethod
     async def saveFile(self, data: tempfile, suffix: str)->str:
@@ -76,3 +83,38 @@ class FileStorage(ABC):
             str: The path to the saved file / identifier for the saved file / uuid for the saved file
         """
         pass
+
+    @abstractmethod
+    async def readFileRange(self, path: str, offset: int, length: int)->bytes:
+        """Read a byte range of a file from storage
+
+        Args:
+            path (str): The path to the file / identifier for the file / uuid for the file
+            offset (int): The position of the first byte to read
+            length (int): The number of bytes to read
+
+        Returns:
+            bytes: The file data, shorter than length if the range goes past the end of the file
+        """
+        pass
+
+    @abstractmethod
+    def gdalPath(self, path: str)->str:
+        """Get the path GDAL can open a file in storage with, GDAL then only reads the byte ranges it needs
+
+        Args:
+            path (str): The path to the file / identifier for the file / uuid for the file
+
+        Returns:
+            str: The path to the file for GDAL, a local path or a GDAL virtual file system path
+        """
+        pass
+
+    @abstractmethod
+    def gdalOptions(self)->dict:
+        """Get the GDAL configuration options needed to open the paths from gdalPath
+
+        Returns:
+            dict: The configuration options and session, as keyword arguments to rasterio.Env
+        """
+        pass
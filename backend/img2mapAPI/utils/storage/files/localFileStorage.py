@@ -22,6 +22,9 @@ class LocalFileStorage(FileStorage):
         readFile: Read a file from local storage
         fileExists: Check if a file exists in local storage
         saveFileFromPath: Save a file to local storage from a path
+        readFileRange: Read a byte range of a file from local storage
+        gdalPath: Get the path GDAL can open a file in local storage with
+        gdalOptions: Get the GDAL configuration options for local storage
         getInstance: Get the instance of the class
 
     Attributes:
@@ -55,6 +58,18 @@ class LocalFileStorage(FileStorage):
             data = file.read()
         return await self.saveFile(data, suffix)
 
+    async def readFileRange(self, path: str, offset: int, length: int)->bytes:
+        with open(path, "rb") as file:
+            file.seek(offset)
+            data = file.read(length)
+        return data
+
+    def gdalPath(self, path: str)->str:
+        return path
+
+    def gdalOptions(self)->dict:
+        return {}
+
     @staticmethod
     def getInstance():
         """Get the instance of the class
@@ -2,6 +2,7 @@ from .fileStorage import FileStorage
 import tempfile
 import boto3
 import botocore
+from rasterio.session import AWSSession
 
 class S3FileStorage(FileStorage):
 
@@ -13,6 +14,7 @@ class S3FileStorage(FileStorage):
     aws_region_name = None
     aws_access_key_id = None
     aws_secret_access_key = None
+    aws_endpoint_url = None
 
     async def saveFile(self, data: tempfile , suffix: str) -> str:
         # Generate a unique filename
@@ -61,27 +63,64 @@ class S3FileStorage(FileStorage):
             data = file.read()
             return await self.saveFile(data, suffix)
 
-    def __init__(self, aws_bucket_name, aws_region_name, aws_access_key_id, aws_secret_access_key):
+    async def readFileRange(self, object_key: str, offset: int, length: int)->bytes:
+        # Read only the requested bytes with a HTTP range request
+        try:
+            response = self.bucket.Object(object_key).get(Range=f"bytes={offset}-{offset + length - 1}")
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == "InvalidRange":
+                return b"" # the range starts past the end of the file
+            raise
+        return response['Body'].read()
+
+    def gdalPath(self, object_key: str)->str:
+        # GDAL reads the object with range requests through its /vsis3/ virtual file system
+        return f"/vsis3/{self.aws_bucket_name}/{object_key}"
+
+    def gdalOptions(self)->dict:
+        # rasterio only accepts AWS credentials through a session
+        endpoint = None
+        options = {
+            "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR", # do not list the bucket when opening a file
+            "VSI_CACHE": "TRUE", # keep the byte ranges read of a file, so the tiles of an area do not read them again
+            "VSI_CACHE_SIZE": str(self.blockCacheSize),
+        }
+        if self.aws_endpoint_url:
+            # S3 compatible storage, like MinIO or a local test server
+            (scheme, endpoint) = self.aws_endpoint_url.rstrip("/").split("://", 1)
+            options["AWS_HTTPS"] = "YES" if scheme == "https" else "NO"
+            options["AWS_VIRTUAL_HOSTING"] = "FALSE"
+        options["session"] = AWSSession(
+            aws_access_key_id=self.aws_access_key_id,
+            aws_secret_access_key=self.aws_secret_access_key,
+            region_name=self.aws_region_name,
+            endpoint_url=endpoint
+        )
+        return options
+
+    def __init__(self, aws_bucket_name, aws_region_name, aws_access_key_id, aws_secret_access_key, aws_endpoint_url=None):
         # Store the provided credentials
         self.aws_bucket_name = aws_bucket_name
         self.aws_region_name = aws_region_name
         self.aws_access_key_id = aws_access_key_id
         self.aws_secret_access_key = aws_secret_access_key
+        self.aws_endpoint_url = aws_endpoint_url
 
         # Create an S3 resource object using the provided credentials
         self.s3 = boto3.resource(
             service_name='s3',
             region_name=self.aws_region_name,
             aws_access_key_id=self.aws_access_key_id,
-            aws_secret_access_key=self.aws_secret_access_key
+            aws_secret_access_key=self.aws_secret_access_key,
+            endpoint_url=self.aws_endpoint_url
         )
 
         # Create a reference to the specified bucket
         self.bucket = self.s3.Bucket(self.aws_bucket_name)
 
-    def __new__(cls, aws_bucket_name, aws_region_name, aws_access_key_id, aws_secret_access_key):
+    def __new__(cls, aws_bucket_name, aws_region_name, aws_access_key_id, aws_secret_access_key, aws_endpoint_url=None):
         # If the instance does not exist, create it, otherwise return the instance
         if cls._instance is None:
             cls._instance = super(S3FileStorage, cls).__new__(cls)
-            cls.__init__(cls, aws_bucket_name, aws_region_name, aws_access_key_id, aws_secret_access_key)
+            cls.__init__(cls, aws_bucket_name, aws_region_name, aws_access_key_id, aws_secret_access_key, aws_endpoint_url)
         return cls._instance
\ No newline at end of file
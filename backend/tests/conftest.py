@@ -0,0 +1,11 @@
+""" Shared setup of the backend tests.
+
+The tests run from a temporary folder, the file storage and the caches keep their files in folders relative to the working directory.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="img2map-tests-"))
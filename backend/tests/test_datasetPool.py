@@ -0,0 +1,129 @@
+""" Tests of the pool of open georeferenced datasets.
+"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from img2mapAPI.utils.core.datasetPool import DatasetPool
+
+@pytest.fixture
+def geotiff(tmp_path) -> str:
+    path = str(tmp_path / "map.tiff")
+    with rasterio.open(path, 'w', driver="GTiff", width=32, height=32, count=1, dtype="uint8", crs="EPSG:4326",
+                       transform=from_origin(10, 60, 0.01, 0.01)) as dataset:
+        dataset.write(np.full((1, 32, 32), 7, dtype=np.uint8))
+    return path
+
+def readWidth(reader) -> int:
+    return reader.dataset.width
+
+def waitFor(condition, timeout: float = 2) -> bool:
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+def test_acquire_open_release(geotiff):
+    pool = DatasetPool(sweepInterval=0)
+    assert pool.acquire(1, "v1") is None
+    dataset = pool.open(1, "v1", geotiff)
+    assert dataset.use(readWidth) == 32
+    pool.release(dataset)
+    again = pool.acquire(1, "v1")
+    assert again is dataset
+    pool.release(again)
+    assert pool.stats()["open"] == 1 and pool.stats()["opened"] == 1
+
+def test_invalidate_closes_after_release(geotiff):
+    pool = DatasetPool(sweepInterval=0)
+    dataset = pool.open(1, "v1", geotiff)
+    pool.invalidate(1)
+    assert pool.acquire(1, "v1") is None
+    #the dataset is still in use, it is closed when released
+    assert dataset.use(readWidth) == 32
+    assert pool.stats()["closed"] == 0
+    pool.release(dataset)
+    assert waitFor(lambda: pool.stats()["closed"] == 1)
+    pool.shutdown()
+
+def test_maxOpen(geotiff):
+    pool = DatasetPool(maxOpen=2, sweepInterval=0)
+    for version in ("v1", "v2", "v3"):
+        pool.release(pool.open(1, version, geotiff))
+    assert pool.stats()["open"] == 2
+    assert pool.acquire(1, "v1") is None
+
+@pytest.mark.parametrize("maxHandles, expected", [(1, 1), (3, 3)])
+def test_reads_of_one_dataset_run_at_the_same_time(geotiff, maxHandles, expected):
+    pool = DatasetPool(maxHandles=maxHandles, sweepInterval=0)
+    dataset = pool.open(1, "v1", geotiff)
+    lock = threading.Lock()
+    running = [0, 0] # running now, most running at once
+
+    def read(reader):
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.1)
+        with lock:
+            running[0] -= 1
+        return reader.dataset.width
+
+    threads = [threading.Thread(target=dataset.use, args=(read,)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert running[1] == expected
+    assert dataset.handles == expected
+    pool.release(dataset)
+    pool.shutdown()
+    assert pool.stats()["open"] == 0
+
+def test_idle_datasets_are_closed_in_the_background(geotiff):
+    pool = DatasetPool(idleTimeout=0.1, sweepInterval=0.05)
+    try:
+        pool.release(pool.open(1, "v1", geotiff))
+        held = pool.open(2, "v1", geotiff)
+        time.sleep(0.5)
+        #no call to the pool in the meantime, the background thread closed the unused dataset
+        stats = pool.stats()
+        assert (stats["open"], stats["closed"]) == (1, 1)
+        assert held.use(readWidth) == 32
+        pool.release(held)
+    finally:
+        pool.shutdown()
+
+def test_lazy_sweep_only(geotiff):
+    pool = DatasetPool(idleTimeout=0.05, sweepInterval=0)
+    pool.release(pool.open(1, "v1", geotiff))
+    time.sleep(0.2)
+    assert pool.stats()["open"] == 1
+    #acquire runs on the event loop and does not close idle datasets, opening a dataset does
+    again = pool.acquire(1, "v1")
+    assert again is not None
+    pool.release(again)
+    time.sleep(0.1)
+    pool.release(pool.open(2, "v1", geotiff))
+    assert pool.acquire(1, "v1") is None
+    assert pool.stats()["open"] == 1
+    pool.shutdown()
+
+def test_release_and_invalidate_do_not_close_on_the_caller(geotiff):
+    pool = DatasetPool(sweepInterval=0)
+    dataset = pool.open(1, "v1", geotiff)
+    callers = []
+    close = dataset.close
+    dataset.close = lambda: (callers.append(threading.current_thread()), close())
+    pool.release(dataset)
+    pool.invalidate(1)
+    assert waitFor(lambda: pool.stats()["closed"] == 1)
+    assert callers and callers[0] is not threading.current_thread()
+    pool.shutdown()
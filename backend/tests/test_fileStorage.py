@@ -0,0 +1,85 @@
+""" Tests of the ranged reads and GDAL paths of the file storages, the S3 storage runs against a local moto server.
+"""
+
+import asyncio
+import os
+import socket
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from img2mapAPI.utils.storage.files.localFileStorage import LocalFileStorage
+from img2mapAPI.utils.storage.files.s3FileStorage import S3FileStorage
+
+moto = pytest.importorskip("moto.server")
+boto3 = pytest.importorskip("boto3")
+
+RANGES = [(0, 10), (65530, 20), (100, 200000), (299990, 100), (5, 1)]
+
+def _freePort() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture(scope="module")
+def s3Storage():
+    # the storage is configured like the router does, from AWS_ENDPOINT_URL pointing at the moto server
+    port = _freePort()
+    server = moto.ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    with pytest.MonkeyPatch.context() as env:
+        env.setenv("AWS_ENDPOINT_URL", f"http://127.0.0.1:{port}")
+        env.setenv("AWS_ACCESS_KEY_ID", "test")
+        env.setenv("AWS_SECRET_ACCESS_KEY", "test")
+        endpoint = os.environ["AWS_ENDPOINT_URL"]
+        boto3.client("s3", region_name="us-east-1", endpoint_url=endpoint).create_bucket(Bucket="img2map")
+        storage = S3FileStorage("img2map", "us-east-1", "test", "test", endpoint)
+        yield storage
+    server.stop()
+
+def _geotiff() -> bytes:
+    data = np.arange(64 * 64, dtype=np.uint16).reshape(1, 64, 64)
+    with rasterio.MemoryFile() as memory:
+        with memory.open(driver="GTiff", width=64, height=64, count=1, dtype="uint16", crs="EPSG:4326",
+                         transform=from_origin(10, 60, 0.01, 0.01), tiled=True, blockxsize=16, blockysize=16) as dataset:
+            dataset.write(data)
+        return memory.read()
+
+def test_local_readFileRange():
+    storage = LocalFileStorage()
+    data = os.urandom(300000)
+    path = asyncio.run(storage.saveFile(data, ".bin"))
+    try:
+        for (offset, length) in RANGES:
+            assert asyncio.run(storage.readFileRange(path, offset, length)) == data[offset:offset + length]
+        assert asyncio.run(storage.readFileRange(path, 400000, 10)) == b""
+        assert storage.gdalPath(path) == path
+    finally:
+        asyncio.run(storage.removeFile(path))
+
+def test_s3_readFileRange(s3Storage):
+    data = os.urandom(300000)
+    key = asyncio.run(s3Storage.saveFile(data, ".bin"))
+    try:
+        for (offset, length) in RANGES:
+            assert asyncio.run(s3Storage.readFileRange(key, offset, length)) == data[offset:offset + length]
+        assert asyncio.run(s3Storage.readFileRange(key, 400000, 10)) == b""
+    finally:
+        asyncio.run(s3Storage.removeFile(key))
+
+def test_s3_gdalPath(s3Storage):
+    key = asyncio.run(s3Storage.saveFile(_geotiff(), ".tiff"))
+    try:
+        path = s3Storage.gdalPath(key)
+        assert path == f"/vsis3/img2map/{key}"
+        options = s3Storage.gdalOptions()
+        assert options["VSI_CACHE_SIZE"] == str(s3Storage.blockCacheSize)
+        with rasterio.Env(**options):
+            with rasterio.open(path) as dataset:
+                assert (dataset.width, dataset.height) == (64, 64)
+                window = dataset.read(1, window=((16, 32), (16, 32)))
+        assert window[0, 0] == 16 * 64 + 16
+    finally:
+        asyncio.run(s3Storage.removeFile(key))
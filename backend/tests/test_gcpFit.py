@@ -0,0 +1,76 @@
+""" Tests of the least squares fit of the transform from pixel to map coordinates.
+"""
+
+import numpy as np
+import pytest
+from rasterio.control import GroundControlPoint
+from rasterio.transform import Affine, from_gcps
+
+from img2mapAPI.utils.core import gcpFit
+from img2mapAPI.utils.models import PointSet
+
+TRANSFORM = Affine(0.0002, 0.00001, 10.0, 0.00002, -0.0001, 60.0)
+
+def pointSet(pixels, transform=TRANSFORM, noise=None) -> PointSet:
+    pixels = np.asarray(pixels, dtype=np.float64)
+    coords = np.array([transform * tuple(pixel) for pixel in pixels])
+    if noise is not None:
+        coords = coords + noise
+    ids = np.arange(1, len(pixels) + 1)
+    return PointSet(ids, pixels[:, 0], pixels[:, 1], coords[:, 0], coords[:, 1])
+
+CORNERS = [(0, 0), (640, 0), (0, 426), (640, 426), (320, 213)]
+
+def test_exact_affine_fit():
+    fit = gcpFit.fitTransform(pointSet(CORNERS))
+    assert fit["order"] == 1
+    assert fit["affine"] == pytest.approx(tuple(TRANSFORM)[:6])
+    assert fit["rmse"]["map"] == pytest.approx(0, abs=1e-12)
+    assert fit["rmse"]["pixels"] == pytest.approx(0, abs=1e-6)
+    assert fit["residuals"]["Idproj"] == [1, 2, 3, 4, 5]
+    assert all(isinstance(value, float) for value in fit["residuals"]["errorPixels"])
+
+def test_residuals_in_pixels():
+    #move the last point one pixel to the right on the map, the fit spreads the error over the points
+    noise = np.zeros((5, 2))
+    noise[4] = (TRANSFORM.a, TRANSFORM.d)
+    fit = gcpFit.fitTransform(pointSet(CORNERS, noise=noise))
+    errors = fit["residuals"]["errorPixels"]
+    assert int(np.argmax(errors)) == 4
+    assert 0 < errors[4] < 1
+    #the residual is the fitted position minus the position of the point, so the moved point has a negative col residual
+    assert fit["residuals"]["col"][4] < 0
+    assert fit["rmse"]["pixels"] == pytest.approx(np.sqrt(np.mean(np.square(errors))))
+
+def test_higher_orders():
+    pixels = np.random.default_rng(1).uniform((0, 0), (640, 426), (16, 2))
+    for order in (2, 3):
+        fit = gcpFit.fitTransform(pointSet(pixels), order)
+        assert fit["affine"] is None
+        assert fit["rmse"]["pixels"] == pytest.approx(0, abs=1e-6)
+        assert len(fit["coefficients"]["x"]) == gcpFit.minPoints(order)
+
+def test_affineTransform_matches_rasterio():
+    points = pointSet(CORNERS, noise=np.linspace(0, 1e-4, 10).reshape(5, 2))
+    gcps = [GroundControlPoint(row, col, x, y) for (col, row, x, y) in zip(points.col, points.row, points.lng, points.lat)]
+    assert tuple(gcpFit.affineTransform(points))[:6] == pytest.approx(tuple(from_gcps(gcps))[:6])
+
+@pytest.mark.parametrize("pixels, order, message", [
+    (CORNERS[:2], 1, "Not enough points"),
+    (CORNERS, 2, "Not enough points"),
+    ([(0, 0), (100, 100), (200, 200), (300, 300)], 1, "on a line"),
+    (CORNERS, 4, "Order"),
+])
+def test_invalid_fits(pixels, order, message):
+    with pytest.raises(ValueError, match=message):
+        gcpFit.fitTransform(pointSet(pixels), order)
+
+@pytest.mark.parametrize("transform", [
+    Affine(0, 0, 10.0, 0, 0, 60.0),
+    Affine(0.0002, 0.00001, 10.0, 0, 0, 60.0),
+    Affine(0.0002, 0.00001, 10.0, 0.0004, 0.00002, 60.0),
+])
+def test_singular_fit(transform):
+    #the map coordinates of the points are the same or on a line, the transform can not be inverted at the points
+    with pytest.raises(ValueError, match="singular"):
+        gcpFit.fitTransform(pointSet(CORNERS, transform))
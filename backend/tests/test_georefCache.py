@@ -0,0 +1,90 @@
+""" Tests of the content addressed cache of georeferenced files, with the georefcache table kept in memory.
+"""
+
+import asyncio
+
+from img2mapAPI.utils.core.georefCache import GeorefCache, georefCacheKey
+from img2mapAPI.utils.models import GeorefCacheEntry, PointSet
+
+class MemoryTable:
+    # the part of StorageHandler the cache uses, for a single table
+    def __init__(self):
+        self.rows = {}
+        self.nextId = 1
+
+    async def fetch(self, type: str, params: dict):
+        return [dict(row) for row in self.rows.values() if all(row[key] == value for (key, value) in params.items())]
+
+    async def saveInStorage(self, data, type: str, idColumn: str):
+        id = self.nextId
+        self.nextId += 1
+        self.rows[id] = {**data.model_dump(), "id": id}
+        return id
+
+    async def update(self, id: int, data, type: str):
+        self.rows[id] = {**data.model_dump(), "id": id}
+
+    async def remove(self, id: int, type: str):
+        del self.rows[id]
+
+class RemovedFiles:
+    # the part of FileStorage the cache uses, recording the removed files
+    def __init__(self):
+        self.removed = []
+
+    async def removeFile(self, path: str):
+        self.removed.append(path)
+
+def entry(path: str, size: int) -> GeorefCacheEntry:
+    return GeorefCacheEntry(cacheKey="", georeferencedFilePath=path, size=size)
+
+def test_georefCacheKey_ignores_point_order():
+    points = PointSet(Idproj=[1, 2, 3], col=[0, 10, 0], row=[0, 0, 10], lng=[10.0, 10.1, 10.0], lat=[60.0, 60.0, 59.9])
+    reordered = PointSet(Idproj=[7, 8, 9], col=points.col[::-1], row=points.row[::-1], lng=points.lng[::-1], lat=points.lat[::-1])
+    assert georefCacheKey("image", points, "EPSG:4326", {}) == georefCacheKey("image", reordered, "epsg:4326", {})
+    assert georefCacheKey("image", points, "EPSG:4326", {}) != georefCacheKey("other", points, "EPSG:4326", {})
+
+def test_shared_file_is_kept_while_used():
+    files = RemovedFiles()
+    rows = MemoryTable()
+    cache = GeorefCache(files, rows, maxBytes=0)
+
+    async def main():
+        assert await cache.acquire("key") is None
+        stored = await cache.store("key", entry("a.tiff", 10))
+        assert stored.refs == 1
+        #the same input stored by a second project is not stored again
+        assert await cache.store("key", entry("b.tiff", 10)) is None
+        shared = await cache.acquire("key")
+        assert shared.georeferencedFilePath == "a.tiff" and shared.refs == 2
+        assert await cache.release("a.tiff")
+        assert files.removed == []
+        assert await cache.release("a.tiff")
+        assert not await cache.release("unknown.tiff")
+
+    asyncio.run(main())
+    #the last project released the file, and unused files do not fit in maxBytes
+    assert files.removed == ["a.tiff"]
+    assert rows.rows == {}
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1 and cache.stats()["evictions"] == 1
+
+def test_least_recently_used_unused_file_is_evicted():
+    files = RemovedFiles()
+    rows = MemoryTable()
+    cache = GeorefCache(files, rows, maxBytes=15)
+
+    async def main():
+        old = entry("old.tiff", 10)
+        old.mercatorFilePath = "old-3857.tiff"
+        await cache.store("old", old)
+        await cache.store("new", entry("new.tiff", 10))
+        await cache.store("used", entry("used.tiff", 10))
+        await cache.release("old.tiff")
+        #unused files fit in maxBytes, nothing is removed yet
+        assert files.removed == []
+        rows.rows[1]["lastUsed"] = "2024-01-01 00:00:00"
+        await cache.release("new.tiff")
+
+    asyncio.run(main())
+    assert files.removed == ["old.tiff", "old-3857.tiff"]
+    assert sorted(row["cacheKey"] for row in rows.rows.values()) == ["new", "used"]
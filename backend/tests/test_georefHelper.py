@@ -0,0 +1,143 @@
+""" Tests of the georeferencing pipeline: in memory, window by window, by header update, lazy in a VRT file and as a proxy.
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.io import MemoryFile
+
+from img2mapAPI.utils.core import georefHelper as georef
+from img2mapAPI.utils.models import PointSet, Project
+from img2mapAPI.utils.projectHandler import ProjectHandler
+
+sampleImage = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "TestFiles", "sample_640×426.png")
+
+def cornerPoints(west: float = 10.0) -> PointSet:
+    # the corners of the sample image, 0.1 degrees wide and 0.05 degrees high
+    return PointSet(Idproj=[1, 2, 3, 4], col=[0, 640, 0, 640], row=[0, 0, 426, 426],
+                    lng=[west, west + 0.1, west, west + 0.1], lat=[60.0, 60.0, 59.95, 59.95])
+
+def readTiff(tiffBytes: bytes) -> dict:
+    with MemoryFile(tiffBytes) as tiffFile, tiffFile.open() as dataset:
+        return {
+            "data": dataset.read(),
+            "bounds": dataset.bounds,
+            "crs": dataset.crs,
+            "size": (dataset.width, dataset.height),
+            "overviews": dataset.overviews(1),
+        }
+
+def readFile(path: str) -> bytes:
+    with open(path, 'rb') as file:
+        return file.read()
+
+@pytest.fixture(scope="module")
+def imageBytes() -> bytes:
+    return readFile(sampleImage)
+
+@pytest.fixture(scope="module")
+def inMemory(imageBytes) -> dict:
+    return readTiff(georef.georeferenceImage(imageBytes, cornerPoints()))
+
+@pytest.fixture
+def randomAccessImage(tmp_path) -> str:
+    # the sample image as a tiled GeoTIFF, so its windows are read in parallel
+    path = str(tmp_path / "image.tiff")
+    with rasterio.open(sampleImage) as source:
+        data = source.read(georef.imageBands)
+        profile = {"driver": "GTiff", "width": source.width, "height": source.height, "count": len(georef.imageBands),
+                   "dtype": source.dtypes[0], "tiled": True, "blockxsize": 128, "blockysize": 128}
+    with rasterio.open(path, 'w', **profile) as dataset:
+        dataset.write(data)
+    return path
+
+def test_georeferenceImage(inMemory):
+    assert inMemory["size"] == (640, 426)
+    assert inMemory["crs"] == rasterio.crs.CRS.from_epsg(4326)
+    assert inMemory["bounds"] == pytest.approx((10.0, 59.95, 10.1, 60.0))
+    assert inMemory["overviews"]
+
+@pytest.mark.parametrize("source, threads", [("png", 1), ("tiff", 1), ("tiff", 3)])
+@pytest.mark.parametrize("outputFormat", ["COG", "GTiff"])
+def test_windowed_equals_in_memory(inMemory, randomAccessImage, tmp_path, source, threads, outputFormat):
+    outputPath = str(tmp_path / "windowed.tiff")
+    imagePath = sampleImage if source == "png" else randomAccessImage
+    reported = []
+    #a limit of 0 MB reads the image a row of blocks, or a row of pixels, at a time
+    options = {"format": outputFormat, "blocksize": 128, "memoryLimitMB": 0, "threads": threads}
+    georef.georeferenceImageWindowed(imagePath, outputPath, cornerPoints(), outputOptions=options, progress=lambda done, total: reported.append((done, total)))
+
+    windowed = readTiff(readFile(outputPath))
+    assert np.array_equal(windowed["data"], inMemory["data"])
+    assert windowed["bounds"] == pytest.approx(inMemory["bounds"])
+    assert windowed["crs"] == inMemory["crs"]
+    assert windowed["overviews"]
+    assert len(reported) > 1 and reported[-1][0] == reported[-1][1]
+    assert [done for (done, _) in reported] == list(range(1, len(reported) + 1))
+
+def test_windowed_cancelled(randomAccessImage, tmp_path):
+    cancelEvent = threading.Event()
+    cancelEvent.set()
+    with pytest.raises(Exception, match="cancelled"):
+        georef.georeferenceImageWindowed(randomAccessImage, str(tmp_path / "out.tiff"), cornerPoints(),
+                                         outputOptions={"memoryLimitMB": 0, "threads": 2}, cancelEvent=cancelEvent)
+
+@pytest.mark.parametrize("fullRows", [False, True])
+def test_streamWindows_cover_the_image_once(fullRows):
+    (width, height, blocksize, bytesPerPixel, windowBytes) = (1000, 700, 256, 3, 256 * 256 * 3 * 2)
+    covered = np.zeros((height, width), dtype=np.int32)
+    for window in georef.streamWindows(width, height, blocksize, bytesPerPixel, windowBytes, fullRows):
+        covered[window.row_off:window.row_off + window.height, window.col_off:window.col_off + window.width] += 1
+        if not fullRows:
+            assert window.width * window.height * bytesPerPixel <= windowBytes
+            assert window.col_off % blocksize == 0
+        else:
+            assert window.width == width
+    assert (covered == 1).all()
+
+def test_readWindowsParallel_writes_in_order(randomAccessImage):
+    windows = list(georef.streamWindows(640, 426, 128, 3, 128 * 128 * 3, False))
+    written = []
+    georef.readWindowsParallel(randomAccessImage, georef.imageBands, windows, 3, lambda index, window, data: written.append((index, data.shape)))
+    assert [index for (index, _) in written] == list(range(len(windows)))
+    assert all(shape == (3, window.height, window.width) for ((_, shape), window) in zip(written, windows))
+
+def test_updateGeoreference_moves_the_bounds_and_keeps_the_overviews(imageBytes, inMemory):
+    tiffBytes = georef.georeferenceImage(imageBytes, cornerPoints())
+    updated = readTiff(georef.updateGeoreference(tiffBytes, cornerPoints(west=11.0)))
+    assert updated["bounds"] == pytest.approx((11.0, 59.95, 11.1, 60.0))
+    assert updated["overviews"] == inMemory["overviews"]
+    assert np.array_equal(updated["data"], inMemory["data"])
+
+def test_canUpdateGeoreference():
+    handler = ProjectHandler(None, None)
+    rasterInfo = json.dumps({"imageHash": "imagehash", "outputOptions": handler.georefFileOptions()})
+    fields = {"name": "map", "georeferencedFilePath": "georef.tiff", "imageHash": "imagehash", "rasterInfo": rasterInfo}
+    assert handler.canUpdateGeoreference(Project.model_construct(None, **fields))
+    #a new image, new file options, a lazy georeference or no georeferenced file need the image georeferenced again
+    assert not handler.canUpdateGeoreference(Project.model_construct(None, **{**fields, "imageHash": "newimage"}))
+    assert not handler.canUpdateGeoreference(Project.model_construct(None, **{**fields, "georeferencedFilePath": "georef.vrt"}))
+    assert not handler.canUpdateGeoreference(Project.model_construct(None, **{**fields, "georeferencedFilePath": ""}))
+    assert not handler.canUpdateGeoreference(Project.model_construct(None, **{**fields, "rasterInfo": ""}))
+    otherOptions = ProjectHandler(None, None, georefOptions={**georef.defaultOutputOptions, "compress": "LZW"})
+    assert not otherOptions.canUpdateGeoreference(Project.model_construct(None, **fields))
+
+def test_lazy_vrt_materializes_to_the_same_file(inMemory):
+    vrtBytes = georef.georeferenceVrt(sampleImage, cornerPoints())
+    assert b"<VRTDataset" in vrtBytes
+    #the VRT only holds the placement, the pixels are read from the image
+    assert len(vrtBytes) < 10000
+    materialized = readTiff(georef.materializeVrt(vrtBytes))
+    assert np.array_equal(materialized["data"], inMemory["data"])
+    assert materialized["bounds"] == pytest.approx(inMemory["bounds"])
+
+def test_proxy_keeps_the_bounds_at_the_reduced_size(inMemory):
+    proxy = readTiff(georef.georeferenceProxy(sampleImage, cornerPoints(), maxSize=160))
+    assert proxy["size"] == (160, 106)
+    #the points are in pixels of the full image, the proxy covers the same area with larger pixels
+    assert proxy["bounds"] == pytest.approx(inMemory["bounds"], abs=1e-9)
+    assert proxy["crs"] == inMemory["crs"]
@@ -0,0 +1,91 @@
+""" Tests of the queue of asynchronous georeferencing jobs.
+"""
+
+import asyncio
+
+from img2mapAPI.utils.core.georefJobs import GeorefJobQueue
+
+def blockingRunner(release: asyncio.Event, result: str = "hash"):
+    async def runner(cancelEvent, progress):
+        progress(1, 2)
+        await release.wait()
+        return result
+    return runner
+
+def test_same_key_returns_the_active_job():
+    async def main():
+        queue = GeorefJobQueue()
+        release = asyncio.Event()
+        first = queue.submit(1, "key", blockingRunner(release))
+        second = queue.submit(1, "key", blockingRunner(release))
+        await asyncio.sleep(0)
+        assert first is second
+        assert first.status == "running" and first.progress == 0.5
+        release.set()
+        await first._task
+        return (queue, first)
+
+    (queue, job) = asyncio.run(main())
+    assert job.status == "done" and job.result == "hash"
+    assert queue.get(job.id) is job
+    assert queue.stats()["done"] == 1
+
+def test_new_key_supersedes_the_active_job():
+    async def main():
+        queue = GeorefJobQueue()
+        release = asyncio.Event()
+        old = queue.submit(1, "old", blockingRunner(release, "old"))
+        await asyncio.sleep(0)
+        new = queue.submit(1, "new", blockingRunner(release, "new"))
+        release.set()
+        await asyncio.gather(old._task, new._task)
+        return (old, new)
+
+    (old, new) = asyncio.run(main())
+    assert old.status == "cancelled" and old.cancelEvent.is_set()
+    #the result of a cancelled job is not kept, even if its runner finished
+    assert old.result is None
+    assert new.status == "done" and new.result == "new"
+
+def test_cancelProject_and_failures():
+    async def failing(cancelEvent, progress):
+        raise Exception("broken")
+
+    async def main():
+        queue = GeorefJobQueue(workers=1)
+        release = asyncio.Event()
+        running = queue.submit(1, "a", blockingRunner(release))
+        queued = queue.submit(2, "b", blockingRunner(release))
+        await asyncio.sleep(0)
+        assert (running.status, queued.status) == ("running", "queued")
+        assert queue.cancelProject(2, "Points changed") == 1
+        assert queue.cancelProject(2) == 0
+        release.set()
+        await asyncio.gather(running._task, queued._task)
+        failed = queue.submit(3, "c", failing)
+        await failed._task
+        return (queue, queued, failed)
+
+    (queue, queued, failed) = asyncio.run(main())
+    assert queued.status == "cancelled" and queued.error == "Points changed" and queued.started is None
+    assert failed.status == "failed" and failed.error == "broken"
+    stats = queue.stats()
+    assert (stats["done"], stats["cancelled"], stats["failed"]) == (1, 1, 1)
+
+def test_history_is_bounded():
+    async def done(cancelEvent, progress):
+        return "hash"
+
+    async def main():
+        queue = GeorefJobQueue(maxHistory=2)
+        jobs = []
+        for projectId in range(4):
+            job = queue.submit(projectId, "key", done)
+            await job._task
+            jobs.append(job)
+        queue.submit(9, "key", done)
+        return (queue, jobs)
+
+    (queue, jobs) = asyncio.run(main())
+    assert queue.get(jobs[0].id) is None and queue.get(jobs[1].id) is None
+    assert queue.get(jobs[3].id) is jobs[3]
@@ -0,0 +1,131 @@
+""" Tests of the tile endpoint of the project handler, with a project record kept in memory.
+"""
+
+import asyncio
+import json
+
+import numpy as np
+import pytest
+import rasterio
+from morecantile import tms
+from rasterio.transform import from_origin
+
+from img2mapAPI.utils import projectHandler
+from img2mapAPI.utils.projectHandler import ProjectHandler
+from img2mapAPI.utils.core import georefHelper as georef
+from img2mapAPI.utils.core import tilePyramid
+from img2mapAPI.utils.core.datasetPool import DatasetPool
+from img2mapAPI.utils.core.taskExecutor import TaskExecutor
+
+class MemoryStorage:
+    # the part of StorageHandler the tile endpoint uses, counting the reads
+    def __init__(self, project: dict):
+        self.project = project
+        self.reads = 0
+
+    async def fetchOne(self, id: int, table: str):
+        self.reads += 1
+        return dict(self.project)
+
+class LocalPaths:
+    # the part of FileStorage the tile endpoint uses, the stored paths are local files
+    def gdalPath(self, path: str) -> str:
+        return path
+
+    def gdalOptions(self) -> dict:
+        return {}
+
+    async def readFile(self, path: str) -> bytes:
+        self.reads = getattr(self, "reads", 0) + 1
+        await asyncio.sleep(0.01)
+        with open(path, 'rb') as file:
+            return file.read()
+
+    async def readFileRange(self, path: str, offset: int, length: int) -> bytes:
+        self.ranges = getattr(self, "ranges", 0) + 1
+        await asyncio.sleep(0.01)
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            return file.read(length)
+
+@pytest.fixture
+def geotiff(tmp_path) -> str:
+    path = str(tmp_path / "map.tiff")
+    with rasterio.open(path, 'w', driver="GTiff", width=64, height=64, count=3, dtype="uint8", crs="EPSG:4326",
+                       transform=from_origin(10, 60, 0.01, 0.01)) as dataset:
+        dataset.write(np.full((3, 64, 64), 200, dtype=np.uint8))
+    return path
+
+@pytest.fixture
+def executor():
+    executor = TaskExecutor({"tiles": ("thread", 2)})
+    yield executor
+    executor.shutdown()
+
+def makeHandler(storage: MemoryStorage, executor: TaskExecutor, files: LocalPaths = None) -> ProjectHandler:
+    return ProjectHandler(files or LocalPaths(), storage, datasetPool=DatasetPool(sweepInterval=0), executor=executor)
+
+def record(path: str, rasterInfo) -> dict:
+    return {
+        "imageFilePath": "image.png",
+        "imageHash": None,
+        "georeferencedFilePath": path,
+        "georeferencedHash": None,
+        "lastModified": None,
+        "mercatorFilePath": None,
+        "tilesFilePath": None,
+        "rasterInfo": rasterInfo,
+    }
+
+inside = tms.get("WebMercatorQuad").tile(10.3, 59.7, 8)
+
+@pytest.mark.parametrize("rasterInfo", [None, json.dumps({"bounds": [10, 59.36, 10.64, 60]})])
+def test_tiles_without_stored_footprint(geotiff, executor, rasterInfo):
+    storage = MemoryStorage(record(geotiff, rasterInfo))
+    handler = makeHandler(storage, executor)
+    #the footprint is read from the open file, so a tile far from the image is blank without being rendered
+    assert asyncio.run(handler.getTile(1, 8, 0, 0)) == georef.emptyTile
+    assert executor.stats()["tiles"]["completed"] == 1 # only the file was opened
+    assert asyncio.run(handler.getTile(1, inside.z, inside.x, inside.y)) != georef.emptyTile
+
+def test_record_is_read_once(geotiff, executor):
+    storage = MemoryStorage(record(geotiff, None))
+    handler = makeHandler(storage, executor)
+
+    async def request():
+        project = await handler.getProjectRecord(1)
+        versions = await handler.getFileVersions(1, project)
+        tile = await handler.getTile(1, inside.z, inside.x, inside.y, project)
+        return (versions, tile)
+
+    (versions, tile) = asyncio.run(request())
+    assert storage.reads == 1
+    assert versions["georeferencedHash"]
+    assert tile != georef.emptyTile
+
+def test_tile_store_is_copied_once(geotiff, executor, tmp_path, monkeypatch):
+    #a complete tile store without tiles, every tile is known to be blank
+    storePath = str(tmp_path / "map.mbtiles")
+    tilePyramid.createTileStore(storePath, "v1", 5, 8)
+    conn = tilePyramid.openTileStore(storePath)
+    tilePyramid.writeTiles(conn, [], 8)
+    conn.close()
+    project = record(geotiff, None)
+    project["tilesFilePath"] = storePath
+    files = LocalPaths()
+    handler = makeHandler(MemoryStorage(project), executor, files)
+
+    async def requests():
+        return await asyncio.gather(*[handler.getTile(1, inside.z, inside.x + dx, inside.y, project) for dx in range(4)])
+
+    #the store is copied in chunks of 64 kB
+    monkeypatch.setattr(projectHandler, "tileStoreChunkSize", 65536)
+    tiles = asyncio.run(requests())
+    assert tiles == [georef.emptyTile] * 4
+    with open(storePath, 'rb') as file:
+        storeBytes = file.read()
+    assert files.ranges == len(storeBytes) // 65536 + 1
+    with open(handler._TilePyramid._stores[1][1], 'rb') as file:
+        assert file.read() == storeBytes
+    #the tiles are read from the store, the georeferenced file is never opened
+    assert handler._DatasetPool.stats()["opened"] == 0
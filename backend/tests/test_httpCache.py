@@ -0,0 +1,45 @@
+""" Tests of the HTTP caching validators.
+"""
+
+from img2mapAPI.utils.core.httpCache import cacheHeaders, contentHash, etagMatches, makeETag, notModified, toHttpDate
+
+def test_makeETag():
+    assert makeETag("abc", 5, 1, 2) == '"abc-5-1-2"'
+    assert contentHash(b"data") == contentHash(b"data") != contentHash(b"other")
+
+def test_etagMatches():
+    etag = makeETag("abc")
+    assert etagMatches(etag, etag)
+    assert etagMatches('"x", ' + etag, etag)
+    assert etagMatches("W/" + etag, etag)
+    assert etagMatches("*", etag)
+    assert not etagMatches('"x"', etag)
+    assert not etagMatches(None, etag)
+
+def test_toHttpDate():
+    assert toHttpDate(None) is None
+    assert toHttpDate("") is None
+    assert toHttpDate("not a date") is None
+    assert toHttpDate("2024-05-01 12:00:00").endswith(" GMT")
+
+def test_notModified():
+    etag = makeETag("abc")
+    lastModified = toHttpDate("2024-05-01 12:00:00")
+    later = toHttpDate("2024-05-02 12:00:00")
+    earlier = toHttpDate("2024-04-30 12:00:00")
+    assert notModified(etag, lastModified, etag, None)
+    assert not notModified(etag, lastModified, '"old"', None)
+    assert notModified(etag, lastModified, None, later)
+    assert not notModified(etag, lastModified, None, earlier)
+    #If-None-Match takes precedence over If-Modified-Since
+    assert not notModified(etag, lastModified, '"old"', later)
+    assert not notModified(etag, lastModified, None, "garbage")
+    assert not notModified(etag, None, None, later)
+
+def test_cacheHeaders():
+    etag = makeETag("abc")
+    headers = cacheHeaders(etag)
+    assert headers == {"ETag": etag, "Cache-Control": "no-cache"}
+    headers = cacheHeaders(etag, "Wed, 01 May 2024 10:00:00 GMT", immutable=True)
+    assert "immutable" in headers["Cache-Control"]
+    assert headers["Last-Modified"] == "Wed, 01 May 2024 10:00:00 GMT"
@@ -0,0 +1,124 @@
+""" Tests of the disk cache of uploaded .pdf files, with the page inventory and thumbnails made by a fake instead of poppler.
+"""
+
+import asyncio
+import io
+import json
+import os
+import threading
+
+import pytest
+from starlette.datastructures import UploadFile
+
+from img2mapAPI.utils.core import pdfCache
+from img2mapAPI.utils.core.pdfCache import PdfCache
+from img2mapAPI.utils.core.taskExecutor import TaskExecutor
+
+class FakeBuild:
+    """Stands in for buildPdfEntry, a file starting with b"%BLOCK" waits for release, a file starting with b"%FAIL" can not be read"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def __call__(self, entryFolder: str, name: str, thumbnailSize: int, threads: int = 1) -> dict:
+        self.calls.append(name)
+        with open(os.path.join(entryFolder, "document.pdf"), 'rb') as pdf:
+            data = pdf.read()
+        if data.startswith(b"%BLOCK"):
+            self.started.set()
+            self.release.wait(5)
+        if data.startswith(b"%FAIL"):
+            raise ValueError("not a .pdf file")
+        with open(os.path.join(entryFolder, "page-1.png"), 'wb') as thumbnail:
+            thumbnail.write(b"png")
+        inventory = {"name": name, "pages": 1, "pageSizes": [[612.0, 792.0]], "thumbnails": 1}
+        with open(os.path.join(entryFolder, "inventory.json"), 'w') as file:
+            json.dump(inventory, file)
+        return inventory
+
+@pytest.fixture
+def build(monkeypatch):
+    fake = FakeBuild()
+    monkeypatch.setattr(pdfCache, "buildPdfEntry", fake)
+    monkeypatch.setattr(TaskExecutor, "_instance", TaskExecutor({"convert": ("thread", 4)}))
+    yield fake
+    fake.release.set()
+    TaskExecutor._instance.shutdown()
+
+def upload(data: bytes, name: str = "map.pdf") -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename=name)
+
+def test_add_hit_and_lookup(build, tmp_path):
+    cache = PdfCache(str(tmp_path))
+    first = asyncio.run(cache.add(upload(b"%PDF one")))
+    second = asyncio.run(cache.add(upload(b"%PDF one", "other.pdf")))
+    assert first == second
+    assert first["pages"] == 1 and first["name"] == "map.pdf"
+    assert build.calls == ["map.pdf"]
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+    handle = first["handle"]
+    assert cache.pdfPath(handle).endswith("document.pdf")
+    assert cache.thumbnailPath(handle, 1) is not None
+    assert cache.thumbnailPath(handle, 2) is None
+    assert cache.inventory("../" + handle) is None
+    assert [name for name in os.listdir(tmp_path) if name.startswith(".upload")] == []
+
+def test_add_does_not_hold_lock_while_building(build, tmp_path):
+    cache = PdfCache(str(tmp_path))
+
+    async def main():
+        slow = asyncio.ensure_future(cache.add(upload(b"%BLOCK slow", "slow.pdf")))
+        same = asyncio.ensure_future(cache.add(upload(b"%BLOCK slow", "again.pdf")))
+        while not build.started.is_set():
+            await asyncio.sleep(0.01)
+        #another file is added while the first one is still being built
+        other = await asyncio.wait_for(cache.add(upload(b"%PDF fast", "fast.pdf")), 2)
+        assert not slow.done() and not same.done()
+        build.release.set()
+        return (await slow, await same, other)
+
+    (slow, same, other) = asyncio.run(main())
+    assert slow == same
+    assert other["name"] == "fast.pdf"
+    assert sorted(build.calls) == ["fast.pdf", "slow.pdf"]
+
+def test_add_failure_removes_entry(build, tmp_path):
+    cache = PdfCache(str(tmp_path))
+    with pytest.raises(ValueError):
+        asyncio.run(cache.add(upload(b"%FAIL")))
+    assert [name for name in os.listdir(tmp_path)] == []
+
+def test_evict_skips_acquired_files(build, tmp_path):
+    cache = PdfCache(str(tmp_path), maxBytes=1)
+
+    async def main():
+        first = await cache.add(upload(b"%PDF first"))
+        assert cache.acquire(first["handle"]) is not None
+        await asyncio.sleep(0.02)
+        second = await cache.add(upload(b"%PDF second"))
+        #the first file is being rendered from, so it is kept above the size limit
+        assert cache.inventory(first["handle"]) is not None
+        cache.release(first["handle"])
+        await asyncio.sleep(0.02)
+        third = await cache.add(upload(b"%PDF third"))
+        return (first, second, third)
+
+    (first, second, third) = asyncio.run(main())
+    assert cache.inventory(first["handle"]) is None
+    assert cache.inventory(second["handle"]) is None
+    assert cache.inventory(third["handle"]) is not None
+    assert cache.stats()["evictions"] == 2
+
+def test_storeRender(build, tmp_path):
+    cache = PdfCache(str(tmp_path))
+    handle = asyncio.run(cache.add(upload(b"%PDF render")))["handle"]
+    image = tmp_path / "image.png"
+    image.write_bytes(b"render")
+    path = asyncio.run(cache.storeRender(handle, 1, "d200", str(image)))
+    assert cache.renderPath(handle, 1, "d200") == path
+    assert cache.renderPath(handle, 1, "d../") is None
+    image.write_bytes(b"render")
+    assert asyncio.run(cache.storeRender("0" * 64, 1, "d200", str(image))) is None
+    assert not image.exists()
@@ -0,0 +1,52 @@
+""" Tests of the point set and the checks of the points used to place an image.
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+from img2mapAPI.utils.models import Point, PointSet
+from img2mapAPI.utils.models.pointList import PointList
+from img2mapAPI.utils.core.georefHelper import checkPoints
+
+ROWS = [(1, 0, 0, 10.0, 60.0, None), (2, 640, 0, 10.1, 60.0, 0.5), (3, 0, 426, 10.0, 59.95, None)]
+
+def test_fromRows():
+    points = PointSet.fromRows(ROWS)
+    assert len(points) == 3
+    assert points.Idproj.tolist() == [1, 2, 3]
+    assert points.pixels().tolist() == [[0, 0], [640, 0], [0, 426]]
+    assert points.coords().tolist() == [[10.0, 60.0], [10.1, 60.0], [10.0, 59.95]]
+    assert np.isnan(points.error[0]) and points.error[1] == 0.5
+    assert points.isValid()
+
+def test_fromRows_empty():
+    points = PointSet.fromRows([])
+    assert len(points) == 0
+    assert points.isValid()
+
+def test_of():
+    objects = [Point(Idproj=index, col=col, row=row, lng=lng, lat=lat) for (index, col, row, lng, lat, _) in ROWS]
+    dicts = [dict(zip(PointSet.columns, row)) for row in ROWS]
+    for points in (PointSet.of(objects), PointSet.of(PointList(points=objects)), PointSet.of(dicts)):
+        assert points.pixels().tolist() == PointSet.fromRows(ROWS).pixels().tolist()
+    same = PointSet.fromRows(ROWS)
+    assert PointSet.of(same) is same
+
+@pytest.mark.parametrize("value", [None, math.nan, math.inf, -math.inf])
+def test_isValid_missing_or_not_finite(value):
+    rows = [list(row) for row in ROWS]
+    rows[1][4] = value
+    assert not PointSet.fromRows(rows).isValid()
+
+def test_checkPoints():
+    assert len(checkPoints(PointSet.fromRows(ROWS))) == 3
+    with pytest.raises(Exception, match="Not enough points"):
+        checkPoints(PointSet.fromRows(ROWS[:2]))
+    with pytest.raises(Exception, match="Idproj"):
+        checkPoints(PointSet.fromRows([(0,) + row[1:] for row in ROWS]))
+    rows = [list(row) for row in ROWS]
+    rows[2][1] = math.nan
+    with pytest.raises(Exception, match="finite"):
+        checkPoints(PointSet.fromRows(rows))
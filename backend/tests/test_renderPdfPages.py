@@ -0,0 +1,70 @@
+""" Tests of rendering several pages of a .pdf file at a time, with pdftoppm replaced by a slow fake render.
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from img2mapAPI.utils.core import ImageHelper
+from img2mapAPI.utils.core.taskExecutor import TaskExecutor
+
+@pytest.fixture
+def fakeRender(monkeypatch):
+    written = []
+    lock = threading.Lock()
+
+    def render(pdfPath, imagePath, page_number, *args):
+        time.sleep(0.2)
+        with open(imagePath, 'wb') as image:
+            image.write(b"page %d" % page_number)
+        with lock:
+            written.append(imagePath)
+
+    monkeypatch.setattr(ImageHelper, "pdfPageToPngFile", render)
+    monkeypatch.setattr(TaskExecutor, "_instance", TaskExecutor({"convert": ("thread", 2)}))
+    yield written
+    TaskExecutor._instance.shutdown()
+
+def test_renderPdfPages_all_pages(fakeRender):
+    async def main():
+        return [result async for result in ImageHelper.renderPdfPages("document.pdf", [1, 2, 3, 4, 5], inFlight=2)]
+
+    results = asyncio.run(main())
+    assert sorted(page for (page, _) in results) == [1, 2, 3, 4, 5]
+    for (page, path) in results:
+        with open(path, 'rb') as image:
+            assert image.read() == b"page %d" % page
+        os.remove(path)
+    assert TaskExecutor.getInstance().stats()["convert"]["maxPending"] <= 2
+
+def test_renderPdfPages_stopped_early_removes_running_pages(fakeRender):
+    async def main():
+        pages = ImageHelper.renderPdfPages("document.pdf", [1, 2, 3, 4, 5, 6], inFlight=3)
+        (page, path) = await pages.__anext__()
+        await pages.aclose()
+        return path
+
+    kept = asyncio.run(main())
+    #the renders that were running when the caller stopped finish writing their files, which are then removed
+    TaskExecutor.getInstance().shutdown()
+    time.sleep(0.05)
+    assert os.path.isfile(kept)
+    assert [path for path in fakeRender if path != kept and os.path.exists(path)] == []
+    os.remove(kept)
+
+def test_renderPdfPage_cancelled_removes_file(fakeRender):
+    async def main():
+        task = asyncio.ensure_future(ImageHelper.renderPdfPage("document.pdf", 1))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    TaskExecutor.getInstance().shutdown()
+    time.sleep(0.05)
+    assert len(fakeRender) == 1
+    assert not os.path.exists(fakeRender[0])
@@ -0,0 +1,81 @@
+""" Tests of the execution layer for blocking work.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from img2mapAPI.utils.core.taskExecutor import TaskExecutor
+
+def _fail(message: str):
+    raise ValueError(message)
+
+def test_run_counts_completed_and_failed_calls():
+    executor = TaskExecutor({"tiles": ("thread", 2)})
+
+    async def main():
+        assert await executor.run("tiles", pow, 2, 10) == 1024
+        with pytest.raises(ValueError):
+            await executor.run("tiles", _fail, "broken")
+
+    try:
+        asyncio.run(main())
+        stats = executor.stats()["tiles"]
+        assert (stats["completed"], stats["failed"]) == (1, 1)
+        assert (stats["running"], stats["queued"]) == (0, 0)
+    finally:
+        executor.shutdown()
+
+def test_run_bounds_concurrency_per_category():
+    executor = TaskExecutor({"georef": ("thread", 2)})
+    release = threading.Event()
+    running = []
+    lock = threading.Lock()
+    peak = [0]
+
+    def work():
+        with lock:
+            running.append(1)
+            peak[0] = max(peak[0], len(running))
+        release.wait(5)
+        with lock:
+            running.pop()
+
+    async def main():
+        calls = [asyncio.ensure_future(executor.run("georef", work)) for _ in range(5)]
+        await asyncio.sleep(0.2)
+        stats = executor.stats()["georef"]
+        assert (stats["running"], stats["queued"]) == (2, 3)
+        release.set()
+        await asyncio.gather(*calls)
+
+    try:
+        asyncio.run(main())
+        assert peak[0] == 2
+        assert executor.stats()["georef"]["maxPending"] == 5
+    finally:
+        executor.shutdown()
+
+def test_unknown_category():
+    executor = TaskExecutor()
+    with pytest.raises(Exception):
+        asyncio.run(executor.run("unknown", pow, 2, 2))
+
+@pytest.mark.parametrize("category", ["tiles", "georef"])
+def test_process_mode_rejected_for_thread_only_categories(category):
+    with pytest.raises(Exception, match="process mode"):
+        TaskExecutor({category: ("process", 2)})
+
+def test_process_mode_convert():
+    executor = TaskExecutor({"convert": ("process", 1)})
+    try:
+        assert asyncio.run(executor.run("convert", pow, 3, 4)) == 81
+    finally:
+        executor.shutdown()
+
+def test_invalid_config():
+    with pytest.raises(Exception):
+        TaskExecutor({"convert": ("fork", 2)})
+    with pytest.raises(Exception):
+        TaskExecutor({"convert": ("thread", 0)})
@@ -0,0 +1,50 @@
+""" Tests of the in-memory LRU cache of rendered map tiles.
+"""
+
+from img2mapAPI.utils.core.tileCache import TileCache
+
+def test_get_and_put():
+    cache = TileCache()
+    assert cache.get(1, "v1", 5, 1, 2) is None
+    cache.put(1, "v1", 5, 1, 2, b"tile")
+    assert cache.get(1, "v1", 5, 1, 2) == b"tile"
+    #a new version of the raster does not see the tiles of the old one
+    assert cache.get(1, "v2", 5, 1, 2) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["tiles"], stats["bytes"]) == (1, 2, 1, 4)
+
+def test_least_recently_used_is_evicted():
+    cache = TileCache(maxBytes=10)
+    cache.put(1, "v1", 5, 0, 0, b"aaaa")
+    cache.put(1, "v1", 5, 0, 1, b"bbbb")
+    cache.get(1, "v1", 5, 0, 0)
+    cache.put(1, "v1", 5, 0, 2, b"cccc")
+    assert cache.get(1, "v1", 5, 0, 1) is None
+    assert cache.get(1, "v1", 5, 0, 0) == b"aaaa"
+    assert cache.get(1, "v1", 5, 0, 2) == b"cccc"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 8
+
+def test_replacing_a_tile_keeps_the_size():
+    cache = TileCache(maxBytes=10)
+    cache.put(1, "v1", 5, 0, 0, b"aaaa")
+    cache.put(1, "v1", 5, 0, 0, b"aaaaaa")
+    assert cache.stats()["bytes"] == 6
+    assert cache.stats()["tiles"] == 1
+
+def test_tile_larger_than_the_cache_is_not_kept():
+    cache = TileCache(maxBytes=4)
+    cache.put(1, "v1", 5, 0, 0, b"aaaaa")
+    assert cache.stats()["tiles"] == 0
+
+def test_invalidate():
+    cache = TileCache()
+    cache.put(1, "v1", 5, 0, 0, b"aa")
+    cache.put(1, "v2", 5, 0, 0, b"bb")
+    cache.put(2, "v1", 5, 0, 0, b"cc")
+    assert cache.invalidate(1) == 2
+    assert cache.invalidate(1) == 0
+    assert cache.get(2, "v1", 5, 0, 0) == b"cc"
+    assert cache.stats()["bytes"] == 2
+    cache.clear()
+    assert cache.stats()["tiles"] == 0 and cache.stats()["bytes"] == 0
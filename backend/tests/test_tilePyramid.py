@@ -0,0 +1,102 @@
+""" Tests of pre-rendering the tile pyramid of a georeferenced image into a tile store.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from img2mapAPI.utils.core import tilePyramid
+from img2mapAPI.utils.core.taskExecutor import TaskExecutor
+
+@pytest.fixture
+def geotiff(tmp_path) -> str:
+    path = str(tmp_path / "map.tiff")
+    data = np.random.default_rng(2).integers(1, 255, (3, 256, 256), dtype=np.uint8)
+    with rasterio.open(path, 'w', driver="GTiff", width=256, height=256, count=3, dtype="uint8", crs="EPSG:4326",
+                       transform=from_origin(10, 60, 0.0004, 0.0002)) as dataset:
+        dataset.write(data)
+    return path
+
+@pytest.fixture
+def executor(monkeypatch):
+    executor = TaskExecutor({"tiles": ("thread", 4)})
+    monkeypatch.setattr(TaskExecutor, "_instance", executor)
+    yield executor
+    executor.shutdown()
+
+def storedTiles(storePath: str) -> dict:
+    conn = sqlite3.connect(storePath)
+    try:
+        tiles = {}
+        for (z, count) in conn.execute("SELECT zoom_level, COUNT(*) FROM tiles GROUP BY zoom_level"):
+            tiles[z] = count
+        return tiles
+    finally:
+        conn.close()
+
+def test_renderPyramid(geotiff, tmp_path, executor):
+    storePath = str(tmp_path / "map.mbtiles")
+    (minzoom, maxzoom) = tilePyramid.getZoomRange(geotiff)
+    tilePyramid.createTileStore(storePath, "v1", minzoom, maxzoom)
+    assert asyncio.run(tilePyramid.renderPyramid(geotiff, storePath, minzoom, maxzoom, threading.Event(), inFlight=2))
+
+    tiles = storedTiles(storePath)
+    assert sorted(tiles) == list(range(minzoom, maxzoom + 1))
+    assert tiles[maxzoom] >= tiles[minzoom]
+    #the tiles are submitted two at a time, next to one write to the store
+    stats = executor.stats()["tiles"]
+    assert stats["maxPending"] <= 3
+    assert stats["failed"] == 0
+    (data, known) = tilePyramid.readTile(storePath, maxzoom, 0, 0)
+    assert data is None and known
+
+def test_renderPyramid_cancelled(geotiff, tmp_path, executor):
+    storePath = str(tmp_path / "map.mbtiles")
+    (minzoom, maxzoom) = tilePyramid.getZoomRange(geotiff)
+    tilePyramid.createTileStore(storePath, "v1", minzoom, maxzoom)
+    cancelEvent = threading.Event()
+    cancelEvent.set()
+    assert not asyncio.run(tilePyramid.renderPyramid(geotiff, storePath, minzoom, maxzoom, cancelEvent))
+    assert storedTiles(storePath) == {}
+    (_, known) = tilePyramid.readTile(storePath, minzoom, 0, 0)
+    assert not known
+
+def test_builder(geotiff, executor):
+    builder = tilePyramid.TilePyramidBuilder(enabled=True, workers=3)
+    with open(geotiff, 'rb') as file:
+        tiffBytes = file.read()
+    finished = []
+
+    async def onDone(projectId, version, storePath):
+        finished.append((projectId, version, storedTiles(storePath)))
+
+    async def main():
+        builder.start(1, "v1", tiffBytes, onDone)
+        while 1 in builder._builds:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert len(finished) == 1 and finished[0][:2] == (1, "v1")
+    assert finished[0][2]
+    assert executor.stats()["tiles"]["maxPending"] <= 3
+
+def test_setLocalStore_removes_the_replaced_store(tmp_path):
+    builder = tilePyramid.TilePyramidBuilder()
+    paths = [str(tmp_path / f"{name}.mbtiles") for name in ("first", "second", "third")]
+    for path in paths:
+        open(path, 'wb').close()
+    builder.setLocalStore(1, "v1", paths[0])
+    builder.setLocalStore(1, "v1", paths[1])
+    assert builder.getLocalStore(1, "v1") == paths[1]
+    assert not os.path.exists(paths[0])
+    #the store of a running build is kept, the copy is removed instead
+    builder._builds[1] = ("v2", threading.Event(), None)
+    builder.setLocalStore(1, "v1", paths[2])
+    assert builder.getLocalStore(1, "v1") == paths[1]
+    assert not os.path.exists(paths[2])
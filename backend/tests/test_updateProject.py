@@ -0,0 +1,48 @@
+""" Tests of updating a project, with the project record kept in memory.
+"""
+
+import asyncio
+
+from img2mapAPI.utils.projectHandler import ProjectHandler, fileFields
+from img2mapAPI.utils.models import Project
+
+class MemoryStorage:
+    # the part of StorageHandler updating a project uses
+    def __init__(self, project: dict):
+        self.project = project
+
+    async def fetchOne(self, id: int, table: str):
+        return dict(self.project)
+
+    async def update(self, id: int, data, table: str):
+        self.project = dict(data)
+
+def storedProject() -> dict:
+    project = dict(Project(name="old", crs="EPSG:4326"))
+    project.update({
+        "id": 1,
+        "imageFilePath": "image.png",
+        "imageHash": "imagehash",
+        "georeferencedFilePath": "georef.tiff",
+        "georeferencedHash": "georefhash",
+        "mercatorFilePath": "mercator.tiff",
+        "tilesFilePath": "tiles.mbtiles",
+        "rasterInfo": "{}",
+    })
+    return project
+
+def test_update_keeps_the_files():
+    storage = MemoryStorage(storedProject())
+    handler = ProjectHandler(None, storage)
+    #a rename from the frontend only sends the name, the other fields are their defaults
+    assert asyncio.run(handler.updateProject(1, Project(name="new")))
+    assert storage.project["name"] == "new"
+    for field in fileFields:
+        assert storage.project[field] == storedProject()[field], field
+
+def test_update_withFiles():
+    storage = MemoryStorage(storedProject())
+    handler = ProjectHandler(None, storage)
+    project = Project.model_construct(None, **{**storedProject(), "tilesFilePath": "other.mbtiles"})
+    assert asyncio.run(handler.updateProject(1, project, withFiles=True))
+    assert storage.project["tilesFilePath"] == "other.mbtiles"
@@ -0,0 +1,35 @@
+""" Tests of streaming files into a .zip file.
+"""
+
+import asyncio
+import io
+import os
+import zipfile
+
+from img2mapAPI.utils.core.FileHelper import zipStream
+
+def test_round_trip(tmp_path):
+    contents = {"1.png": os.urandom(5000), "2.png": b"", "3.png": os.urandom(100)}
+    paths = {}
+    for (name, data) in contents.items():
+        paths[name] = str(tmp_path / name)
+        with open(paths[name], 'wb') as file:
+            file.write(data)
+
+    async def files():
+        for name in contents:
+            yield (paths[name], name)
+
+    async def collect():
+        return [chunk async for chunk in zipStream(files(), chunkSize=1024)]
+
+    chunks = asyncio.run(collect())
+    #the .zip file is streamed in chunks, not in one piece
+    assert len([chunk for chunk in chunks if chunk]) > 1
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == list(contents)
+        for (name, data) in contents.items():
+            assert archive.read(name) == data
+    #each file is removed once it is in the .zip file
+    assert not any(os.path.exists(path) for path in paths.values())